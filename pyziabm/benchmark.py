@@ -0,0 +1,243 @@
+import argparse
+import functools
+import itertools
+import json
+import os
+import platform
+import shutil
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+
+from pyziabm.orderbook3 import Order, Orderbook
+from pyziabm.storage import open_store
+
+MID = 1000000
+TICK = 5
+
+
+def _path_size(path):
+    '''Bytes in a file or, for a directory, in all of its files'''
+    if os.path.isfile(path):
+        return os.path.getsize(path)
+    return sum(os.path.getsize(os.path.join(d, f)) for d, _, files in os.walk(path) for f in files)
+
+def _order_chunks(rows, chunk, seed=1):
+    '''order_history-like ColumnBuffers of chunk rows each'''
+    prng = np.random.RandomState(seed)
+    history = Orderbook().order_history
+    exid = 0
+    while exid < rows:
+        n = min(chunk, rows - exid)
+        traders = prng.randint(0, 90, n)
+        types = np.where(prng.rand(n) < 0.45, 'cancel', 'add')
+        sides = np.where(prng.rand(n) < 0.5, 'buy', 'sell')
+        prices = 1000000 + 5*prng.randint(-200, 200, n)
+        for i in range(n):
+            exid += 1
+            history.append_row('p%d_%d' % (traders[i], exid), exid//10, types[i], 1, sides[i], prices[i], exid)
+        yield history.detach()
+
+def storage_benchmark(rows=200000, chunk=20000, storages=('h5', 'parquet', 'arrow', 'npy')):
+    '''
+    Write rows of order_history-like data in chunks (as the Runner does every 2000 steps) to each
+    storage backend, then read the table back.
+
+    Returns a DataFrame with, for each backend: write seconds, rows written per second, read seconds
+    and bytes on disk. Backends whose optional dependency (pyarrow) is missing are skipped.
+    '''
+    chunks = list(_order_chunks(rows, chunk))
+    results = []
+    tempdir = tempfile.mkdtemp()
+    try:
+        for storage in storages:
+            path = os.path.join(tempdir, storage)
+            try:
+                store = open_store(path, storage)
+            except ImportError:
+                continue
+            start = time.perf_counter()
+            for rows_chunk in chunks:
+                store.append('orders', rows_chunk, min_itemsize={'order_id': 12})
+            store.close()
+            write_time = time.perf_counter() - start
+            start = time.perf_counter()
+            read_rows = len(store.read('orders'))
+            read_time = time.perf_counter() - start
+            results.append({'storage': storage, 'rows': read_rows, 'write_s': write_time,
+                            'rows_per_s': read_rows/write_time, 'read_s': read_time, 'bytes': _path_size(path)})
+    finally:
+        shutil.rmtree(tempdir)
+    return pd.DataFrame(results).set_index('storage')
+
+def _synthetic_book(levels, queue, ladder, ids):
+    '''
+    An Orderbook with levels prices on each side of MID, TICK apart, and queue orders of quantity 2
+    at each price; returns the Orderbook and a list of its resting Orders
+    '''
+    book = Orderbook(tick=TICK if ladder else None)
+    resting = []
+    for level in range(1, levels+1):
+        for side, price in (('buy', MID - level*TICK), ('sell', MID + level*TICK)):
+            for _ in range(queue):
+                order = Order('t1_%d' % next(ids), 0, 'add', 2, side, price)
+                book.add_order_to_book(order)
+                resting.append(order)
+    return book, resting
+
+def _replace(book, resting, r, ids):
+    '''Put a new order of quantity 2 at the price of resting[r], which has left the book'''
+    order = resting[r]
+    resting[r] = Order('t1_%d' % next(ids), 0, 'add', 2, order.side, order.price)
+    book.add_order_to_book(resting[r])
+
+def _bench_add_order_to_book(book, resting, ids, prng, ops, levels):
+    latencies = np.empty(ops, dtype=np.int64)
+    picks = prng.randint(0, len(resting), ops)
+    for i in range(ops):
+        order = Order('t1_%d' % next(ids), 1, 'add', 2, resting[picks[i]].side, resting[picks[i]].price)
+        start = time.perf_counter_ns()
+        book.add_order_to_book(order)
+        latencies[i] = time.perf_counter_ns() - start
+    return latencies
+
+def _bench_add(book, resting, ids, prng, ops, levels):
+    latencies = np.empty(ops, dtype=np.int64)
+    picks = prng.randint(0, len(resting), ops)
+    for i in range(ops):
+        order = Order('t1_%d' % next(ids), 1, 'add', 2, resting[picks[i]].side, resting[picks[i]].price)
+        start = time.perf_counter_ns()
+        book.process_order(order)
+        latencies[i] = time.perf_counter_ns() - start
+    return latencies
+
+def _bench_cancel(book, resting, ids, prng, ops, levels):
+    latencies = np.empty(ops, dtype=np.int64)
+    picks = prng.randint(0, len(resting), ops)
+    for i in range(ops):
+        order = resting[picks[i]]
+        cancel = Order(order.order_id, 1, 'cancel', order.quantity, order.side, order.price)
+        start = time.perf_counter_ns()
+        book.process_order(cancel)
+        latencies[i] = time.perf_counter_ns() - start
+        _replace(book, resting, picks[i], ids)
+    return latencies
+
+def _bench_modify(book, resting, ids, prng, ops, levels):
+    latencies = np.empty(ops, dtype=np.int64)
+    picks = prng.randint(0, len(resting), ops)
+    for i in range(ops):
+        order = resting[picks[i]]
+        modify = Order(order.order_id, 1, 'modify', 1, order.side, order.price)
+        start = time.perf_counter_ns()
+        book.process_order(modify)
+        latencies[i] = time.perf_counter_ns() - start
+        book.process_order(Order(order.order_id, 1, 'cancel', 1, order.side, order.price))
+        _replace(book, resting, picks[i], ids)
+    return latencies
+
+def _bench_sweep(book, resting, ids, prng, ops, levels, order_type='add'):
+    '''A buy (limit or market) which takes out the best levels ask prices; the levels are refilled between sweeps'''
+    latencies = np.empty(ops, dtype=np.int64)
+    asks = [order for order in resting if order.side == 'sell' and order.price <= MID + levels*TICK]
+    quantity = 2*len(asks)
+    for i in range(ops):
+        order = Order('t2_%d' % next(ids), 1, order_type, quantity, 'buy', MID + levels*TICK)
+        start = time.perf_counter_ns()
+        book.process_order(order)
+        latencies[i] = time.perf_counter_ns() - start
+        for ask in asks:
+            book.add_order_to_book(Order('t1_%d' % next(ids), 0, 'add', 2, 'sell', ask.price))
+    return latencies
+
+# name: (benchmark, levels swept)
+ORDERBOOK_CASES = {'add_order_to_book': (_bench_add_order_to_book, 0), 'add': (_bench_add, 0),
+                   'cancel': (_bench_cancel, 0), 'modify': (_bench_modify, 0),
+                   'sweep_1': (_bench_sweep, 1), 'sweep_10': (_bench_sweep, 10), 'sweep_100': (_bench_sweep, 100),
+                   'market_1': (functools.partial(_bench_sweep, order_type='market'), 1),
+                   'market_10': (functools.partial(_bench_sweep, order_type='market'), 10),
+                   'market_100': (functools.partial(_bench_sweep, order_type='market'), 100)}
+
+def _summary(latencies):
+    p50, p90, p99 = np.percentile(latencies, [50, 90, 99]) / 1000
+    return {'ops': len(latencies), 'ops_per_s': len(latencies) / (latencies.sum() / 1e9),
+            'mean_us': latencies.mean() / 1000, 'p50_us': p50, 'p90_us': p90, 'p99_us': p99}
+
+def orderbook_benchmark(ops=20000, books=((10, 1), (100, 1), (100, 10)), ladders=(False, True),
+                        cases=tuple(ORDERBOOK_CASES), seed=1):
+    '''
+    Time the Orderbook on synthetic books: for each price index (PriceList or, with ladder, PriceLadder)
+    and each (levels, queue) book shape, run each case on a new book.
+
+    add_order_to_book and add (process_order) add orders at the resting prices; cancel and modify
+    (process_order) hit random resting orders, which are replaced untimed so the book keeps its shape;
+    sweep_n (process_order, _match_trade) and market_n (a market order, _match_market) take out the best
+    n ask levels, which are refilled untimed.
+    Sweeps run ops/(n*queue) times (at least 20) and are skipped when the book has fewer than n levels.
+    Returns a dict of '<list|ladder>/<levels>x<queue>/<case>': ops, ops_per_s and the mean and
+    50/90/99th percentile latencies in microseconds.
+    '''
+    results = {}
+    for ladder in ladders:
+        for levels, queue in books:
+            for case in cases:
+                bench, swept = ORDERBOOK_CASES[case]
+                if swept > levels:
+                    continue
+                ids = itertools.count(1)
+                prng = np.random.RandomState(seed)
+                book, resting = _synthetic_book(levels, queue, ladder, ids)
+                n = max(ops // (swept*queue), 20) if swept else ops
+                name = '{0}/{1}x{2}/{3}'.format('ladder' if ladder else 'list', levels, queue, case)
+                results[name] = _summary(bench(book, resting, ids, prng, n, swept))
+    return results
+
+def save_results(results, filename):
+    '''Save orderbook_benchmark() results as JSON, with the Python and NumPy versions'''
+    with open(filename, 'w') as f:
+        json.dump({'python': platform.python_version(), 'numpy': np.__version__, 'results': results}, f,
+                  indent=1, sort_keys=True)
+
+def load_results(filename):
+    '''The results saved by save_results()'''
+    with open(filename) as f:
+        return json.load(f)['results']
+
+def compare_results(results, baseline):
+    '''
+    Compare results with baseline results (a dict or a JSON file from save_results()): a DataFrame with
+    the ops_per_s and p99_us of each, and speedup (ops_per_s / baseline ops_per_s) for each case in both
+    '''
+    if isinstance(baseline, str):
+        baseline = load_results(baseline)
+    cases = [case for case in results if case in baseline]
+    compared = pd.DataFrame({'baseline_ops_per_s': [baseline[case]['ops_per_s'] for case in cases],
+                             'ops_per_s': [results[case]['ops_per_s'] for case in cases],
+                             'baseline_p99_us': [baseline[case]['p99_us'] for case in cases],
+                             'p99_us': [results[case]['p99_us'] for case in cases]}, index=cases)
+    compared['speedup'] = compared.ops_per_s / compared.baseline_ops_per_s
+    return compared
+
+
+if __name__ == '__main__':
+
+    # python -m pyziabm.benchmark orderbook [--ops N] [--out results.json] [--baseline baseline.json]
+    # python -m pyziabm.benchmark storage
+    parser = argparse.ArgumentParser(description='pyziabm benchmarks')
+    parser.add_argument('suite', choices=['orderbook', 'storage'])
+    parser.add_argument('--ops', type=int, default=20000)
+    parser.add_argument('--out')
+    parser.add_argument('--baseline')
+    args = parser.parse_args()
+    if args.suite == 'storage':
+        print(storage_benchmark())
+    else:
+        results = orderbook_benchmark(ops=args.ops)
+        with pd.option_context('display.max_rows', None, 'display.max_columns', None, 'display.width', 120):
+            print(pd.DataFrame(results).T.round(2))
+            if args.out:
+                save_results(results, args.out)
+            if args.baseline:
+                print(compare_results(results, args.baseline).round(2))
@@ -0,0 +1,140 @@
+import copy
+
+import numpy as np
+import pandas as pd
+
+
+class ColumnBuffer(object):
+    '''
+    ColumnBuffer collects rows (messages, trades, quotes) in typed NumPy column arrays.
+
+    Each column is a preallocated array; appending a row writes one value into each array.
+    When the current block is full, it is set aside and a new block is allocated, so the
+    buffer grows in blocks without copying. clear() keeps a single block as large as the last
+    fill, so in steady state the rows between flushes sit in one contiguous block and
+    to_frame() hands slices of the arrays to pandas with no per-row work.
+    Rows can be read back by position as dicts, like the lists of dicts ColumnBuffer replaces.
+    Public attributes: names and dtypes (the column NumPy dtypes, in column order)
+    Public methods: append(), append_row(), column(), to_frame(), clear() and detach()
+    '''
+
+    def __init__(self, columns, block_size=8192):
+        '''
+        Initialize the ColumnBuffer with one empty block
+
+        columns is a sequence of (name, dtype) pairs in column order; strings and
+        other Python objects use dtype object.
+        '''
+        self.names = tuple(name for name, _ in columns)
+        self.dtypes = tuple(np.dtype(dtype) for _, dtype in columns)
+        self._block_size = block_size
+        self._blocks = []
+        self._new_block(block_size)
+
+    def __repr__(self):
+        return 'ColumnBuffer({0}, {1} rows)'.format(self.names, len(self))
+
+    def __len__(self):
+        return sum(len(block[0]) for block in self._blocks) + self._pos
+
+    def __getitem__(self, idx):
+        '''Row idx as a dict'''
+        n = len(self)
+        if idx < 0:
+            idx += n
+        if not 0 <= idx < n:
+            raise IndexError('ColumnBuffer index out of range')
+        for block in self._blocks:
+            if idx < len(block[0]):
+                break
+            idx -= len(block[0])
+        else:
+            block = self._columns
+        return {name: column.item(idx) for name, column in zip(self.names, block)}
+
+    def __iter__(self):
+        for idx in range(len(self)):
+            yield self[idx]
+
+    def _new_block(self, size):
+        self._columns = tuple(np.empty(size, dtype) for dtype in self.dtypes)
+        self._capacity = size
+        self._pos = 0
+
+    def append_row(self, *values):
+        '''Write one row, values in column order'''
+        pos = self._pos
+        if pos == self._capacity:
+            self._blocks.append(self._columns)
+            self._new_block(self._block_size)
+            pos = 0
+        for column, value in zip(self._columns, values):
+            column[pos] = value
+        self._pos = pos + 1
+
+    def append(self, row):
+        '''Write one row from a dict (or any record that can be read by key)'''
+        self.append_row(*[row[name] for name in self.names])
+
+    def column(self, name):
+        '''The filled part of one column as a single array'''
+        idx = self.names.index(name)
+        current = self._columns[idx][:self._pos]
+        if not self._blocks:
+            return current
+        return np.concatenate([block[idx] for block in self._blocks] + [current])
+
+    def to_frame(self):
+        '''The rows as a DataFrame with columns in column order; a single block is not copied,
+        so write or copy the frame before the buffer is cleared and refilled'''
+        return pd.DataFrame({name: self.column(name) for name in self.names}, columns=list(self.names), copy=False)
+
+    def clear(self):
+        '''Drop all rows; keep one block large enough for the rows just dropped'''
+        if self._blocks:
+            size = len(self)
+            self._blocks = []
+            self._new_block(size)
+        else:
+            self._pos = 0
+
+    def detach(self):
+        '''
+        Move the rows to a new ColumnBuffer and leave this one empty, with a block as large as
+        the rows moved, so the rows can be written elsewhere while appends continue here.
+        '''
+        rows = copy.copy(self)
+        self._blocks = []
+        self._new_block(len(rows) if rows._blocks else self._capacity)
+        return rows
+
+
+class SpillBuffer(ColumnBuffer):
+    '''
+    SpillBuffer is a ColumnBuffer with a memory cap: it holds at most max_rows rows.
+
+    Rows fill one segment of max_rows rows; when the segment is full, spill() is called and must
+    write the rows out and empty the buffer (clear() or detach()). After clear() the segment's
+    arrays are reused, so the rows held never take more than one segment however many rows
+    arrive between flushes; after detach() a new segment is allocated and the full one is freed
+    once it is written.
+    Public attributes: names, max_rows, spills
+    Public methods: as ColumnBuffer
+    '''
+
+    def __init__(self, columns, max_rows, spill):
+        '''spills counts the times the segment filled'''
+        ColumnBuffer.__init__(self, columns, block_size=max_rows)
+        self.max_rows = max_rows
+        self.spills = 0
+        self._spill = spill
+
+    def append_row(self, *values):
+        '''Write one row, values in column order; spill the segment once it is full'''
+        pos = self._pos
+        for column, value in zip(self._columns, values):
+            column[pos] = value
+        self._pos = pos + 1
+        if self._pos == self._capacity:
+            self.spills += 1
+            self._spill()
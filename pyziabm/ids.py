@@ -0,0 +1,44 @@
+import numpy as np
+import pandas as pd
+
+# Interned order ids: the owner (a dense trader number) sits in the high bits
+# and the trader's quote sequence in the low bits.
+OWNER_SHIFT = 32
+SEQUENCE_MASK = (1 << OWNER_SHIFT) - 1
+
+
+def make_order_id(owner, sequence):
+    '''Pack an integer owner and quote sequence into one integer order id'''
+    return (owner << OWNER_SHIFT) | sequence
+
+def owner_of(order_id):
+    '''Owner (trader number) of an integer order id'''
+    return order_id >> OWNER_SHIFT
+
+def owner_of_str(order_id):
+    '''Owner (trader id) of a string order id, e.g. 't3' from 't3_17' '''
+    return order_id.partition('_')[0]
+
+def sequence_of(order_id):
+    '''Quote sequence of an integer order id'''
+    return order_id & SEQUENCE_MASK
+
+def sequence_of_str(order_id):
+    '''Quote sequence of a string order id, e.g. 17 from 't3_17'; 0 if it is not a number'''
+    sequence = order_id.rpartition('_')[2]
+    return int(sequence) if sequence.isdigit() else 0
+
+def order_id_to_str(order_id, trader_names):
+    '''Rebuild the string order id from an integer order id'''
+    return '%s_%d' % (trader_names[order_id >> OWNER_SHIFT], order_id & SEQUENCE_MASK)
+
+def decode_order_ids(order_ids, trader_names):
+    '''Rebuild string order ids from an array or Series of integer order ids'''
+    ids = np.asarray(order_ids, dtype=np.int64)
+    names = np.asarray(trader_names, dtype=object)[ids >> OWNER_SHIFT]
+    return pd.Series(names + '_' + (ids & SEQUENCE_MASK).astype(str).astype(object), index=getattr(order_ids, 'index', None))
+
+def decode_owners(order_ids, trader_names):
+    '''Trader ids (strings) from an array or Series of integer order ids'''
+    ids = np.asarray(order_ids, dtype=np.int64)
+    return pd.Series(np.asarray(trader_names, dtype=object)[ids >> OWNER_SHIFT], index=getattr(order_ids, 'index', None))
@@ -0,0 +1,163 @@
+import time
+from collections import Counter
+
+import numpy as np
+import pandas as pd
+
+from pyziabm.buffers import ColumnBuffer
+from pyziabm.orderbook3 import Order
+
+
+class Instruments(object):
+    '''
+    Instruments counts and times the work an Orderbook does, by the trader type of each message.
+
+    Instruments is opt-in: enable() wraps the Orderbook's order processing methods on the instance
+    and disable() removes the wrappers, so an Orderbook without Instruments pays nothing.
+    Counted: messages by trader type, type and side; sweeps (adds which trade) with the fills and
+    price levels walked; cancels and modifies which miss (the order already filled or cancelled);
+    every sample_every-th message is timed into a log2 latency histogram per operation;
+    every depth_every messages the book depth (levels and size per side) is sampled.
+    Fills and levels are read from the trade confirmations, so they need Orderbook(record=True).
+    Public attributes: orderbook, messages, sweeps, levels_walked, cancel_misses, latency and depth
+    Public methods: enable(), disable(), report()
+    '''
+
+    def __init__(self, orderbook, trader_type=None, sample_every=16, depth_every=1000):
+        '''
+        trader_type maps an order's owner (from its order_id) to a trader type; by default each
+        trader is its own type.
+
+        messages counts (trader_type, type, side); sweeps counts (trader_type, 'sweeps'|'fills'|'levels');
+        levels_walked counts (trader_type, levels) per sweep; cancel_misses counts trader_type;
+        latency holds a histogram per (operation, trader_type): bucket b counts times in [2**(b-1), 2**b) ns;
+        depth is a ColumnBuffer of depth samples
+        '''
+        self.orderbook = orderbook
+        self._trader_type = trader_type if trader_type is not None else (lambda owner: owner)
+        self._types = {}
+        self.sample_every = sample_every
+        self.depth_every = depth_every
+        self.messages = Counter()
+        self.sweeps = Counter()
+        self.levels_walked = Counter()
+        self.cancel_misses = Counter()
+        self.latency = {}
+        self.depth = ColumnBuffer((('message', np.int64), ('bid_levels', np.int64), ('ask_levels', np.int64),
+                                   ('total_bid_size', np.int64), ('total_ask_size', np.int64)), block_size=1024)
+        self._count = 0
+        self._process_order = orderbook._process_order
+        self._mass_cancel = orderbook.mass_cancel
+        self.enable()
+
+    def enable(self):
+        '''Wrap the Orderbook's _process_order() (used by process_order() and process_orders()) and mass_cancel()'''
+        self.orderbook._process_order = self._instrumented_process_order
+        self.orderbook.mass_cancel = self._instrumented_mass_cancel
+
+    def disable(self):
+        '''Remove the wrappers; the counts are kept'''
+        del self.orderbook._process_order
+        del self.orderbook.mass_cancel
+
+    def _type_of(self, owner):
+        trader_type = self._types.get(owner)
+        if trader_type is None:
+            trader_type = self._types[owner] = self._trader_type(owner)
+        return trader_type
+
+    def _time(self, operation, trader_type, elapsed):
+        histogram = self.latency.get((operation, trader_type))
+        if histogram is None:
+            histogram = self.latency[(operation, trader_type)] = np.zeros(64, dtype=np.int64)
+        histogram[elapsed.bit_length()] += 1
+
+    def _tick(self):
+        '''Count a message; True if this message is timed'''
+        self._count += 1
+        return not self._count % self.sample_every
+
+    def _sample_depth(self):
+        '''Every depth_every messages, add the price levels and size on each side to depth'''
+        if not self._count % self.depth_every:
+            book = self.orderbook
+            self.depth.append_row(self._count, len(book._bid_book_prices), len(book._ask_book_prices),
+                                  book.total_bid_size, book.total_ask_size)
+
+    def _instrumented_process_order(self, order):
+        book = self.orderbook
+        if isinstance(order, dict):
+            order = Order.from_dict(order)
+        trader_type = self._type_of(book._owner_of(order.order_id))
+        self.messages[(trader_type, order.type, order.side)] += 1
+        if order.type in ('cancel', 'modify'):
+            book_orders = book._bid_orders if order.side == 'buy' else book._ask_orders
+            if order.order_id not in book_orders:
+                self.cancel_misses[trader_type] += 1
+        trades = book.confirm_trade_collector
+        before = len(trades)
+        if self._tick():
+            start = time.perf_counter_ns()
+            self._process_order(order)
+            elapsed = time.perf_counter_ns() - start
+        else:
+            self._process_order(order)
+            elapsed = None
+        fills = len(trades) - before
+        if fills:
+            levels = len({trade['price'] for trade in trades[before:]})
+            self.sweeps[(trader_type, 'sweeps')] += 1
+            self.sweeps[(trader_type, 'fills')] += fills
+            self.sweeps[(trader_type, 'levels')] += levels
+            self.levels_walked[(trader_type, levels)] += 1
+        if elapsed is not None:
+            self._time('trade' if fills else order.type, trader_type, elapsed)
+        self._sample_depth()
+
+    def _instrumented_mass_cancel(self, timestamp, trader, order_ids=None):
+        book = self.orderbook
+        trader_type = self._type_of(trader)
+        bids, asks = len(book._bid_orders), len(book._ask_orders)
+        if self._tick():
+            start = time.perf_counter_ns()
+            confirms = self._mass_cancel(timestamp, trader, order_ids)
+            self._time('mass_cancel', trader_type, time.perf_counter_ns() - start)
+        else:
+            confirms = self._mass_cancel(timestamp, trader, order_ids)
+        cancelled_bids, cancelled_asks = bids - len(book._bid_orders), asks - len(book._ask_orders)
+        self.messages[(trader_type, 'cancel', 'buy')] += cancelled_bids
+        self.messages[(trader_type, 'cancel', 'sell')] += cancelled_asks
+        if order_ids is not None:
+            self.cancel_misses[trader_type] += len(order_ids) - cancelled_bids - cancelled_asks
+        self._sample_depth()
+        return confirms
+
+    def _latency_frame(self):
+        rows = []
+        upper = 2.0**np.arange(64) / 1000
+        for (operation, trader_type), histogram in sorted(self.latency.items(), key=lambda item: str(item[0])):
+            cumulative = histogram.cumsum()
+            samples = cumulative[-1]
+            p50, p90, p99 = (upper[np.searchsorted(cumulative, q*samples)] for q in (0.5, 0.9, 0.99))
+            rows.append({'operation': operation, 'trader_type': trader_type, 'samples': samples,
+                         'p50_us': p50, 'p90_us': p90, 'p99_us': p99, 'max_us': upper[np.flatnonzero(histogram)[-1]]})
+        return pd.DataFrame(rows, columns=['operation', 'trader_type', 'samples', 'p50_us', 'p90_us', 'p99_us',
+                                           'max_us'])
+
+    def report(self):
+        '''
+        The counts as DataFrames: messages (by trader_type, type and side), sweeps (sweeps, fills and levels
+        by trader_type), levels_walked (sweeps by trader_type and levels), cancel_misses, latency (histogram
+        percentiles, upper bucket bounds in microseconds) and depth
+        '''
+        messages = pd.DataFrame([(t, m, s, n) for (t, m, s), n in self.messages.items()],
+                                columns=['trader_type', 'type', 'side', 'messages'])
+        trader_types = sorted({t for t, _ in self.sweeps}, key=str)
+        sweeps = pd.DataFrame({'trader_type': trader_types}, columns=['trader_type', 'sweeps', 'fills', 'levels'])
+        for count in ['sweeps', 'fills', 'levels']:
+            sweeps[count] = [self.sweeps[(t, count)] for t in trader_types]
+        levels_walked = pd.DataFrame([(t, l, n) for (t, l), n in sorted(self.levels_walked.items(), key=str)],
+                                     columns=['trader_type', 'levels', 'sweeps'])
+        misses = pd.DataFrame(list(self.cancel_misses.items()), columns=['trader_type', 'cancel_misses'])
+        return {'messages': messages, 'sweeps': sweeps, 'levels_walked': levels_walked, 'cancel_misses': misses,
+                'latency': self._latency_frame(), 'depth': self.depth.to_frame()}
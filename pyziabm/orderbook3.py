@@ -1,5 +1,260 @@
 import bisect
-import pandas as pd
+import io
+import numpy as np
+
+from pyziabm.buffers import ColumnBuffer, SpillBuffer
+from pyziabm.ids import owner_of, owner_of_str
+from pyziabm.storage import as_store
+
+SNAPSHOT_VERSION = 1
+
+
+class PriceList(list):
+    '''
+    PriceList is the default price index for one side of the Orderbook: a sorted list of prices.
+
+    Public methods: add(), lowest(), highest(), remove_lowest(), remove_highest() and the list methods
+    '''
+
+    def add(self, price):
+        '''Use insort to keep the prices sorted.'''
+        bisect.insort(self, price)
+
+    def remove_lowest(self, n):
+        '''Remove the n lowest prices'''
+        del self[:n]
+
+    def remove_highest(self, n):
+        '''Remove the n highest prices'''
+        del self[len(self)-n:]
+
+    def lowest(self, n):
+        '''Up to n prices, lowest first'''
+        return self[:n]
+
+    def highest(self, n):
+        '''Up to n prices, highest first'''
+        return self[:-n-1:-1]
+
+
+class PriceLadder(object):
+    '''
+    PriceLadder is a tick-indexed price index for one side of the Orderbook.
+
+    Each price maps to a slot in a bytearray: slot = (price - base)/tick; occupied slots are 1.
+    The lowest and highest occupied slots are tracked incrementally, so membership, [0] and [-1]
+    are O(1) and removing the lowest or highest price only scans the gap to the next occupied slot.
+    If a price falls outside the ladder, the ladder recenters (and grows if necessary).
+    PriceLadder supports the part of the list interface Orderbook uses: add(), remove(), in,
+    len(), indexing and iteration in ascending (or, reversed, descending) price order.
+    Public methods: add(), remove(), lowest(), highest(), remove_lowest(), remove_highest()
+    '''
+
+    def __init__(self, tick, capacity=4096):
+        '''
+        Initialize the PriceLadder with an empty set of slots
+
+        tick is the minimum price increment (the run's mpi); prices must be on the tick grid.
+        _base is the price at slot 0 - it is set by the first add().
+        _low and _high are the lowest and highest occupied slots (-1 when empty).
+        '''
+        self._tick = tick
+        self._slots = bytearray(capacity)
+        self._base = None
+        self._low = -1
+        self._high = -1
+        self._count = 0
+
+    def __repr__(self):
+        return 'PriceLadder({0}, {1})'.format(self._tick, list(self))
+
+    def __len__(self):
+        return self._count
+
+    def __contains__(self, price):
+        if self._base is None:
+            return False
+        slot, off_tick = divmod(price - self._base, self._tick)
+        return not off_tick and 0 <= slot < len(self._slots) and self._slots[slot] == 1
+
+    def __iter__(self):
+        slot = self._low
+        while slot != -1:
+            yield self._base + slot*self._tick
+            slot = self._slots.find(1, slot+1, self._high+1)
+
+    def __reversed__(self):
+        slot = self._high
+        while slot != -1:
+            yield self._base + slot*self._tick
+            slot = self._slots.rfind(1, self._low, slot)
+
+    def __getitem__(self, idx):
+        if self._count:
+            if idx == 0:
+                return self._base + self._low*self._tick
+            if idx == -1:
+                return self._base + self._high*self._tick
+        return list(self)[idx]
+
+    def _slot(self, price):
+        '''Map price to a slot; recenter the ladder if price is out of range.'''
+        if self._base is None:
+            self._base = price - (len(self._slots)//2)*self._tick
+        slot, off_tick = divmod(price - self._base, self._tick)
+        if off_tick:
+            raise ValueError('Price {0} is not on the tick grid ({1})'.format(price, self._tick))
+        if slot < 0 or slot >= len(self._slots):
+            self._recenter(price)
+            slot = (price - self._base)//self._tick
+        return slot
+
+    def _recenter(self, price):
+        '''Center the occupied prices and price in a new (larger if necessary) set of slots.'''
+        tick = self._tick
+        if self._count:
+            low_price = min(price, self._base + self._low*tick)
+            high_price = max(price, self._base + self._high*tick)
+        else:
+            low_price = high_price = price
+        needed = (high_price - low_price)//tick + 1
+        capacity = len(self._slots)
+        while capacity < 2*needed:
+            capacity *= 2
+        new_base = low_price - ((capacity - needed)//2)*tick
+        new_slots = bytearray(capacity)
+        if self._count:
+            shift = (self._base - new_base)//tick
+            new_slots[self._low+shift:self._high+shift+1] = self._slots[self._low:self._high+1]
+            self._low += shift
+            self._high += shift
+        self._slots = new_slots
+        self._base = new_base
+
+    def add(self, price):
+        '''Occupy the slot for price; update the lowest and highest slots.'''
+        slot = self._slot(price)
+        if self._slots[slot]:
+            return
+        self._slots[slot] = 1
+        self._count += 1
+        if self._count == 1:
+            self._low = self._high = slot
+        elif slot < self._low:
+            self._low = slot
+        elif slot > self._high:
+            self._high = slot
+
+    def remove(self, price):
+        '''Free the slot for price; if it was the lowest or highest slot, find the next one.'''
+        if price not in self:
+            raise ValueError('PriceLadder.remove(price): price not in ladder')
+        slot = (price - self._base)//self._tick
+        self._slots[slot] = 0
+        self._count -= 1
+        if not self._count:
+            self._low = self._high = -1
+        elif slot == self._low:
+            self._low = self._slots.find(1, slot+1, self._high+1)
+        elif slot == self._high:
+            self._high = self._slots.rfind(1, self._low, slot)
+
+    def lowest(self, n):
+        '''Up to n prices, lowest first'''
+        prices = []
+        slot = self._low
+        while slot != -1 and len(prices) < n:
+            prices.append(self._base + slot*self._tick)
+            slot = self._slots.find(1, slot+1, self._high+1)
+        return prices
+
+    def highest(self, n):
+        '''Up to n prices, highest first'''
+        prices = []
+        slot = self._high
+        while slot != -1 and len(prices) < n:
+            prices.append(self._base + slot*self._tick)
+            slot = self._slots.rfind(1, self._low, slot)
+        return prices
+
+    def remove_lowest(self, n):
+        '''Free the n lowest slots in one pass'''
+        slot = self._low
+        for _ in range(n):
+            self._slots[slot] = 0
+            slot = self._slots.find(1, slot+1, self._high+1)
+        self._count -= n
+        self._low = slot
+        if not self._count:
+            self._high = -1
+
+    def remove_highest(self, n):
+        '''Free the n highest slots in one pass'''
+        slot = self._high
+        for _ in range(n):
+            self._slots[slot] = 0
+            slot = self._slots.rfind(1, self._low, slot)
+        self._count -= n
+        self._high = slot
+        if not self._count:
+            self._low = -1
+
+
+class Order(object):
+    '''
+    Order is the compact record for one message (add, market, cancel or modify) sent to the exchange.
+    
+    The trader creates the Order once; the Orderbook rests, indexes and records the same object
+    and the trader tracks it in its local_book.
+    quantity is the quantity when the message was sent; leaves is the quantity still resting,
+    which only the Orderbook changes (0 once the order is filled or cancelled).
+    prev and next link a resting Order into the FIFO queue at its price level;
+    exid is set when the Orderbook adds the Order to order_history.
+    owner is the trader, and on_fill and on_cancel are the owner's subscribed handlers, set when the Order rests.
+    Orders can be read by key (order['price']) like the dict messages they replace.
+    '''
+    __slots__ = ('order_id', 'timestamp', 'type', 'quantity', 'side', 'price', 'leaves', 'exid', 'prev', 'next',
+                 'owner', 'on_fill', 'on_cancel')
+    
+    def __init__(self, order_id, timestamp, type, quantity, side, price, exid=None):
+        self.order_id = order_id
+        self.timestamp = timestamp
+        self.type = type
+        self.quantity = quantity
+        self.side = side
+        self.price = price
+        self.leaves = quantity
+        self.exid = exid
+        self.prev = None
+        self.next = None
+        self.owner = None
+        self.on_fill = None
+        self.on_cancel = None
+        
+    def __repr__(self):
+        return 'Order({0}, {1}, {2}, {3}, {4}, {5})'.format(self.order_id, self.timestamp, self.type, self.quantity,
+                                                           self.side, self.price)
+    
+    def __getitem__(self, key):
+        try:
+            return getattr(self, key)
+        except AttributeError:
+            raise KeyError(key)
+        
+    @classmethod
+    def from_dict(cls, order):
+        '''Make an Order from a dict message'''
+        return cls(order['order_id'], order['timestamp'], order['type'], order['quantity'], order['side'],
+                   order['price'], order.get('exid'))
+    
+    def as_dict(self):
+        '''The message as a dict; exid is included once the Order is in the order_history'''
+        order = {'order_id': self.order_id, 'timestamp': self.timestamp, 'type': self.type,
+                 'quantity': self.quantity, 'side': self.side, 'price': self.price}
+        if self.exid is not None:
+            order['exid'] = self.exid
+        return order
+
 
 class Orderbook(object):
     '''
@@ -11,229 +266,795 @@ class Orderbook(object):
     one dictionary contains trades matched with orders on the book.
     Orderbook also provides methods for storing and retrieving orders and maintaining a 
     history of the book.
+    Orders are Order records; dict messages are converted to Orders on arrival.
+    The best bid and ask (prices and sizes) are kept up to date as orders are added, cancelled and
+    matched; bbo_seq counts changes to the inside and the SIP history only records changes.
+    The total resting size on each side and the best depth_levels price levels on each side, with their
+    sizes and cumulative sizes, are kept as orders arrive; depth() reads them and record_depth() samples
+    them into a depth history.
+    order_history, trade_book and the top-of-book history are ColumnBuffers: typed columns
+    which are written to h5 without building dicts.
+    With record=False (for replays) incoming orders, trades and confirmations are not recorded;
+    the book, the inside and the side totals are kept as usual.
+    spill_order_history() caps the rows order_history holds: full segments are written out as they fill
+    and order_history_chunks() reads the written and held rows back as one sequence.
+    snapshot() saves the book as bytes and restore() rebuilds it in an empty Orderbook (warm starts).
+    mass_cancel() cancels many (or all) of a trader's orders in one pass.
+    Market orders (type 'market') sweep the opposite side whole price levels at a time; they never rest
+    and their price is recorded but not used.
+    subscribe() registers a trader's fill and cancel handlers: they are looked up once when an order
+    rests and called with each confirmation as the book changes, so the confirm collectors need not be polled.
     Public attributes: order_history, confirm_modify_collector, confirm_trade_collector,
-    trade_book and traded.
-    Public methods: add_order_to_book(), process_order(), order_history_to_h5(), trade_book_to_h5(),
-    sip_to_h5() and report_top_of_book()
+    trade_book, traded, best_bid, bid_size, best_ask, ask_size, bbo_seq, total_bid_size, total_ask_size
+    and record.
+    Public methods: add_order_to_book(), process_order(), process_orders(), order_history_to_h5(),
+    spill_order_history(), order_history_chunks(), trade_book_to_h5(), sip_to_h5(), report_top_of_book(), depth(), record_depth(), depth_to_h5(),
+    snapshot(), restore(), mass_cancel() and subscribe()
     '''
     
-    def __init__(self):
+    def __init__(self, tick=None, interned=False, depth_levels=5, record=True):
         '''
         Initialize the Orderbook with a set of empty lists and dicts and other defaults
         
-        order_history is a list of all incoming orders (dicts) in the order received
+        order_history is a ColumnBuffer of all incoming orders in the order received
         _bid_book_prices and _ask_book_prices are linked (sorted) lists of bid and ask prices
-        which serve as pointers to:
-        _bid_book and _ask_book: dicts of current order book state and OrderedDicts of orders
-        the OrderedDicts maintain time priority for each order at a given price.
+        (PriceList) or, if tick is given, tick-indexed PriceLadders which serve as pointers to:
+        _bid_book and _ask_book: dicts of current order book state with the head and tail of a
+        doubly-linked list of Orders - the linked lists maintain time priority for each order at a given price.
+        _bid_orders and _ask_orders index the resting Orders by order_id, so cancels, modifies and fills
+        find and unlink an order in constant time; _owner_orders indexes the resting order_ids (both sides,
+        in time order) by owner, so mass_cancel() finds all of a trader's orders without scanning the book.
         confirm_modify_collector and confirm_trade_collector are lists that carry information (dicts) from the
         order processor and/or matching engine to the traders
-        trade_book is a list if trades in sequence
+        trade_book is a ColumnBuffer of trades in sequence; _sip_collector is a ColumnBuffer of
+        top-of-book reports
         _order_index identifies the sequence of orders in event time
+        _owner_of recovers the trader from an order_id: string ids ('t3_17') or, if interned,
+        integer ids with the trader number in the high bits
+        best_bid, bid_size, best_ask and ask_size are the inside (None and 0 for an empty side);
+        bbo_seq increments each time the inside changes. _sip_seq and _sip_last are the bbo_seq and
+        inside at the last SIP row
+        total_bid_size and total_ask_size are the resting size on each side;
+        _bid_depth and _ask_depth are the best depth_levels price levels on each side, best first, as
+        [price, size, cumulative size] lists;
+        _depth_collector is a ColumnBuffer of depth snapshots, depth_levels price levels per side
+        _record: if False, orders still get an exid but nothing is added to order_history, trade_book
+        or the confirm collectors; it is fixed when the Orderbook is made (read it as record)
+        _subscribers maps an owner to its (on_fill, on_cancel) handlers
         '''
-        self.order_history = []
+        id_dtype = np.int64 if interned else object
+        self.order_history = ColumnBuffer((('order_id', id_dtype), ('timestamp', np.int64), ('type', object),
+                                           ('quantity', np.int64), ('side', object), ('price', np.int64),
+                                           ('exid', np.int64)))
         self._bid_book = {}
-        self._bid_book_prices = []
         self._ask_book = {}
-        self._ask_book_prices = []
+        self._bid_orders = {}
+        self._ask_orders = {}
+        self._owner_orders = {}
+        if tick is None:
+            self._bid_book_prices = PriceList()
+            self._ask_book_prices = PriceList()
+        else:
+            self._bid_book_prices = PriceLadder(tick)
+            self._ask_book_prices = PriceLadder(tick)
         self.confirm_modify_collector = []
         self.confirm_trade_collector = []
-        self._sip_collector = []
-        self.trade_book = []
+        self._sip_collector = ColumnBuffer((('timestamp', np.int64), ('best_bid', np.int64), ('best_ask', np.int64),
+                                            ('bid_size', np.int64), ('ask_size', np.int64)))
+        self.trade_book = ColumnBuffer((('resting_order_id', id_dtype), ('resting_timestamp', np.int64),
+                                        ('incoming_order_id', id_dtype), ('timestamp', np.int64), ('price', np.int64),
+                                        ('quantity', np.int64), ('side', object)))
         self._order_index = 0
         self.traded = False
+        self._owner_of = owner_of if interned else owner_of_str
+        self.best_bid = None
+        self.bid_size = 0
+        self.best_ask = None
+        self.ask_size = 0
+        self.bbo_seq = 0
+        self._sip_seq = -1
+        self._sip_last = None
+        self.total_bid_size = 0
+        self.total_ask_size = 0
+        self._depth_levels = depth_levels
+        self._bid_depth = []
+        self._ask_depth = []
+        depth_columns = [('timestamp', np.int64), ('total_bid_size', np.int64), ('total_ask_size', np.int64)]
+        for level in range(1, depth_levels+1):
+            depth_columns.extend([('bid_price_%d' % level, np.int64), ('bid_size_%d' % level, np.int64),
+                                  ('ask_price_%d' % level, np.int64), ('ask_size_%d' % level, np.int64)])
+        self._depth_collector = ColumnBuffer(depth_columns, block_size=1024)
+        self._record = record
+        self._subscribers = {}
+        if not record:
+            self._add_order_to_history = self._number_order
+            self._add_trade_to_book = self._confirm_trade = self._confirm_modify = self._skip
+
+    @property
+    def record(self):
+        '''Whether orders, trades and confirmations are recorded; set when the Orderbook is made'''
+        return self._record
+
+    def subscribe(self, owner, on_fill=None, on_cancel=None):
+        '''
+        Register owner's handlers: on_fill(confirm) for each fill of a resting order and on_cancel(confirm)
+        when a resting order is cancelled (cancel message or mass_cancel()), with the confirmation dicts
+        added to the collectors. Handlers are called once the book reflects the fill or cancel.
+
+        Handlers are resolved when an order rests, so subscribe before the owner's orders arrive;
+        subscribe(owner) removes the handlers for later orders. Needs record=True.
+        '''
+        if not self._record:
+            raise ValueError('Orderbook.subscribe() needs record=True')
+        if on_fill is None and on_cancel is None:
+            self._subscribers.pop(owner, None)
+        else:
+            self._subscribers[owner] = (on_fill, on_cancel)
+
+    def _number_order(self, order):
+        '''Give an order (Order) an exid without adding it to order_history'''
+        self._order_index += 1
+        order.exid = self._order_index
+
+    def _skip(self, *args):
+        pass
 
     def _add_order_to_history(self, order):
-        '''Add an order (dict) to order_history'''
-        hist_order = {'order_id': order['order_id'], 'timestamp': order['timestamp'], 'type': order['type'], 
-                      'quantity': order['quantity'], 'side': order['side'], 'price': order['price']}
+        '''Add an order (Order) to order_history'''
+        if isinstance(order, dict):
+            order = Order.from_dict(order)
         self._order_index += 1
-        hist_order['exid'] = self._order_index
-        self.order_history.append(hist_order)
+        order.exid = self._order_index
+        self.order_history.append_row(order.order_id, order.timestamp, order.type, order.quantity, order.side,
+                                      order.price, order.exid)
     
     def add_order_to_book(self, order):
         '''
-        Use insort to maintain on ordered list of prices which serve as pointers
-        to the orders.
+        Add the price to the price index when the level is empty; the prices serve as pointers
+        to the orders. Emptied price levels are reused.
         '''
-        book_order = {'order_id': order['order_id'], 'timestamp': order['timestamp'], 'type': order['type'], 
-                      'quantity': order['quantity'], 'side': order['side'], 'price': order['price']}
-        if order['side'] == 'buy':
+        if isinstance(order, dict):
+            order = Order.from_dict(order)
+        if order.side == 'buy':
             book_prices = self._bid_book_prices
             book = self._bid_book
+            book_orders = self._bid_orders
         else:
             book_prices = self._ask_book_prices
-            book = self._ask_book 
-        if order['price'] in book_prices:
-            book[order['price']]['num_orders'] += 1
-            book[order['price']]['size'] += order['quantity']
-            book[order['price']]['order_ids'].append(order['order_id'])
-            book[order['price']]['orders'][order['order_id']] = book_order
-        else:
-            bisect.insort(book_prices, order['price'])
-            book[order['price']] = {'num_orders': 1, 'size': order['quantity'], 'order_ids': [order['order_id']],
-                                    'orders': {order['order_id']: book_order}}
+            book = self._ask_book
+            book_orders = self._ask_orders
+        level = book.get(order.price)
+        if level is None:
+            level = book[order.price] = {'num_orders': 0, 'size': 0, 'head': None, 'tail': None}
+        if not level['num_orders']:
+            book_prices.add(order.price)
+        book_orders[order.order_id] = order
+        order.owner = owner = self._owner_of(order.order_id)
+        owner_orders = self._owner_orders.get(owner)
+        if owner_orders is None:
+            owner_orders = self._owner_orders[owner] = {}
+        owner_orders[order.order_id] = None
+        if self._subscribers:
+            order.on_fill, order.on_cancel = self._subscribers.get(owner, (None, None))
+        tail = level['tail']
+        if tail is None:
+            level['head'] = order
+        else:
+            tail.next = order
+            order.prev = tail
+        level['tail'] = order
+        level['num_orders'] += 1
+        level['size'] += order.leaves
+        self._depth_changed(order.side, order.price, order.leaves)
+        if order.side == 'buy':
+            self.total_bid_size += order.leaves
+            if order.price == book_prices[-1]:
+                self._update_bid()
+        else:
+            self.total_ask_size += order.leaves
+            if order.price == book_prices[0]:
+                self._update_ask()
             
     def _remove_order(self, order_side, order_price, order_id):
-        '''Pop the order_id; if  order_id exists, updates the book.'''
+        '''Pop the order_id; if  order_id exists, unlink the Order and update the book.'''
         if order_side == 'buy':
             book_prices = self._bid_book_prices
             book = self._bid_book
+            book_orders = self._bid_orders
         else:
             book_prices = self._ask_book_prices
             book = self._ask_book
-        is_order = book[order_price]['orders'].pop(order_id, None)
-        if is_order:
-            book[order_price]['num_orders'] -= 1
-            book[order_price]['size'] -= is_order['quantity']
-            book[order_price]['order_ids'].remove(is_order['order_id'])
-            if book[order_price]['num_orders'] == 0:
-                book_prices.remove(order_price)
+            book_orders = self._ask_orders
+        order = book_orders.pop(order_id, None)
+        if order:
+            del self._owner_orders[order.owner][order_id]
+            self._unlink(order, book, book_prices)
+            self._depth_changed(order_side, order_price, -order.leaves)
+            if order_side == 'buy':
+                self.total_bid_size -= order.leaves
+                if order_price >= self.best_bid:
+                    self._update_bid()
+            else:
+                self.total_ask_size -= order.leaves
+                if order_price <= self.best_ask:
+                    self._update_ask()
+            order.leaves = 0
                     
+    def _unlink(self, order, book, book_prices):
+        '''Unlink a resting Order from its price level; drop the price from the index if the level empties.'''
+        level = book[order.price]
+        if order.prev is None:
+            level['head'] = order.next
+        else:
+            order.prev.next = order.next
+        if order.next is None:
+            level['tail'] = order.prev
+        else:
+            order.next.prev = order.prev
+        order.prev = order.next = None
+        level['num_orders'] -= 1
+        level['size'] -= order.leaves
+        if level['num_orders'] == 0:
+            book_prices.remove(order.price)
+
+    def mass_cancel(self, timestamp, trader, order_ids=None):
+        '''
+        Cancel trader's order_ids or, if order_ids is None, all of trader's resting orders, in one pass.
+        All of a trader's orders are read from the owner index, oldest first, not found by scanning the book.
+
+        order_ids owned by another trader are skipped: a trader only cancels its own orders. Each cancelled
+        order gets a cancel row (quantity: its leaves) in order_history, as a cancel message would.
+        order_ids which are not resting (filled or already cancelled) are skipped silently:
+        unlike a cancel message, which is recorded whether or not it finds its order, they get no
+        order_history row, so cancel counts and cancelled volume read from order_history are lower than
+        with one cancel message per order. The inside is refreshed once.
+        Returns a copy of the cancel confirmations in confirm_modify_collector, which later orders leave alone;
+        with record=False there are none and cancel handlers are not called, as for other messages.
+        '''
+        bid_orders = self._bid_orders
+        ask_orders = self._ask_orders
+        owner_orders = self._owner_orders.get(trader, {})
+        if order_ids is None:
+            order_ids = list(owner_orders)
+        else:
+            owner = self._owner_of
+            order_ids = [order_id for order_id in order_ids if owner(order_id) == trader]
+        record = self._record
+        confirms = self.confirm_modify_collector
+        confirms.clear()
+        self.confirm_trade_collector.clear()
+        self.traded = False
+        bid_changed = ask_changed = bid_cancelled = ask_cancelled = False
+        for order_id in order_ids:
+            order = bid_orders.pop(order_id, None)
+            if order is not None:
+                del owner_orders[order_id]
+                self._unlink(order, self._bid_book, self._bid_book_prices)
+                bid_cancelled = True
+                self.total_bid_size -= order.leaves
+                bid_changed = bid_changed or order.price >= self.best_bid
+            else:
+                order = ask_orders.pop(order_id, None)
+                if order is None:
+                    continue
+                del owner_orders[order_id]
+                self._unlink(order, self._ask_book, self._ask_book_prices)
+                ask_cancelled = True
+                self.total_ask_size -= order.leaves
+                ask_changed = ask_changed or order.price <= self.best_ask
+            self._order_index += 1
+            leaves = order.leaves
+            order.leaves = 0
+            if record:
+                self.order_history.append_row(order_id, timestamp, 'cancel', leaves, order.side, order.price,
+                                              self._order_index)
+                confirm = {'timestamp': timestamp, 'trader': trader, 'order_id': order_id,
+                           'quantity': leaves, 'side': order.side}
+                confirms.append(confirm)
+                if order.on_cancel is not None:
+                    order.on_cancel(confirm)
+        if bid_changed:
+            self._update_bid()
+        if ask_changed:
+            self._update_ask()
+        if bid_cancelled:
+            self._refill_depth('buy')
+        if ask_cancelled:
+            self._refill_depth('sell')
+        return list(confirms)
+            
     def _modify_order(self, order_side, order_quantity, order_id, order_price):
         '''Modify order quantity; if quantity is 0, removes the order.'''
-        book = self._bid_book if order_side == 'buy' else self._ask_book        
-        if order_quantity < book[order_price]['orders'][order_id]['quantity']:
+        book_orders = self._bid_orders if order_side == 'buy' else self._ask_orders
+        book_order = book_orders[order_id]
+        if order_quantity < book_order.leaves:
+            book = self._bid_book if order_side == 'buy' else self._ask_book
             book[order_price]['size'] -= order_quantity
-            book[order_price]['orders'][order_id]['quantity'] -= order_quantity
+            book_order.leaves -= order_quantity
+            self._depth_changed(order_side, order_price, -order_quantity)
+            if order_side == 'buy':
+                self.total_bid_size -= order_quantity
+                if order_price == self.best_bid:
+                    self._update_bid()
+            else:
+                self.total_ask_size -= order_quantity
+                if order_price == self.best_ask:
+                    self._update_ask()
         else:
             self._remove_order(order_side, order_price, order_id)
             
+    def _update_bid(self):
+        '''Refresh the best bid and its size; count a change to the inside.'''
+        if self._bid_book_prices:
+            price = self._bid_book_prices[-1]
+            size = self._bid_book[price]['size']
+        else:
+            price, size = None, 0
+        if price != self.best_bid or size != self.bid_size:
+            self.best_bid = price
+            self.bid_size = size
+            self.bbo_seq += 1
+            
+    def _update_ask(self):
+        '''Refresh the best ask and its size; count a change to the inside.'''
+        if self._ask_book_prices:
+            price = self._ask_book_prices[0]
+            size = self._ask_book[price]['size']
+        else:
+            price, size = None, 0
+        if price != self.best_ask or size != self.ask_size:
+            self.best_ask = price
+            self.ask_size = size
+            self.bbo_seq += 1
+            
+    def _depth_changed(self, side, price, delta):
+        '''
+        Keep the depth view on side current after the size at price changed by delta: a level in view
+        changes its size and the cumulative sizes from it on; a level entering or leaving the view
+        refills the view from the price index. Levels behind a full view are ignored.
+        '''
+        depth = self._bid_depth if side == 'buy' else self._ask_depth
+        if len(depth) == self._depth_levels and (not depth or (price < depth[-1][0] if side == 'buy'
+                                                                 else price > depth[-1][0])):
+            return
+        for i, level in enumerate(depth):
+            if level[0] == price:
+                if level[1] + delta:
+                    level[1] += delta
+                    for behind in depth[i:]:
+                        behind[2] += delta
+                    return
+                break
+        self._refill_depth(side)
+
+    def _refill_depth(self, side):
+        '''Rebuild the depth view on side from the price index'''
+        if side == 'buy':
+            self._bid_depth = self._levels(self._bid_book_prices.highest(self._depth_levels), self._bid_book)
+        else:
+            self._ask_depth = self._levels(self._ask_book_prices.lowest(self._depth_levels), self._ask_book)
+
+    def _levels(self, prices, book):
+        '''[price, size, cumulative size] for each of prices'''
+        levels = []
+        cumulative = 0
+        for price in prices:
+            size = book[price]['size']
+            cumulative += size
+            levels.append([price, size, cumulative])
+        return levels
+
     def _add_trade_to_book(self, resting_order_id, resting_timestamp, incoming_order_id, timestamp, price, quantity, side):
-        '''Add trades (dicts) to the trade_book list.'''
-        self.trade_book.append({'resting_order_id': resting_order_id, 'resting_timestamp': resting_timestamp, 
-                                'incoming_order_id': incoming_order_id, 'timestamp': timestamp, 'price': price,
-                                'quantity': quantity, 'side': side})
+        '''Add trades to the trade_book.'''
+        self.trade_book.append_row(resting_order_id, resting_timestamp, incoming_order_id, timestamp, price,
+                                   quantity, side)
 
     def _confirm_trade(self, timestamp, order_side, order_quantity, order_id, order_price):
-        '''Add trade confirmation to confirm_trade_collector list.'''
-        trader = order_id.partition('_')[0]
-        self.confirm_trade_collector.append({'timestamp': timestamp, 'trader': trader, 'order_id': order_id, 
-                                             'quantity': order_quantity, 'side': order_side, 'price': order_price})
+        '''Add trade confirmation to confirm_trade_collector list; return it.'''
+        trader = self._owner_of(order_id)
+        confirm = {'timestamp': timestamp, 'trader': trader, 'order_id': order_id, 'quantity': order_quantity,
+                   'side': order_side, 'price': order_price}
+        self.confirm_trade_collector.append(confirm)
+        return confirm
     
     def _confirm_modify(self, timestamp, order_side, order_quantity, order_id):
-        '''Add modify confirmation to confirm_modify_collector list.'''
-        trader = order_id.partition('_')[0]
-        self.confirm_modify_collector.append({'timestamp': timestamp, 'trader': trader, 'order_id': order_id, 
-                                              'quantity': order_quantity, 'side': order_side})
+        '''Add modify confirmation to confirm_modify_collector list; return it.'''
+        trader = self._owner_of(order_id)
+        confirm = {'timestamp': timestamp, 'trader': trader, 'order_id': order_id, 'quantity': order_quantity,
+                   'side': order_side}
+        self.confirm_modify_collector.append(confirm)
+        return confirm
                   
     def process_order(self, order):
-        '''Check for a trade (match); if so call _match_trade, otherwise modify book(s).'''
+        '''
+        Check for a trade (match); if so call _match_trade, otherwise modify book(s).
+
+        The collectors are cleared and reused for each order; process_orders() and mass_cancel()
+        hand out copies, so confirmations returned earlier are left as they were.
+        '''
         self.confirm_modify_collector.clear()
+        self.confirm_trade_collector.clear()
+        self.traded = False
+        self._process_order(order)
+        
+    def process_orders(self, orders):
+        '''
+        Process a batch of orders in sequence with the same semantics as process_order().
+        
+        orders is a sequence of Orders (or dicts) or a structured array with the Order fields.
+        The collectors are cleared once for the batch; returns copies of the trade and modify
+        (cancel) confirmations for the whole batch as (confirm_trade_collector, confirm_modify_collector),
+        which later orders leave alone. traded is True if any order in the batch traded.
+        '''
+        if isinstance(orders, np.ndarray) and orders.dtype.names:
+            names = orders.dtype.names
+            orders = [Order.from_dict(dict(zip(names, row.item()))) for row in orders]
+        self.confirm_modify_collector.clear()
+        self.confirm_trade_collector.clear()
         self.traded = False
+        process_order = self._process_order
+        for order in orders:
+            process_order(order)
+        return list(self.confirm_trade_collector), list(self.confirm_modify_collector)
+                  
+    def _process_order(self, order):
+        '''Add the order to order_history, then match it or modify the book(s).'''
+        if isinstance(order, dict):
+            order = Order.from_dict(order)
         self._add_order_to_history(order)
-        if order['type'] == 'add':
-            if order['side'] == 'buy':
-                if order['price'] >= self._ask_book_prices[0]:
+        if order.type == 'market':
+            self._match_market(order)
+        elif order.type == 'add':
+            if order.side == 'buy':
+                if self._ask_book_prices and order.price >= self._ask_book_prices[0]:
                     self._match_trade(order)
                 else:
                     self.add_order_to_book(order)
-            else: #order['side'] == 'sell'
-                if order['price'] <= self._bid_book_prices[-1]:
+            else: #order.side == 'sell'
+                if self._bid_book_prices and order.price <= self._bid_book_prices[-1]:
                     self._match_trade(order)
                 else:
                     self.add_order_to_book(order)
         else:
-            book_prices = self._bid_book_prices if order['side'] == 'buy' else self._ask_book_prices
-            if order['price'] in book_prices:
-                book = self._bid_book if order['side'] == 'buy' else self._ask_book
-                if order['order_id'] in book[order['price']]['orders']:
-                    self._confirm_modify(order['timestamp'], order['side'], order['quantity'], order['order_id'])
-                    if order['type'] == 'cancel':
-                        self._remove_order(order['side'], order['price'], order['order_id'])
-                    else: #order['type'] == 'modify'
-                        self._modify_order(order['side'], order['quantity'], order['order_id'], order['price'])
+            book_orders = self._bid_orders if order.side == 'buy' else self._ask_orders
+            book_order = book_orders.get(order.order_id)
+            if book_order:
+                if book_order.price == order.price:
+                    confirm = self._confirm_modify(order.timestamp, order.side, order.quantity, order.order_id)
+                    if order.type == 'cancel':
+                        self._remove_order(order.side, order.price, order.order_id)
+                        if book_order.on_cancel is not None:
+                            book_order.on_cancel(confirm)
+                    else: #order.type == 'modify'
+                        self._modify_order(order.side, order.quantity, order.order_id, order.price)
     
     def _match_trade(self, order):
         '''Match orders to generate trades, update books.'''
         self.traded = True
-        self.confirm_trade_collector.clear()
-        if order['side'] == 'buy':
+        if order.side == 'buy':
             book_prices = self._ask_book_prices
             book = self._ask_book
-            remainder = order['quantity']
+            remainder = order.leaves
             while remainder > 0:
                 if book_prices:
                     price = book_prices[0]
-                    if order['price'] >= price:
-                        book_order_id = book[price]['order_ids'][0]
-                        book_order = book[price]['orders'][book_order_id]
-                        if remainder >= book_order['quantity']:
-                            self._confirm_trade(order['timestamp'], book_order['side'], book_order['quantity'], book_order['order_id'], book_order['price'])
-                            self._add_trade_to_book(book_order['order_id'], book_order['timestamp'], order['order_id'], order['timestamp'], book_order['price'], 
-                                                    book_order['quantity'], order['side'])
-                            self._remove_order(book_order['side'], book_order['price'], book_order['order_id'])
-                            remainder -= book_order['quantity']
+                    if order.price >= price:
+                        book_order = book[price]['head']
+                        if remainder >= book_order.leaves:
+                            confirm = self._confirm_trade(order.timestamp, book_order.side, book_order.leaves, book_order.order_id, book_order.price)
+                            self._add_trade_to_book(book_order.order_id, book_order.timestamp, order.order_id, order.timestamp, book_order.price, 
+                                                    book_order.leaves, order.side)
+                            remainder -= book_order.leaves
+                            self._remove_order(book_order.side, book_order.price, book_order.order_id)
+                            if book_order.on_fill is not None:
+                                book_order.on_fill(confirm)
                         else:
-                            self._confirm_trade(order['timestamp'], book_order['side'], remainder, book_order['order_id'], book_order['price'])
-                            self._add_trade_to_book(book_order['order_id'], book_order['timestamp'], order['order_id'], order['timestamp'], book_order['price'],
-                                                    remainder, order['side'])
-                            self._modify_order(book_order['side'], remainder, book_order['order_id'], book_order['price'])
+                            confirm = self._confirm_trade(order.timestamp, book_order.side, remainder, book_order.order_id, book_order.price)
+                            self._add_trade_to_book(book_order.order_id, book_order.timestamp, order.order_id, order.timestamp, book_order.price,
+                                                    remainder, order.side)
+                            self._modify_order(book_order.side, remainder, book_order.order_id, book_order.price)
+                            if book_order.on_fill is not None:
+                                book_order.on_fill(confirm)
+                            remainder = 0
                             break
                     else:
-                        order['quantity'] = remainder
+                        order.leaves = remainder
                         self.add_order_to_book(order)
                         break
                 else:
                     print('Ask Market Collapse with order {0}'.format(order))
                     break
-        else: #order['side'] =='sell'
+        else: #order.side =='sell'
             book_prices = self._bid_book_prices
             book = self._bid_book
-            remainder = order['quantity']
+            remainder = order.leaves
             while remainder > 0:
                 if book_prices:
                     price = book_prices[-1]
-                    if order['price'] <= price:
-                        book_order_id = book[price]['order_ids'][0]
-                        book_order = book[price]['orders'][book_order_id] 
-                        if remainder >= book_order['quantity']:
-                            self._confirm_trade(order['timestamp'], book_order['side'], book_order['quantity'], book_order['order_id'], book_order['price'])
-                            self._add_trade_to_book(book_order['order_id'], book_order['timestamp'], order['order_id'], order['timestamp'], book_order['price'],
-                                                    book_order['quantity'], order['side'])
-                            self._remove_order(book_order['side'], book_order['price'], book_order['order_id'])
-                            remainder -= book_order['quantity']
+                    if order.price <= price:
+                        book_order = book[price]['head']
+                        if remainder >= book_order.leaves:
+                            confirm = self._confirm_trade(order.timestamp, book_order.side, book_order.leaves, book_order.order_id, book_order.price)
+                            self._add_trade_to_book(book_order.order_id, book_order.timestamp, order.order_id, order.timestamp, book_order.price,
+                                                    book_order.leaves, order.side)
+                            remainder -= book_order.leaves
+                            self._remove_order(book_order.side, book_order.price, book_order.order_id)
+                            if book_order.on_fill is not None:
+                                book_order.on_fill(confirm)
                         else:
-                            self._confirm_trade(order['timestamp'], book_order['side'], remainder, book_order['order_id'], book_order['price'])
-                            self._add_trade_to_book(book_order['order_id'], book_order['timestamp'], order['order_id'], order['timestamp'], book_order['price'],
-                                                    remainder, order['side'])
-                            self._modify_order(book_order['side'], remainder, book_order['order_id'], book_order['price'])
+                            confirm = self._confirm_trade(order.timestamp, book_order.side, remainder, book_order.order_id, book_order.price)
+                            self._add_trade_to_book(book_order.order_id, book_order.timestamp, order.order_id, order.timestamp, book_order.price,
+                                                    remainder, order.side)
+                            self._modify_order(book_order.side, remainder, book_order.order_id, book_order.price)
+                            if book_order.on_fill is not None:
+                                book_order.on_fill(confirm)
+                            remainder = 0
                             break
                     else:
-                        order['quantity'] = remainder
+                        order.leaves = remainder
                         self.add_order_to_book(order)
                         break
                 else:
                     print('Bid Market Collapse with order {0}'.format(order))
                     break
+        # what did not fill: 0 once the order has filled completely, whether it rests or not
+        order.leaves = remainder
+        
+    def _match_market(self, order):
+        '''
+        Sweep a market order through the opposite side: whole price levels fill in bulk, exhausted levels
+        leave the price index together and the fills are confirmed (and delivered to subscribers) as one batch.
+        '''
+        if order.side == 'buy':
+            book_prices = self._ask_book_prices
+            book = self._ask_book
+            book_orders = self._ask_orders
+            prices = iter(book_prices)
+        else:
+            book_prices = self._bid_book_prices
+            book = self._bid_book
+            book_orders = self._bid_orders
+            prices = reversed(book_prices)
+        owner_orders = self._owner_orders
+        record = self._record
+        fills = []
+        handlers = []
+        owner_of = self._owner_of
+        trade_book = self.trade_book
+        timestamp = order.timestamp
+        def fill(resting, quantity, price):
+            if record:
+                confirm = {'timestamp': timestamp, 'trader': owner_of(resting.order_id), 'order_id': resting.order_id,
+                           'quantity': quantity, 'side': resting.side, 'price': price}
+                fills.append(confirm)
+                if resting.on_fill is not None:
+                    handlers.append((resting.on_fill, confirm))
+                trade_book.append_row(resting.order_id, resting.timestamp, order.order_id, timestamp, price, quantity,
+                                      order.side)
+        remainder = order.leaves
+        exhausted = 0
+        for price in prices:
+            level = book[price]
+            resting = level['head']
+            if remainder >= level['size']:
+                while resting is not None:
+                    fill(resting, resting.leaves, price)
+                    del book_orders[resting.order_id]
+                    del owner_orders[resting.owner][resting.order_id]
+                    resting.leaves = 0
+                    next_order = resting.next
+                    resting.prev = resting.next = None
+                    resting = next_order
+                remainder -= level['size']
+                level['head'] = level['tail'] = None
+                level['num_orders'] = level['size'] = 0
+                exhausted += 1
+                if not remainder:
+                    break
+            else:
+                while remainder >= resting.leaves:
+                    fill(resting, resting.leaves, price)
+                    del book_orders[resting.order_id]
+                    del owner_orders[resting.owner][resting.order_id]
+                    remainder -= resting.leaves
+                    level['num_orders'] -= 1
+                    level['size'] -= resting.leaves
+                    resting.leaves = 0
+                    next_order = resting.next
+                    resting.prev = resting.next = None
+                    resting = next_order
+                level['head'] = resting
+                resting.prev = None
+                if remainder:
+                    fill(resting, remainder, price)
+                    resting.leaves -= remainder
+                    level['size'] -= remainder
+                    remainder = 0
+                break
+        if exhausted:
+            if order.side == 'buy':
+                book_prices.remove_lowest(exhausted)
+            else:
+                book_prices.remove_highest(exhausted)
+        filled = order.leaves - remainder
+        if filled:
+            self.traded = True
+            if order.side == 'buy':
+                self.total_ask_size -= filled
+                self._update_ask()
+                self._refill_depth('sell')
+            else:
+                self.total_bid_size -= filled
+                self._update_bid()
+                self._refill_depth('buy')
+            self.confirm_trade_collector.extend(fills)
+            for on_fill, confirm in handlers:
+                on_fill(confirm)
+        order.leaves = remainder
+        if remainder:
+            print('{0} Market Collapse with order {1}'.format('Ask' if order.side == 'buy' else 'Bid', order))
         
-    def order_history_to_h5(self, filename):
+    def _to_h5(self, rows, filename, key, writer, **kwargs):
+        '''
+        Append a ColumnBuffer to an h5 file (or a storage backend) and clear it; with a writer (H5Writer),
+        swap in an empty buffer and hand the rows to the writer thread.
+        '''
+        if writer is None:
+            as_store(filename).append(key, rows, **kwargs)
+            rows.clear()
+        else:
+            writer.put(filename, key, rows.detach(), **kwargs)
+        
+    def order_history_to_h5(self, filename, writer=None):
         '''Append order history to an h5 file, clear the order_history'''
-        temp_df = pd.DataFrame(self.order_history)
-        temp_df.to_hdf(filename, 'orders', append=True, format='table', complevel=5, complib='blosc', 
-                       min_itemsize={'order_id': 12}) 
-        self.order_history.clear()
+        self._to_h5(self.order_history, filename, 'orders', writer, min_itemsize={'order_id': 12})
         
-    def trade_book_to_h5(self, filename):
+    def spill_order_history(self, filename, max_rows, writer=None):
+        '''
+        Hold at most max_rows rows in order_history: each time max_rows rows have arrived they are
+        appended to filename (an h5 file or a storage backend), or handed to writer, as
+        order_history_to_h5() would. Rows already held are written first.
+        '''
+        if len(self.order_history):
+            self.order_history_to_h5(filename, writer)
+        spill = lambda: self.order_history_to_h5(filename, writer)
+        columns = list(zip(self.order_history.names, self.order_history.dtypes))
+        self.order_history = SpillBuffer(columns, max_rows, spill)
+
+    def order_history_chunks(self, filename, chunksize=100000):
+        '''
+        The orders table in filename (an h5 file or a storage backend) followed by the rows still held
+        in order_history, as DataFrames of up to chunksize rows: the whole history in sequence.
+
+        With a writer, call after its queued writes have finished.
+        '''
+        chunks = as_store(filename).read_chunks('orders', chunksize)
+        try:
+            chunk = next(chunks, None)
+        except (KeyError, OSError): # nothing written yet
+            chunk = None
+        if chunk is not None:
+            yield chunk
+            for chunk in chunks:
+                yield chunk
+        held = self.order_history.to_frame()
+        for start in range(0, len(held), chunksize):
+            yield held.iloc[start:start+chunksize]
+
+    def trade_book_to_h5(self, filename, writer=None):
         '''Append trade_book to an h5 file, clear the trade_book'''
-        temp_df = pd.DataFrame(self.trade_book)
-        temp_df.to_hdf(filename, 'trades', append=True, format='table', complevel=5, complib='blosc', 
-                       min_itemsize={'resting_order_id': 12, 'incoming_order_id': 12}) 
-        self.trade_book.clear()
+        self._to_h5(self.trade_book, filename, 'trades', writer,
+                    min_itemsize={'resting_order_id': 12, 'incoming_order_id': 12})
         
-    def sip_to_h5(self, filename):
+    def sip_to_h5(self, filename, writer=None):
         '''Append _sip_collector to an h5 file, clear the _sip_collector'''
-        temp_df = pd.DataFrame(self._sip_collector)
-        temp_df.to_hdf(filename, 'tob', append=True, format='table', complevel=5, complib='blosc')
-        self._sip_collector.clear()
+        self._to_h5(self._sip_collector, filename, 'tob', writer)
     
     def report_top_of_book(self, now_time):
-        '''Update the top-of-book prices and sizes'''
-        best_bid_price = self._bid_book_prices[-1]
-        best_bid_size = self._bid_book[best_bid_price]['size']   
-        best_ask_price = self._ask_book_prices[0]
-        best_ask_size = self._ask_book[best_ask_price]['size']
-        tob = {'timestamp': now_time, 'best_bid': best_bid_price, 'best_ask': best_ask_price, 'bid_size': best_bid_size, 'ask_size': best_ask_size}
-        self._sip_collector.append(tob)
-        return tob
-    
+        '''
+        Return the top-of-book prices and sizes at now_time; add a row to the SIP history only if
+        the inside changed since the last row.
+        
+        The price of an empty side is None in the returned dict and -1 (not a price) in the SIP history;
+        readers of the history treat the spread as missing while a side is empty.
+        '''
+        if self.bbo_seq != self._sip_seq:
+            self._sip_seq = self.bbo_seq
+            inside = (self.best_bid, self.best_ask, self.bid_size, self.ask_size)
+            if inside != self._sip_last:
+                self._sip_last = inside
+                self._sip_collector.append_row(now_time, -1 if self.best_bid is None else self.best_bid,
+                                               -1 if self.best_ask is None else self.best_ask,
+                                               self.bid_size, self.ask_size)
+        return {'timestamp': now_time, 'best_bid': self.best_bid, 'best_ask': self.best_ask,
+                'bid_size': self.bid_size, 'ask_size': self.ask_size}
+        
+    def depth(self, levels):
+        '''
+        Aggregated depth: the best levels prices on each side, best first, with the size at each and
+        the cumulative size to it.
+        
+        Returns a dict of bid_prices, bid_sizes, bid_cumulative, ask_prices, ask_sizes and ask_cumulative
+        (lists of up to levels entries). Up to depth_levels levels are read from the maintained view;
+        deeper requests walk the price index.
+        '''
+        if levels <= self._depth_levels:
+            bids = self._bid_depth[:levels]
+            asks = self._ask_depth[:levels]
+        else:
+            bids = self._levels(self._bid_book_prices.highest(levels), self._bid_book)
+            asks = self._levels(self._ask_book_prices.lowest(levels), self._ask_book)
+        return {'bid_prices': [l[0] for l in bids], 'bid_sizes': [l[1] for l in bids],
+                'bid_cumulative': [l[2] for l in bids], 'ask_prices': [l[0] for l in asks],
+                'ask_sizes': [l[1] for l in asks], 'ask_cumulative': [l[2] for l in asks]}
+        
+    def record_depth(self, now_time):
+        '''Add the side totals and depth_levels of depth to the depth history; missing levels are 0'''
+        bids = self._bid_depth
+        asks = self._ask_depth
+        row = [now_time, self.total_bid_size, self.total_ask_size]
+        for level in range(self._depth_levels):
+            row.extend(bids[level][:2] if level < len(bids) else [0, 0])
+            row.extend(asks[level][:2] if level < len(asks) else [0, 0])
+        self._depth_collector.append_row(*row)
+        
+    def depth_to_h5(self, filename, writer=None):
+        '''Append the depth history to an h5 file, clear the depth history'''
+        self._to_h5(self._depth_collector, filename, 'depth', writer)
+
+    def snapshot(self):
+        '''
+        The book as bytes (np.savez_compressed): the resting orders, in time priority at each price,
+        with their leaves and exids, and a state array with the order index, bbo_seq and the inside.
+
+        Histories and collectors are not included.
+        '''
+        orders = []
+        for book, book_prices in ((self._bid_book, self._bid_book_prices), (self._ask_book, self._ask_book_prices)):
+            for price in book_prices:
+                order = book[price]['head']
+                while order is not None:
+                    orders.append(order)
+                    order = order.next
+        interned = self._owner_of is owner_of
+        inside = [-1 if x is None else x for x in (self.best_bid, self.bid_size, self.best_ask, self.ask_size)]
+        state = [SNAPSHOT_VERSION, interned, self._order_index, self.bbo_seq] + inside
+        snapshot = io.BytesIO()
+        np.savez_compressed(snapshot, state=np.array(state, dtype=np.int64),
+                            order_id=np.array([o.order_id for o in orders], dtype=np.int64 if interned else str),
+                            timestamp=np.array([o.timestamp for o in orders], dtype=np.int64),
+                            quantity=np.array([o.quantity for o in orders], dtype=np.int64),
+                            leaves=np.array([o.leaves for o in orders], dtype=np.int64),
+                            buy=np.array([o.side == 'buy' for o in orders], dtype=bool),
+                            price=np.array([o.price for o in orders], dtype=np.int64),
+                            exid=np.array([-1 if o.exid is None else o.exid for o in orders], dtype=np.int64))
+        return snapshot.getvalue()
+
+    def restore(self, snapshot):
+        '''
+        Rebuild the book from snapshot() bytes; the Orderbook must be empty and use the same ids
+        (string or interned) as the snapshot.
+
+        Returns the resting Orders, in time priority at each price.
+        '''
+        if self._bid_orders or self._ask_orders:
+            raise ValueError('Orderbook.restore() needs an empty Orderbook')
+        with np.load(io.BytesIO(snapshot)) as data:
+            state = data['state'].tolist()
+            if state[0] != SNAPSHOT_VERSION:
+                raise ValueError('Orderbook snapshot version {0} is not {1}'.format(state[0], SNAPSHOT_VERSION))
+            if bool(state[1]) != (self._owner_of is owner_of):
+                raise ValueError('Orderbook snapshot ids are {0}'.format('interned' if state[1] else 'strings'))
+            orders = list(map(Order, data['order_id'].tolist(), data['timestamp'].tolist(),
+                              ['add']*len(data['order_id']), data['quantity'].tolist(),
+                              ['buy' if buy else 'sell' for buy in data['buy'].tolist()], data['price'].tolist()))
+            for order, leaves, exid in zip(orders, data['leaves'].tolist(), data['exid'].tolist()):
+                order.leaves = leaves
+                order.exid = None if exid == -1 else exid
+                self.add_order_to_book(order)
+        self._order_index = state[2]
+        self.bbo_seq = state[3]
+        inside = [-1 if x is None else x for x in (self.best_bid, self.bid_size, self.best_ask, self.ask_size)]
+        if inside != state[4:]:
+            raise ValueError('Orderbook snapshot inside {0} does not match its orders {1}'.format(state[4:], inside))
+        return orders
@@ -0,0 +1,273 @@
+import numpy as np
+
+from pyziabm.buffers import ColumnBuffer
+from pyziabm.ids import make_order_id, owner_of, owner_of_str, sequence_of, sequence_of_str
+from pyziabm.orderbook3 import Order
+from pyziabm.scheduler import ArrivalCalendar, TimingWheel
+
+
+class Population(object):
+    '''
+    Population holds one class of traders as arrays, one entry per trader, instead of one object per trader.
+
+    names, sizes (maxq) and t_delta (arrival intervals) are fixed; sequence holds each trader's last
+    quote sequence. Each step prepare() finds the arriving traders and makes the random draws for all
+    of them at once; when a trader's turn comes, quote(i, ...) builds its quotes from those draws
+    and the current top of book.
+    Public attributes: trader_type, names, index, sizes, t_delta and sequence
+    Public methods: arrivals()
+    '''
+
+    def __init__(self, names, sizes, t_delta):
+        '''
+        names are trader ids (strings) or, with interned ids, trader numbers; index maps a name to its position.
+        _id_base is the interned order id base of each trader (None for string ids);
+        _quotes holds this step's draws for each arriving trader; _calendar gives the arrivals
+        '''
+        self.names = list(names)
+        self.index = {name: i for i, name in enumerate(self.names)}
+        self.sizes = np.asarray(sizes, dtype=np.int64)
+        self.t_delta = np.asarray(t_delta)
+        self.sequence = np.zeros(len(self.names), dtype=np.int64)
+        if self.names and not isinstance(self.names[0], str):
+            self._id_base = np.array([make_order_id(int(name), 0) for name in self.names], dtype=np.int64)
+        else:
+            self._id_base = None
+        self._quotes = {}
+        self._calendar = ArrivalCalendar(self.t_delta)
+
+    def __repr__(self):
+        return '{0}Population({1} traders)'.format(self.trader_type, len(self.names))
+
+    def __len__(self):
+        return len(self.names)
+
+    def arrivals(self, step):
+        '''Positions of the traders which arrive at step; steps are asked for in order'''
+        return np.array(self._calendar.arrivals(step), dtype=np.int64)
+
+    def _order_ids(self, arriving, first, count=1):
+        '''Order ids for count quotes per arriving trader, from sequence first: a list (of lists if count > 1)'''
+        sequences = first[:, None] + np.arange(count)
+        if self._id_base is None:
+            names = [self.names[i] for i in arriving.tolist()]
+            ids = [['%s_%d' % (name, s) for s in row] for name, row in zip(names, sequences.tolist())]
+        else:
+            ids = (self._id_base[arriving][:, None] + sequences).tolist()
+        return ids if count > 1 else [row[0] for row in ids]
+
+
+class TakerPopulation(Population):
+    '''
+    TakerPopulation: Takers as arrays; each arriving Taker buys at 2000000 or sells at 0 (market orders with market=True).
+
+    Public attributes: as Population
+    Public methods: prepare(), quote()
+    '''
+
+    def __init__(self, names, sizes, t_delta, market=False):
+        Population.__init__(self, names, sizes, t_delta)
+        self.trader_type = 'Taker'
+        self._market = market
+
+    def prepare(self, step, q_taker):
+        '''Draw buy or sell for each Taker arriving at step; returns their positions'''
+        arriving = self.arrivals(step)
+        self.sequence[arriving] += 1
+        buys = (np.random.rand(len(arriving)) < q_taker).tolist()
+        ids = self._order_ids(arriving, self.sequence[arriving])
+        self._quotes = dict(zip(arriving.tolist(), zip(ids, self.sizes[arriving].tolist(), buys)))
+        return arriving
+
+    def quote(self, i, step):
+        '''Taker i's quote (Order) for this step'''
+        order_id, size, buy = self._quotes.pop(i)
+        q = Order(order_id, step, 'add', size, 'buy' if buy else 'sell', 2000000 if buy else 0)
+        if self._market:
+            q.type = 'market'
+        return q
+
+
+class ProviderPopulation(Population):
+    '''
+    ProviderPopulation: Providers (Provider with mpi 1, Provider5 otherwise) as arrays.
+
+    The outstanding orders of all the Providers are held in one local_book; each order's geometric
+    lifetime is drawn when it is added, as with Provider.schedule_cancels(), and its cancel is kept
+    in one TimingWheel for the population, so a step only touches the Providers arriving or with
+    cancels due.
+    Public attributes: as Population, local_book
+    Public methods: prepare(), quote(), cancels(), confirm_cancel_local(), confirm_trade_local(), restore_order()
+    '''
+
+    def __init__(self, names, sizes, t_delta, mpi, delta, start):
+        '''
+        start is the first step with cancels: lifetimes of orders added earlier (priming) count from start.
+        _expiries holds (position, Order) until the cancel is due; _due holds this step's cancels by position
+        '''
+        Population.__init__(self, names, sizes, t_delta)
+        self.trader_type = 'Provider'
+        self._mpi = mpi
+        self._delta = delta
+        self._start = start
+        self.local_book = {}
+        self._expiries = TimingWheel(start-1)
+        self._due = {}
+        self._owner_of = owner_of_str if self._id_base is None else owner_of
+        self._sequence_of = sequence_of_str if self._id_base is None else sequence_of
+
+    def _pop_due(self, step, arriving):
+        '''Collect the cancels due at step by trader; returns the positions arriving or with cancels due'''
+        self._due = {}
+        for i, q in self._expiries.pop(step):
+            self._due.setdefault(i, []).append(q)
+        if self._due:
+            return np.union1d(arriving, np.fromiter(self._due, dtype=np.int64, count=len(self._due)))
+        return arriving
+
+    def _schedule(self, i, q, step, lifetime):
+        due = max(step, self._start) + lifetime
+        if due == step:
+            self._due.setdefault(i, []).append(q)
+        else:
+            self._expiries.schedule(due, (i, q))
+
+    def prepare(self, step, q_provider, lambda_t):
+        '''
+        Draw the side, price offset and lifetime of each arriving Provider's quote and collect the cancels
+        due at step; returns the positions of the Providers arriving or with cancels due, in order
+        '''
+        arriving = self.arrivals(step)
+        n = len(arriving)
+        self.sequence[arriving] += 1
+        buys = (np.random.rand(n) < q_provider).tolist()
+        plugs = np.trunc(lambda_t*np.log(np.random.rand(n))).astype(np.int64).tolist()
+        lifetimes = (np.random.geometric(self._delta, n) - 1).tolist()
+        ids = self._order_ids(arriving, self.sequence[arriving])
+        self._quotes = dict(zip(arriving.tolist(), zip(ids, self.sizes[arriving].tolist(), buys, plugs, lifetimes)))
+        return self._pop_due(step, arriving)
+
+    def quote(self, i, step, qsignal):
+        '''Provider i's quote (Order) priced off qsignal, as Provider.process_signal(); None if i is not arriving'''
+        quote = self._quotes.pop(i, None)
+        if quote is None:
+            return None
+        order_id, size, buy, plug, lifetime = quote
+        mpi = self._mpi
+        if buy:
+            q = Order(order_id, step, 'add', size, 'buy', mpi*((qsignal['best_ask']-1-plug)//mpi))
+        else:
+            q = Order(order_id, step, 'add', size, 'sell', -mpi*((-qsignal['best_bid']-1-plug)//mpi))
+        self.local_book[order_id] = q
+        self._schedule(i, q, step, lifetime)
+        return q
+
+    def cancels(self, i):
+        '''Order ids of trader i's resting orders due to be cancelled now'''
+        due = self._due.pop(i, None)
+        if due is None:
+            return []
+        return [q.order_id for q in due if q.leaves]
+
+    def confirm_cancel_local(self, cancel_dict):
+        del self.local_book[cancel_dict['order_id']]
+
+    def confirm_trade_local(self, confirm):
+        '''The Orderbook updates leaves on the shared Order; drop the Order once it is filled'''
+        if not self.local_book[confirm['order_id']].leaves:
+            del self.local_book[confirm['order_id']]
+
+    def restore_order(self, order):
+        '''Take back a resting order (Order) from a restored Orderbook; its lifetime counts from start'''
+        i = self.index[self._owner_of(order.order_id)]
+        self.sequence[i] = max(self.sequence[i], self._sequence_of(order.order_id))
+        self.local_book[order.order_id] = order
+        # on the wheel even when due at start: _due only holds the cancels of the step being run
+        self._expiries.schedule(self._start + np.random.geometric(self._delta) - 1, (i, order))
+
+
+class MarketMakerPopulation(ProviderPopulation):
+    '''
+    MarketMakerPopulation: MarketMakers (MarketMaker with mpi 1, MarketMaker5 otherwise) as arrays.
+
+    Each arriving MarketMaker sends num_quotes quotes on one side, on the grid of MarketMaker.process_signal();
+    position and cash_flow are arrays and every fill adds a row to cash_flow_collector.
+    Public attributes: as ProviderPopulation, position, cash_flow, cash_flow_collector
+    Public methods: as ProviderPopulation
+    '''
+
+    def __init__(self, names, sizes, t_delta, mpi, delta, num_quotes, quote_range, start):
+        '''
+        _bid_offsets and _ask_offsets are the price grid (from the best bid or ask) with the grid
+        probabilities _p_bid and _p_ask (uniform for MarketMaker, as MarketMaker5 otherwise)
+        '''
+        ProviderPopulation.__init__(self, names, sizes, t_delta, mpi, delta, start)
+        self.trader_type = 'MarketMaker'
+        self._num_quotes = num_quotes
+        self.position = np.zeros(len(self.names), dtype=np.int64)
+        self.cash_flow = np.zeros(len(self.names), dtype=np.int64)
+        mmid_dtype = object if self._id_base is None else np.int64
+        self.cash_flow_collector = ColumnBuffer((('mmid', mmid_dtype), ('timestamp', np.int64),
+                                                 ('cash_flow', np.int64), ('position', np.int64)), block_size=1024)
+        if mpi == 1:
+            self._bid_offsets = np.arange(-quote_range+1, 1, mpi)
+            self._ask_offsets = np.arange(0, quote_range, mpi)
+            self._p_bid = self._p_ask = None
+        else:
+            self._bid_offsets = np.arange(-quote_range, 1, mpi)
+            self._ask_offsets = np.arange(0, quote_range+1, mpi)
+            self._p_ask = [1/20, 1/12, 1/12, 1/12, 1/12, 1/12, 1/12, 1/12, 1/12, 1/12, 1/12, 1/12, 1/30]
+            self._p_bid = [1/30, 1/12, 1/12, 1/12, 1/12, 1/12, 1/12, 1/12, 1/12, 1/12, 1/12, 1/12, 1/20]
+
+    def prepare(self, step, q_provider):
+        '''
+        Draw the side, price offsets and lifetimes of each arriving MarketMaker's quotes and collect the
+        cancels due at step; returns the positions of the MarketMakers arriving or with cancels due
+        '''
+        arriving = self.arrivals(step)
+        n = len(arriving)
+        nq = self._num_quotes
+        first = self.sequence[arriving] + 1
+        self.sequence[arriving] += nq
+        buys = np.random.rand(n) < q_provider
+        offsets = np.empty((n, nq), dtype=np.int64)
+        offsets[buys] = np.random.choice(self._bid_offsets, size=(buys.sum(), nq), p=self._p_bid)
+        offsets[~buys] = np.random.choice(self._ask_offsets, size=(n-buys.sum(), nq), p=self._p_ask)
+        lifetimes = (np.random.geometric(self._delta, (n, nq)) - 1).tolist()
+        ids = self._order_ids(arriving, first, nq)
+        self._quotes = dict(zip(arriving.tolist(), zip(ids, self.sizes[arriving].tolist(), buys.tolist(),
+                                                       offsets.tolist(), lifetimes)))
+        return self._pop_due(step, arriving)
+
+    def quote(self, i, step, qsignal):
+        '''MarketMaker i's quotes (Orders) priced off qsignal, as MarketMaker.process_signal(); [] if i is not arriving'''
+        quote = self._quotes.pop(i, None)
+        if quote is None:
+            return []
+        order_ids, size, buy, offsets, lifetimes = quote
+        if buy:
+            side = 'buy'
+            base = qsignal['best_bid'] if qsignal['bid_size'] > 1 else qsignal['best_bid']-self._mpi
+        else:
+            side = 'sell'
+            base = qsignal['best_ask'] if qsignal['ask_size'] > 1 else qsignal['best_ask']+self._mpi
+        quotes = []
+        for order_id, offset, lifetime in zip(order_ids, offsets, lifetimes):
+            q = Order(order_id, step, 'add', size, side, base+offset)
+            self.local_book[order_id] = q
+            self._schedule(i, q, step, lifetime)
+            quotes.append(q)
+        return quotes
+
+    def confirm_trade_local(self, confirm):
+        '''Modify cash_flow and position; update the local_book; add a cash_flow_collector row'''
+        i = self.index[confirm['trader']]
+        if confirm['side'] == 'buy':
+            self.cash_flow[i] -= confirm['price']*confirm['quantity']
+            self.position[i] += confirm['quantity']
+        else:
+            self.cash_flow[i] += confirm['price']*confirm['quantity']
+            self.position[i] -= confirm['quantity']
+        if not self.local_book[confirm['order_id']].leaves:
+            del self.local_book[confirm['order_id']]
+        self.cash_flow_collector.append_row(confirm['trader'], confirm['timestamp'], self.cash_flow[i], self.position[i])
@@ -0,0 +1,119 @@
+import sys
+import time
+
+import numpy as np
+
+from pyziabm.orderbook3 import Order, Orderbook
+from pyziabm.storage import open_store
+
+# The Runner records its seed quotes with this exid and puts them on the book directly
+SEED_EXID = 99999999
+
+
+class Replay(object):
+    '''
+    Replay feeds the recorded order_history (the orders table) of a run back through an Orderbook
+    to rebuild the book at any point in the run, without the traders.
+
+    The orders table is read in chunks from the run's storage (an h5 file by default) and each chunk
+    is processed as a batch. By default the Orderbook does not record (Orderbook(record=False)), so
+    the replay only maintains the book; with record=True order_history, trade_book and the
+    confirmations are rebuilt as well.
+    run() stops at a timestamp, an exid or when a predicate is true; a later run() continues from there.
+    Public attributes: orderbook, messages, timestamp and exid
+    Public methods: run()
+    '''
+
+    def __init__(self, store, storage='h5', chunksize=100000, tick=None, record=False):
+        '''
+        store is the run's output (a file or directory name, or a storage backend); storage is as
+        for Runner(storage=...). tick is the Orderbook tick (Runner(ladder=True) used the mpi).
+
+        orderbook is created with the first chunk; interned ids are detected from the order_id column.
+        messages counts the orders replayed; timestamp and exid are those of the last order replayed.
+        _chunks streams the orders table; _orders holds the Orders of the current chunk not yet
+        replayed, from _pos, with their recorded _timestamps and _exids
+        '''
+        self._store = open_store(store, storage) if isinstance(store, str) else store
+        self._tick = tick
+        self._record = record
+        self._chunks = self._store.read_chunks('orders', chunksize)
+        self.orderbook = None
+        self.messages = 0
+        self.timestamp = None
+        self.exid = None
+        self._orders = []
+        self._timestamps = self._exids = np.empty(0, dtype=np.int64)
+        self._pos = 0
+
+    def _next_chunk(self):
+        '''Load the next chunk of the orders table; False at the end of the table'''
+        chunk = next(self._chunks, None)
+        if chunk is None:
+            return False
+        if self.orderbook is None:
+            self.orderbook = Orderbook(tick=self._tick, interned=chunk.order_id.dtype.kind in 'iu',
+                                       record=self._record)
+        self._timestamps = chunk.timestamp.to_numpy()
+        self._exids = chunk.exid.to_numpy()
+        self._orders = list(map(Order, chunk.order_id.tolist(), self._timestamps.tolist(), chunk.type.tolist(),
+                                chunk.quantity.tolist(), chunk.side.tolist(), chunk.price.tolist()))
+        self._pos = 0
+        return True
+
+    def _replay(self, start, end):
+        '''Replay _orders[start:end]: seed quotes go straight to the book, the rest through process_orders()'''
+        seeds = np.flatnonzero(self._exids[start:end] == SEED_EXID) + start
+        for seed in seeds:
+            self.orderbook.process_orders(self._orders[start:seed])
+            self.orderbook.add_order_to_book(self._orders[seed])
+            start = seed + 1
+        self.orderbook.process_orders(self._orders[start:end])
+
+    def run(self, until_timestamp=None, until_exid=None, stop=None):
+        '''
+        Replay orders until the next order is later than until_timestamp or has an exid greater than
+        until_exid (it is left for the next run), or until stop(order, orderbook) is True after an order.
+
+        Returns the orderbook; run() replays to the end of the table with no conditions.
+        '''
+        while True:
+            if self._pos == len(self._orders) and not self._next_chunk():
+                return self.orderbook
+            start = self._pos
+            end = len(self._orders)
+            halt = False
+            if until_timestamp is not None:
+                later = np.flatnonzero(self._timestamps[start:end] > until_timestamp)
+                if len(later):
+                    end, halt = start + later[0], True
+            if until_exid is not None:
+                later = np.flatnonzero((self._exids[start:end] > until_exid) & (self._exids[start:end] != SEED_EXID))
+                if len(later):
+                    end, halt = start + later[0], True
+            if stop is None:
+                self._replay(start, end)
+            else:
+                for i in range(start, end):
+                    self._replay(i, i+1)
+                    if stop(self._orders[i], self.orderbook):
+                        end, halt = i+1, True
+                        break
+            if end > start:
+                self.messages += end - start
+                self.timestamp = self._orders[end-1].timestamp
+                self.exid = int(self._exids[end-1])
+            self._pos = end
+            if halt:
+                return self.orderbook
+
+
+if __name__ == '__main__':
+
+    # python -m pyziabm.replay run.h5 [storage]
+    start = time.perf_counter()
+    replay = Replay(sys.argv[1], *sys.argv[2:3])
+    book = replay.run()
+    elapsed = time.perf_counter() - start
+    print('{0} messages in {1:.2f}s: {2:.0f} messages/s'.format(replay.messages, elapsed, replay.messages/elapsed))
+    print('best bid {0} x {1}, best ask {2} x {3}'.format(book.best_bid, book.bid_size, book.best_ask, book.ask_size))
@@ -3,7 +3,7 @@ import time
 import numpy as np
 import pandas as pd
 
-from pyziabm.orderbook3 import Orderbook
+from pyziabm.orderbook3 import Order, Orderbook
 from pyziabm.trader2017_r3 import Provider, Provider5, Taker, MarketMaker, MarketMaker5, PennyJumper
 
 
@@ -30,10 +30,8 @@ class Runner(object):
         self.trader_dict.update({'p999999': seed_provider})
         ba = random.choice(range(1000005, 1002001, 5))
         bb = random.choice(range(997995, 999996, 5))
-        qask = {'order_id': 'p999999_a', 'timestamp': 0, 'type': 'add', 'quantity': 1, 'side': 'sell',
-              'price': ba, 'exid': 99999999}
-        qbid = {'order_id': 'p999999_b', 'timestamp': 0, 'type': 'add', 'quantity': 1, 'side': 'buy',
-              'price': bb, 'exid': 99999999}
+        qask = Order('p999999_a', 0, 'add', 1, 'sell', ba, exid=99999999)
+        qbid = Order('p999999_b', 0, 'add', 1, 'buy', bb, exid=99999999)
         seed_provider.local_book['p999999_a'] = qask
         self.exchange.add_order_to_book(qask)
         self.exchange.order_history.append(qask)
@@ -129,97 +127,80 @@ class Runner(object):
                 self.exchange.process_order(p.quote_collector[-1])
                 top_of_book = self.exchange.report_top_of_book(current_time)  
         
-    def run_mcs(self, prime1):
+    def add_pennyjumper(self, rows):
+        '''The PennyJumper's arrivals for a step, drawn together: a row after each row with probability alpha_pj'''
+        rows = list(rows)
+        for k in np.flatnonzero(np.random.rand(len(rows)) < self.alpha_pj)[::-1].tolist():
+            rows.insert(k+1, (self.pennyjumper, True))
+        return rows
+        
+    def cancel_row(self, trader, current_time, top_of_book):
+        trader.bulk_cancel(current_time)
+        if trader.cancel_collector: # <---- Check permission versus forgiveness here and elsewhere - move to methods?
+            for c in trader.cancel_collector:
+                self.exchange.process_order(c)
+                if self.exchange.confirm_modify_collector: # <---- Check permission versus forgiveness here and elsewhere - move to methods?
+                    trader.confirm_cancel_local(self.exchange.confirm_modify_collector[0])
+            top_of_book = self.exchange.report_top_of_book(current_time)
+        return top_of_book
+        
+    def provider_row(self, trader, arrived, current_time, top_of_book):
+        if arrived:
+            trader.process_signal(current_time, top_of_book, self.q_provide, self.lambda_t[current_time])
+            self.exchange.process_order(trader.quote_collector[-1])
+            top_of_book = self.exchange.report_top_of_book(current_time)
+        return self.cancel_row(trader, current_time, top_of_book)
+        
+    def marketmaker_row(self, trader, arrived, current_time, top_of_book):
+        if arrived:
+            trader.process_signal(current_time, top_of_book, self.q_provide)
+            for q in trader.quote_collector:
+                self.exchange.process_order(q)
+            top_of_book = self.exchange.report_top_of_book(current_time)
+        return self.cancel_row(trader, current_time, top_of_book)
+        
+    def taker_row(self, trader, arrived, current_time, top_of_book):
+        trader.process_signal(current_time, self.q_take[current_time])
+        self.exchange.process_order(trader.quote_collector[-1])
+        if self.exchange.traded: # <---- Check permission versus forgiveness here and elsewhere - move to methods?
+            for c in self.exchange.confirm_trade_collector:
+                self.trader_dict[c['trader']].confirm_trade_local(c)
+            top_of_book = self.exchange.report_top_of_book(current_time)
+        return top_of_book
+        
+    def pennyjumper_row(self, trader, arrived, current_time, top_of_book):
+        trader.process_signal(current_time, top_of_book, self.q_take[current_time])
+        for c in trader.cancel_collector:
+            self.exchange.process_order(c)
+        for q in trader.quote_collector:
+            self.exchange.process_order(q)
+        return self.exchange.report_top_of_book(current_time)
+                
+    def run_mcs(self, prime1, pj=False):
+        '''
+        Each step the rows from make_both() (and, with pj, the PennyJumper's arrivals) are handled in turn by
+        the HANDLERS entry for the trader's trader_type.
+        '''
+        handlers = HANDLERS
         top_of_book = self.exchange.report_top_of_book(prime1)
         for current_time in range(prime1, self.run_steps):
-            for row in self.make_both(current_time):
-                if row[0].trader_type == 'Provider':
-                    if row[1]:
-                        row[0].process_signal(current_time, top_of_book, self.q_provide, self.lambda_t[current_time])
-                        self.exchange.process_order(row[0].quote_collector[-1])
-                        top_of_book = self.exchange.report_top_of_book(current_time)
-                    row[0].bulk_cancel(current_time)
-                    if row[0].cancel_collector: # <---- Check permission versus forgiveness here and elsewhere - move to methods?
-                        for c in row[0].cancel_collector:
-                            self.exchange.process_order(c)
-                            if self.exchange.confirm_modify_collector: # <---- Check permission versus forgiveness here and elsewhere - move to methods?
-                                row[0].confirm_cancel_local(self.exchange.confirm_modify_collector[0])
-                        top_of_book = self.exchange.report_top_of_book(current_time)
-                elif row[0].trader_type == 'MarketMaker':
-                    if row[1]:
-                        row[0].process_signal(current_time, top_of_book, self.q_provide)
-                        for q in row[0].quote_collector:
-                            self.exchange.process_order(q)
-                        top_of_book = self.exchange.report_top_of_book(current_time)
-                    row[0].bulk_cancel(current_time)
-                    if row[0].cancel_collector: # <---- Check permission versus forgiveness here and elsewhere - move to methods?
-                        for c in row[0].cancel_collector:
-                            self.exchange.process_order(c)
-                            if self.exchange.confirm_modify_collector: # <---- Check permission versus forgiveness here and elsewhere - move to methods?
-                                row[0].confirm_cancel_local(self.exchange.confirm_modify_collector[0])
-                        top_of_book = self.exchange.report_top_of_book(current_time)
-                else:
-                    row[0].process_signal(current_time, self.q_take[current_time])
-                    self.exchange.process_order(row[0].quote_collector[-1])
-                    if self.exchange.traded: # <---- Check permission versus forgiveness here and elsewhere - move to methods?
-                        for c in self.exchange.confirm_trade_collector:
-                            trader = self.trader_dict[c['trader']]
-                            trader.confirm_trade_local(c)
-                        top_of_book = self.exchange.report_top_of_book(current_time)
+            rows = self.make_both(current_time)
+            if pj:
+                rows = self.add_pennyjumper(rows)
+            for trader, arrived in rows:
+                top_of_book = handlers[trader.trader_type](self, trader, arrived, current_time, top_of_book)
             if not np.remainder(current_time, 2000):
                 self.exchange.order_history_to_h5(self.h5filename)
                 self.exchange.sip_to_h5(self.h5filename)
                 
     def run_mcsPJ(self, prime1):
-        top_of_book = self.exchange.report_top_of_book(prime1)
-        for current_time in range(prime1, self.run_steps):
-            for row in self.make_both(current_time):
-                if row[0].trader_type == 'Provider':
-                    if row[1]:
-                        row[0].process_signal(current_time, top_of_book, self.q_provide, self.lambda_t[current_time])
-                        self.exchange.process_order(row[0].quote_collector[-1])
-                        top_of_book = self.exchange.report_top_of_book(current_time)
-                    row[0].bulk_cancel(current_time)
-                    if row[0].cancel_collector: # <---- Check permission versus forgiveness here and elsewhere - move to methods?
-                        for c in row[0].cancel_collector:
-                            self.exchange.process_order(c)
-                            if self.exchange.confirm_modify_collector: # <---- Check permission versus forgiveness here and elsewhere - move to methods?
-                                row[0].confirm_cancel_local(self.exchange.confirm_modify_collector[0])
-                        top_of_book = self.exchange.report_top_of_book(current_time)
-                elif row[0].trader_type == 'MarketMaker':
-                    if row[1]:
-                        row[0].process_signal(current_time, top_of_book, self.q_provide)
-                        for q in row[0].quote_collector:
-                            self.exchange.process_order(q)
-                        top_of_book = self.exchange.report_top_of_book(current_time)
-#                    row[0].bulk_cancel(self.delta*2, current_time, self.q_take[current_time])
-                    row[0].bulk_cancel(current_time)
-                    if row[0].cancel_collector: # <---- Check permission versus forgiveness here and elsewhere - move to methods?
-                        for c in row[0].cancel_collector:
-                            self.exchange.process_order(c)
-                            if self.exchange.confirm_modify_collector: # <---- Check permission versus forgiveness here and elsewhere - move to methods?
-                                row[0].confirm_cancel_local(self.exchange.confirm_modify_collector[0])
-                        top_of_book = self.exchange.report_top_of_book(current_time)
-                else:
-                    row[0].process_signal(current_time, self.q_take[current_time])
-                    self.exchange.process_order(row[0].quote_collector[-1])
-                    if self.exchange.traded: # <---- Check permission versus forgiveness here and elsewhere - move to methods?
-                        for c in self.exchange.confirm_trade_collector:
-                            trader = self.trader_dict[c['trader']]
-                            trader.confirm_trade_local(c)
-                        top_of_book = self.exchange.report_top_of_book(current_time)
-                if random.uniform(0,1) < self.alpha_pj:
-                    self.pennyjumper.process_signal(current_time, top_of_book, self.q_take[current_time])
-                    if self.pennyjumper.cancel_collector:
-                        for c in self.pennyjumper.cancel_collector:
-                            self.exchange.process_order(c)
-                    if self.pennyjumper.quote_collector:
-                        for q in self.pennyjumper.quote_collector:
-                            self.exchange.process_order(q)
-                    top_of_book = self.exchange.report_top_of_book(current_time)
-            if not np.remainder(current_time, 2000):
-                self.exchange.order_history_to_h5(self.h5filename)
-                self.exchange.sip_to_h5(self.h5filename)
+        self.run_mcs(prime1, pj=True)
+
+
+# The row handler for each trader_type: handler(runner, trader, arrived, current_time, top_of_book) returns
+# the top of book. Register other agent types here.
+HANDLERS = {'Provider': Runner.provider_row, 'MarketMaker': Runner.marketmaker_row, 'Taker': Runner.taker_row,
+            'PennyJumper': Runner.pennyjumper_row}
     
 
 if __name__ == '__main__':
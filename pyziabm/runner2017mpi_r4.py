@@ -2,59 +2,155 @@ import random
 import numpy as np
 import pandas as pd
 
-from pyziabm.orderbook3 import Orderbook
+from pyziabm.ids import make_order_id, owner_of, owner_of_str
+from pyziabm.instruments import Instruments
+from pyziabm.orderbook3 import Order, Orderbook
+from pyziabm.population import MarketMakerPopulation, ProviderPopulation, TakerPopulation
+from pyziabm.scheduler import ArrivalCalendar, TimingWheel
 from pyziabm.trader2017_r3 import Provider, Provider5, Taker, MarketMaker, MarketMaker5, PennyJumper
+from pyziabm.stats import RunStats, StatsStore
+from pyziabm.storage import open_store
+from pyziabm.writer import H5Writer
+from pyziabm.walk import QTakeStream, q_take_path
 
 
 class Runner(object):
     def __init__(self, prime1=20, num_mms=1, mm_maxq=1, mm_quotes=12, mm_quote_range=60, mm_delta=0.025, 
                  num_takers=50, taker_maxq=1, num_providers=38, provider_maxq=1, q_provide=0.5,
                  alpha=0.0375, mu=0.001, delta=0.025, lambda0=100, wn=0.001, c_lambda=1.0, run_steps=100000,
-                 mpi=5, h5filename='test.h5', pj=False, alpha_pj=0):
+                 mpi=5, h5filename='test.h5', pj=False, alpha_pj=0, ladder=False, intern_ids=False,
+                 depth_levels=5, depth_interval=0, async_writer=False, storage='h5', warm_start=None,
+                 snapshot_file=None, instrument=False, market_orders=False, history_rows=None,
+                 scheduled_cancels=False, population=False, stream_q_take=False, stats=False):
         self.alpha_pj = alpha_pj
         self.q_provide = q_provide
         self.lambda0 = lambda0
         self.run_steps = run_steps+1
         self.h5filename = h5filename
-        self.t_delta_t, self.taker_array = self.make_taker_array(taker_maxq, num_takers, mu)
-        self.t_delta_p, self.provider_array = self.make_provider_array(provider_maxq, num_providers, delta, mpi, alpha)
-        self.t_delta_m, self.marketmaker_array = self.make_marketmaker_array(mm_maxq, num_mms, mm_quotes, mm_quote_range, mm_delta, mpi)
+        self.store = open_store(h5filename, storage)
+        self.stats = None
+        if stats:
+            self.stats = RunStats()
+            self.store = StatsStore(self.store, self.stats)
+        self.depth_interval = depth_interval
+        self.writer = H5Writer() if async_writer else None
+        self.trader_names = [] if intern_ids else None
+        self._trader_numbers = {}
+        if population:
+            self.taker_array, self.provider_array, self.marketmaker_array = self.make_populations(
+                taker_maxq, num_takers, mu, market_orders, provider_maxq, num_providers, delta, mpi, alpha,
+                mm_maxq, num_mms, mm_quotes, mm_quote_range, mm_delta, prime1)
+        else:
+            self.t_delta_t, self.taker_array = self.make_taker_array(taker_maxq, num_takers, mu, market_orders)
+            self.t_delta_p, self.provider_array = self.make_provider_array(provider_maxq, num_providers, delta, mpi, alpha)
+            self.t_delta_m, self.marketmaker_array = self.make_marketmaker_array(mm_maxq, num_mms, mm_quotes, mm_quote_range, mm_delta, mpi)
         self.pennyjumper = self.make_pennyjumper(mpi)
-        self.exchange = Orderbook()
-        self.q_take, self.lambda_t = self.make_q_take(wn, c_lambda)
-        self.trader_dict = self.make_traders(num_takers, num_providers, num_mms)
-        self.seed_orderbook()
-        self.make_setup(prime1)
-        if pj:
-            self.run_mcsPJ(prime1)
+        self.exchange = Orderbook(tick=mpi if ladder else None, interned=intern_ids, depth_levels=depth_levels)
+        if history_rows is not None:
+            self.exchange.spill_order_history(self.store, history_rows, self.writer)
+        if stream_q_take:
+            self.q_stream = QTakeStream(self.run_steps, wn, self.lambda0, c_lambda, on_chunk=self.qtake_chunk_to_h5)
+            self.q_take, self.lambda_t = self.q_stream.q_take, self.q_stream.lambda_t
+        else:
+            self.q_stream = None
+            self.q_take, self.lambda_t = self.make_q_take(wn, c_lambda)
+        if population:
+            self.trader_dict = {name: p for p in (self.taker_array, self.provider_array, self.marketmaker_array)
+                                for name in p.names}
+            if self.alpha_pj > 0:
+                self.trader_dict[self.pennyjumper.trader_id] = self.pennyjumper
+        else:
+            self.trader_dict = self.make_traders(num_takers, num_providers, num_mms)
+        for name, trader in self.trader_dict.items():
+            self.subscribe(name, trader)
+        self.instruments = Instruments(self.exchange, self._trader_type) if instrument else None
+        if warm_start is None:
+            self.seed_orderbook()
+            if population:
+                self.make_setup_population(prime1)
+            else:
+                self.make_setup(prime1)
         else:
-            self.run_mcs(prime1)
-        self.exchange.trade_book_to_h5(h5filename)
+            self.restore_orderbook(warm_start)
+        if not population:
+            self.make_calendars(prime1, scheduled_cancels)
+        if population:
+            self.run_population(prime1, pj)
+        else:
+            self.run_mcs(prime1, pj)
+        self.exchange.trade_book_to_h5(self.store, self.writer)
+        if snapshot_file is not None:
+            with open(snapshot_file, 'wb') as f:
+                f.write(self.exchange.snapshot())
         self.out_to_h5()
+        if self.writer is not None:
+            self.writer.close()
+        self.store.close()
+        self.summary = None if self.stats is None else self.stats.summary(trader_names=self.trader_names)
+        
+    def _intern(self, name):
+        '''With interned ids, number traders densely in order of creation; otherwise keep the name.'''
+        if self.trader_names is None:
+            return name
+        number = self._trader_numbers.get(name)
+        if number is None:
+            number = self._trader_numbers[name] = len(self.trader_names)
+            self.trader_names.append(name)
+        return number
+        
+    def subscribe(self, name, trader):
+        '''The exchange delivers the trader's (or population's) fills and cancels straight to its confirm methods'''
+        self.exchange.subscribe(name, getattr(trader, 'confirm_trade_local', None),
+                                getattr(trader, 'confirm_cancel_local', None))
+        
+    def _trader_type(self, owner):
+        return self.trader_dict[owner].trader_type
         
     def seed_orderbook(self):
-        seed_provider = Provider('p999999', 1, 5, 0.05)
-        self.trader_dict.update({'p999999': seed_provider})
+        seed_id = self._intern('p999999')
+        seed_provider = Provider(seed_id, 1, 5, 0.05)
+        self.trader_dict.update({seed_id: seed_provider})
+        self.subscribe(seed_id, seed_provider)
         ba = random.choice(range(1000005, 1002001, 5))
         bb = random.choice(range(997995, 999996, 5))
-        qask = {'order_id': 'p999999_a', 'timestamp': 0, 'type': 'add', 'quantity': 1, 'side': 'sell',
-              'price': ba, 'exid': 99999999}
-        qbid = {'order_id': 'p999999_b', 'timestamp': 0, 'type': 'add', 'quantity': 1, 'side': 'buy',
-              'price': bb, 'exid': 99999999}
-        seed_provider.local_book['p999999_a'] = qask
+        if self.trader_names is None:
+            ask_id, bid_id = 'p999999_a', 'p999999_b'
+        else:
+            ask_id, bid_id = make_order_id(seed_id, 1), make_order_id(seed_id, 2)
+        qask = Order(ask_id, 0, 'add', 1, 'sell', ba, exid=99999999)
+        qbid = Order(bid_id, 0, 'add', 1, 'buy', bb, exid=99999999)
+        seed_provider.local_book[ask_id] = qask
         self.exchange.add_order_to_book(qask)
         self.exchange.order_history.append(qask)
-        seed_provider.local_book['p999999_b'] = qbid
+        seed_provider.local_book[bid_id] = qbid
         self.exchange.add_order_to_book(qbid)
         self.exchange.order_history.append(qbid)
+
+    def restore_orderbook(self, snapshot):
+        '''
+        Warm start: restore the exchange from an Orderbook snapshot (bytes or a file name) instead of
+        seeding and priming it, and hand the resting orders back to their traders.
+        '''
+        seed_id = self._intern('p999999')
+        self.trader_dict.update({seed_id: Provider(seed_id, 1, 5, 0.05)})
+        self.subscribe(seed_id, self.trader_dict[seed_id])
+        if isinstance(snapshot, str):
+            with open(snapshot, 'rb') as f:
+                snapshot = f.read()
+        owner = owner_of_str if self.trader_names is None else owner_of
+        for order in self.exchange.restore(snapshot):
+            trader = self.trader_dict.get(owner(order.order_id))
+            if trader is None:
+                raise ValueError('warm_start order {0} belongs to a trader not in this run'.format(order.order_id))
+            trader.restore_order(order)
     
-    def make_taker_array(self, maxq, num_takers, mu):
+    def make_taker_array(self, maxq, num_takers, mu, market=False):
         default_arr = np.array([1, 5, 10, 25, 50])
         actual_arr = default_arr[default_arr<=maxq]
         taker_size = np.random.choice(actual_arr, num_takers)
         t_delta_t = np.floor(np.random.exponential(1/mu, num_takers)+1)*taker_size
-        takers_list = ['t%i' % i for i in range(num_takers)]
-        takers = np.array([Taker(t,i) for t,i in zip(takers_list,taker_size)])
+        takers_list = [self._intern('t%i' % i) for i in range(num_takers)]
+        takers = np.array([Taker(t,i,market) for t,i in zip(takers_list,taker_size)])
         return t_delta_t, takers
     
     def make_provider_array(self, maxq, num_providers, delta, mpi, alpha):
@@ -62,7 +158,7 @@ class Runner(object):
         actual_arr = default_arr[default_arr<=maxq]
         provider_size = np.random.choice(actual_arr, num_providers)
         t_delta_p = np.floor(np.random.exponential(1/alpha, num_providers)+1)*provider_size
-        providers_list = ['p%i' % i for i in range(num_providers)]
+        providers_list = [self._intern('p%i' % i) for i in range(num_providers)]
         if mpi==1:
             providers = np.array([Provider(p,i,mpi,delta) for p,i in zip(providers_list,provider_size)])
         else:
@@ -74,24 +170,43 @@ class Runner(object):
         actual_arr = default_arr[default_arr<=maxq]
         provider_size = np.random.choice(actual_arr, num_mms)
         t_delta_m = maxq
-        marketmakers_list = ['m%i' % i for i in range(num_mms)]
+        marketmakers_list = [self._intern('m%i' % i) for i in range(num_mms)]
         if mpi==1:
             marketmakers = np.array([MarketMaker(p,i,mpi,mm_delta,mm_quotes,mm_quote_range) for p,i in zip(marketmakers_list,provider_size)])
         else:
             marketmakers = np.array([MarketMaker5(p,i,mpi,mm_delta,mm_quotes,mm_quote_range) for p,i in zip(marketmakers_list,provider_size)])
         return t_delta_m, marketmakers
         
+    def make_populations(self, taker_maxq, num_takers, mu, market, provider_maxq, num_providers, delta, mpi, alpha,
+                         mm_maxq, num_mms, mm_quotes, mm_quote_range, mm_delta, prime1):
+        '''
+        Takers, Providers and MarketMakers as populations (struct of arrays) instead of trader objects,
+        with the sizes and arrival intervals of make_taker_array(), make_provider_array() and make_marketmaker_array()
+        '''
+        default_arr = np.array([1, 5, 10, 25, 50])
+        taker_size = np.random.choice(default_arr[default_arr<=taker_maxq], num_takers)
+        t_delta_t = np.floor(np.random.exponential(1/mu, num_takers)+1)*taker_size
+        takers = TakerPopulation([self._intern('t%i' % i) for i in range(num_takers)], taker_size, t_delta_t, market)
+        provider_size = np.random.choice(default_arr[default_arr<=provider_maxq], num_providers)
+        t_delta_p = np.floor(np.random.exponential(1/alpha, num_providers)+1)*provider_size
+        providers = ProviderPopulation([self._intern('p%i' % i) for i in range(num_providers)], provider_size,
+                                       t_delta_p, mpi, delta, prime1)
+        mm_size = np.random.choice(default_arr[default_arr<=mm_maxq], num_mms)
+        marketmakers = MarketMakerPopulation([self._intern('m%i' % i) for i in range(num_mms)], mm_size,
+                                             np.full(num_mms, mm_maxq), mpi, mm_delta, mm_quotes, mm_quote_range, prime1)
+        return takers, providers, marketmakers
+        
     def make_pennyjumper(self, mpi):
-        return PennyJumper('j0', 1, mpi)
+        return PennyJumper(self._intern('j0'), 1, mpi)
     
     def make_traders(self, num_takers, num_providers, num_mms):
-        takers_dict = dict(zip(['t%i' % i for i in range(num_takers)], list(self.taker_array)))
-        providers_dict = dict(zip(['p%i' % i for i in range(num_providers)], list(self.provider_array)))
+        takers_dict = dict(zip([self._intern('t%i' % i) for i in range(num_takers)], list(self.taker_array)))
+        providers_dict = dict(zip([self._intern('p%i' % i) for i in range(num_providers)], list(self.provider_array)))
         takers_dict.update(providers_dict)
-        marketmakers_dict = dict(zip(['m%i' % i for i in range(num_mms)], list(self.marketmaker_array)))
+        marketmakers_dict = dict(zip([self._intern('m%i' % i) for i in range(num_mms)], list(self.marketmaker_array)))
         takers_dict.update(marketmakers_dict)
         if self.alpha_pj > 0:
-            takers_dict.update({'j0': self.pennyjumper})
+            takers_dict.update({self._intern('j0'): self.pennyjumper})
         return takers_dict
     
     def make_providers(self, step):
@@ -99,38 +214,93 @@ class Runner(object):
         np.random.shuffle(providers)
         return providers
     
-    def make_both(self, step):
-        providers_mask = np.remainder(step, self.t_delta_p)==0
-        takers_mask = np.remainder(step, self.t_delta_t)==0
-        marketmakers_mask = np.remainder(step, self.t_delta_m)==0
-        providers = np.vstack((self.provider_array, providers_mask)).T
-        takers = np.vstack((self.taker_array, takers_mask)).T
-        marketmakers = np.vstack((self.marketmaker_array, marketmakers_mask)).T
-        traders = np.vstack((providers, marketmakers, takers[takers_mask]))
-        np.random.shuffle(traders)
-        return traders
+    def make_calendars(self, prime1, scheduled_cancels=False):
+        '''
+        Arrival calendars for the Takers, Providers and MarketMakers from prime1 on, for make_rows().
+        
+        With scheduled_cancels the Providers and MarketMakers draw their orders' lifetimes (schedule_cancels())
+        and note the steps they have cancels due in cancel_calendar, so make_rows() need not visit the others.
+        '''
+        self.taker_calendar = ArrivalCalendar(self.t_delta_t, prime1-1)
+        self.provider_calendar = ArrivalCalendar(self.t_delta_p, prime1-1)
+        self.marketmaker_calendar = ArrivalCalendar(np.full(len(self.marketmaker_array), self.t_delta_m), prime1-1)
+        self.cancel_calendar = None
+        if scheduled_cancels:
+            self.cancel_calendar = TimingWheel(prime1-1)
+            for trader in np.concatenate((self.provider_array, self.marketmaker_array)):
+                trader.schedule_cancels(prime1, self.cancel_calendar)
+    
+    def make_rows(self, step):
+        '''
+        The (trader, arrived) rows for step in random order: the arriving Takers, and the arriving Providers and
+        MarketMakers with every other Provider and MarketMaker (arrived False) for bulk_cancel() or, with
+        scheduled cancels, only those with cancels due.
+        num_acting is the number of traders acting in the step, whether or not they have a row: every
+        Provider and MarketMaker and the arriving Takers.
+        '''
+        providers = self.provider_calendar.arrivals(step)
+        marketmakers = self.marketmaker_calendar.arrivals(step)
+        takers = [(self.taker_array[i], True) for i in self.taker_calendar.arrivals(step)]
+        self.num_acting = len(self.provider_array) + len(self.marketmaker_array) + len(takers)
+        if self.cancel_calendar is None:
+            provider_rows = [[p, False] for p in self.provider_array]
+            for i in providers:
+                provider_rows[i][1] = True
+            marketmaker_rows = [[m, False] for m in self.marketmaker_array]
+            for i in marketmakers:
+                marketmaker_rows[i][1] = True
+            rows = provider_rows + marketmaker_rows + takers
+        else:
+            due = dict.fromkeys(self.cancel_calendar.pop(step), False)
+            due.update((self.provider_array[i], True) for i in providers)
+            due.update((self.marketmaker_array[i], True) for i in marketmakers)
+            rows = list(due.items()) + takers
+        np.random.shuffle(rows)
+        return rows
     
     def make_q_take(self, s, c_lambda):
-        noise = np.random.rand(2,self.run_steps)
-        qt_take = np.empty_like(noise)
-        qt_take[:,0] = 0.5
-        for i in range(1,self.run_steps):
-            qt_take[:,i] = qt_take[:,i-1] + (noise[:,i-1]>qt_take[:,i-1])*s - (noise[:,i-1]<qt_take[:,i-1])*s
-        lambda_t = -self.lambda0*(1 + (np.abs(qt_take[1] - 0.5)/np.sqrt(np.mean(np.square(qt_take[0] - 0.5))))*c_lambda)
-        return qt_take[1], lambda_t
+        return q_take_path(self.run_steps, s, self.lambda0, c_lambda)
+    
+    def _to_h5(self, key, temp_df):
+        '''Append to the store now or, with an async writer, on the writer thread.'''
+        if self.writer is None:
+            self.store.append(key, temp_df)
+        else:
+            self.writer.put(self.store, key, temp_df)
     
     def qtake_to_h5(self):
+        if self.q_stream is not None:
+            self.q_stream.finish()
+            return
         temp_df = pd.DataFrame({'qt_take': self.q_take, 'lambda_t': self.lambda_t})
-        temp_df.to_hdf(self.h5filename, 'qtl', append=True, format='table', complevel=5, complib='blosc')
+        self._to_h5('qtl', temp_df)
+        
+    def qtake_chunk_to_h5(self, start, q_take, lambda_t):
+        '''With stream_q_take, write each chunk of q_take and lambda_t as it is made'''
+        temp_df = pd.DataFrame({'qt_take': q_take, 'lambda_t': lambda_t}, index=np.arange(start, start+len(q_take)))
+        self._to_h5('qtl', temp_df)
         
     def mm_profitability_to_h5(self):
+        if isinstance(self.marketmaker_array, MarketMakerPopulation):
+            if len(self.marketmaker_array.cash_flow_collector):
+                self._to_h5('mmp', self.marketmaker_array.cash_flow_collector)
+            return
         for m in self.marketmaker_array:
             temp_df = pd.DataFrame(m.cash_flow_collector)
-            temp_df.to_hdf(self.h5filename, 'mmp', append=True, format='table', complevel=5, complib='blosc')
+            self._to_h5('mmp', temp_df)
+            
+    def traders_to_h5(self):
+        temp_df = pd.DataFrame({'trader_id': self.trader_names})
+        self._to_h5('traders', temp_df)
             
     def out_to_h5(self):
         self.qtake_to_h5()
         self.mm_profitability_to_h5()
+        if self.trader_names is not None:
+            self.traders_to_h5()
+        if self.instruments is not None:
+            for name, temp_df in self.instruments.report().items():
+                self._to_h5('instr_%s' % name, temp_df)
         
     def make_setup(self, prime1):
         top_of_book = self.exchange.report_top_of_book(0)
@@ -140,95 +310,146 @@ class Runner(object):
                 self.exchange.process_order(p.quote_collector[-1])
                 top_of_book = self.exchange.report_top_of_book(current_time)  
         
-    def run_mcs(self, prime1):
-        top_of_book = self.exchange.report_top_of_book(prime1)
-        for current_time in range(prime1, self.run_steps):
-            for row in self.make_both(current_time):
-                if row[0].trader_type == 'Provider':
-                    if row[1]:
-                        row[0].process_signal(current_time, top_of_book, self.q_provide, self.lambda_t[current_time])
-                        self.exchange.process_order(row[0].quote_collector[-1])
-                        top_of_book = self.exchange.report_top_of_book(current_time)
-                    row[0].bulk_cancel(current_time)
-                    if row[0].cancel_collector: # <---- Check permission versus forgiveness here and elsewhere - move to methods?
-                        for c in row[0].cancel_collector:
-                            self.exchange.process_order(c)
-                            if self.exchange.confirm_modify_collector: # <---- Check permission versus forgiveness here and elsewhere - move to methods?
-                                row[0].confirm_cancel_local(self.exchange.confirm_modify_collector[0])
-                        top_of_book = self.exchange.report_top_of_book(current_time)
-                elif row[0].trader_type == 'MarketMaker':
-                    if row[1]:
-                        row[0].process_signal(current_time, top_of_book, self.q_provide)
-                        for q in row[0].quote_collector:
-                            self.exchange.process_order(q)
-                        top_of_book = self.exchange.report_top_of_book(current_time)
-                    row[0].bulk_cancel(current_time)
-                    if row[0].cancel_collector: # <---- Check permission versus forgiveness here and elsewhere - move to methods?
-                        for c in row[0].cancel_collector:
-                            self.exchange.process_order(c)
-                            if self.exchange.confirm_modify_collector: # <---- Check permission versus forgiveness here and elsewhere - move to methods?
-                                row[0].confirm_cancel_local(self.exchange.confirm_modify_collector[0])
-                        top_of_book = self.exchange.report_top_of_book(current_time)
-                else:
-                    row[0].process_signal(current_time, self.q_take[current_time])
-                    self.exchange.process_order(row[0].quote_collector[-1])
-                    if self.exchange.traded: # <---- Check permission versus forgiveness here and elsewhere - move to methods?
-                        for c in self.exchange.confirm_trade_collector:
-                            trader = self.trader_dict[c['trader']]
-                            trader.confirm_trade_local(c)
-                        top_of_book = self.exchange.report_top_of_book(current_time)
-            if not np.remainder(current_time, 2000):
-                self.exchange.order_history_to_h5(self.h5filename)
-                self.exchange.sip_to_h5(self.h5filename)
+    def make_setup_population(self, prime1):
+        '''make_setup() for a ProviderPopulation: the arriving Providers quote in random order'''
+        providers = self.provider_array
+        top_of_book = self.exchange.report_top_of_book(0)
+        for current_time in range(1, prime1):
+            arriving = providers.prepare(current_time, self.q_provide, -self.lambda0)
+            np.random.shuffle(arriving)
+            for i in arriving.tolist():
+                self.exchange.process_order(providers.quote(i, current_time, top_of_book))
+                top_of_book = self.exchange.report_top_of_book(current_time)
                 
-    def run_mcsPJ(self, prime1):
+    def run_population(self, prime1, pj=False):
+        '''
+        run_mcs() for populations: each step only the Providers and MarketMakers arriving or with cancels due
+        and the arriving Takers act, in random order; their draws for the step are made together.
+        Rows are positions in the populations, not traders with a trader_type, so they are not sent through
+        HANDLERS: the draws are made in prepare() and a row only sends what they gave.
+        With pj the PennyJumper's arrivals (row -1) are drawn over every trader acting in the step,
+        as in run_mcs(), and go to pennyjumper_row().
+        '''
+        providers, marketmakers, takers = self.provider_array, self.marketmaker_array, self.taker_array
+        num_providers = len(providers)
+        num_traders = num_providers + len(marketmakers)
         top_of_book = self.exchange.report_top_of_book(prime1)
         for current_time in range(prime1, self.run_steps):
-            for row in self.make_both(current_time):
-                if row[0].trader_type == 'Provider':
-                    if row[1]:
-                        row[0].process_signal(current_time, top_of_book, self.q_provide, self.lambda_t[current_time])
-                        self.exchange.process_order(row[0].quote_collector[-1])
+            rows = np.concatenate((providers.prepare(current_time, self.q_provide, self.lambda_t[current_time]),
+                                   marketmakers.prepare(current_time, self.q_provide) + num_providers,
+                                   takers.prepare(current_time, self.q_take[current_time]) + num_traders))
+            np.random.shuffle(rows)
+            if pj:
+                num_acting = num_traders + np.count_nonzero(rows >= num_traders)
+                rows = np.insert(rows, self.pennyjumper_positions(len(rows), num_acting), -1)
+            for row in rows.tolist():
+                if row < 0:
+                    top_of_book = self.pennyjumper_row(self.pennyjumper, True, current_time, top_of_book)
+                elif row < num_providers:
+                    q = providers.quote(row, current_time, top_of_book)
+                    if q is not None:
+                        self.exchange.process_order(q)
                         top_of_book = self.exchange.report_top_of_book(current_time)
-                    row[0].bulk_cancel(current_time)
-                    if row[0].cancel_collector: # <---- Check permission versus forgiveness here and elsewhere - move to methods?
-                        for c in row[0].cancel_collector:
-                            self.exchange.process_order(c)
-                            if self.exchange.confirm_modify_collector: # <---- Check permission versus forgiveness here and elsewhere - move to methods?
-                                row[0].confirm_cancel_local(self.exchange.confirm_modify_collector[0])
+                    cancels = providers.cancels(row)
+                    if cancels:
+                        self.exchange.mass_cancel(current_time, providers.names[row], cancels)
                         top_of_book = self.exchange.report_top_of_book(current_time)
-                elif row[0].trader_type == 'MarketMaker':
-                    if row[1]:
-                        row[0].process_signal(current_time, top_of_book, self.q_provide)
-                        for q in row[0].quote_collector:
-                            self.exchange.process_order(q)
+                elif row < num_traders:
+                    row -= num_providers
+                    quotes = marketmakers.quote(row, current_time, top_of_book)
+                    if quotes:
+                        self.exchange.process_orders(quotes)
                         top_of_book = self.exchange.report_top_of_book(current_time)
-#                    row[0].bulk_cancel(self.delta*2, current_time, self.q_take[current_time])
-                    row[0].bulk_cancel(current_time)
-                    if row[0].cancel_collector: # <---- Check permission versus forgiveness here and elsewhere - move to methods?
-                        for c in row[0].cancel_collector:
-                            self.exchange.process_order(c)
-                            if self.exchange.confirm_modify_collector: # <---- Check permission versus forgiveness here and elsewhere - move to methods?
-                                row[0].confirm_cancel_local(self.exchange.confirm_modify_collector[0])
+                    cancels = marketmakers.cancels(row)
+                    if cancels:
+                        self.exchange.mass_cancel(current_time, marketmakers.names[row], cancels)
                         top_of_book = self.exchange.report_top_of_book(current_time)
                 else:
-                    row[0].process_signal(current_time, self.q_take[current_time])
-                    self.exchange.process_order(row[0].quote_collector[-1])
-                    if self.exchange.traded: # <---- Check permission versus forgiveness here and elsewhere - move to methods?
-                        for c in self.exchange.confirm_trade_collector:
-                            trader = self.trader_dict[c['trader']]
-                            trader.confirm_trade_local(c)
-                        top_of_book = self.exchange.report_top_of_book(current_time)
-                if random.uniform(0,1) < self.alpha_pj:
-                    self.pennyjumper.process_signal(current_time, top_of_book, self.q_take[current_time])
-                    if self.pennyjumper.cancel_collector:
-                        for c in self.pennyjumper.cancel_collector:
-                            self.exchange.process_order(c)
-                    if self.pennyjumper.quote_collector:
-                        for q in self.pennyjumper.quote_collector:
-                            self.exchange.process_order(q)
+                    self.exchange.process_order(takers.quote(row - num_traders, current_time))
                     top_of_book = self.exchange.report_top_of_book(current_time)
-            if not np.remainder(current_time, 2000):
-                self.exchange.order_history_to_h5(self.h5filename)
-                self.exchange.sip_to_h5(self.h5filename)
-    
+            self.end_step(current_time)
+        
+    def pennyjumper_positions(self, num_rows, num_acting):
+        '''
+        Where the PennyJumper's arrivals for a step go among num_rows rows: one draw (alpha_pj) for each of
+        the num_acting traders acting in the step, so the rate does not depend on how many of them have a row.
+        The positions are spread evenly over the rows; with a row per trader each arrival follows its trader.
+        '''
+        arrivals = np.flatnonzero(np.random.rand(num_acting) < self.alpha_pj)
+        return np.minimum(arrivals*num_rows//max(num_acting, 1) + 1, num_rows)
+        
+    def add_pennyjumper(self, rows, num_acting=None):
+        '''The PennyJumper's arrivals for a step, drawn together over num_acting traders (default: one per row)'''
+        num_acting = len(rows) if num_acting is None else num_acting
+        for k in self.pennyjumper_positions(len(rows), num_acting)[::-1].tolist():
+            rows.insert(k, (self.pennyjumper, True))
+        return rows
+        
+    def provider_row(self, trader, arrived, current_time, top_of_book):
+        if arrived:
+            trader.process_signal(current_time, top_of_book, self.q_provide, self.lambda_t[current_time])
+            self.exchange.process_order(trader.quote_collector[-1])
+            top_of_book = self.exchange.report_top_of_book(current_time)
+        trader.bulk_cancel(current_time)
+        if trader.cancel_collector:
+            self.exchange.mass_cancel(current_time, trader.trader_id, [q.order_id for q in trader.cancel_collector])
+            top_of_book = self.exchange.report_top_of_book(current_time)
+        return top_of_book
+        
+    def marketmaker_row(self, trader, arrived, current_time, top_of_book):
+        if arrived:
+            trader.process_signal(current_time, top_of_book, self.q_provide)
+            self.exchange.process_orders(trader.quote_collector)
+            top_of_book = self.exchange.report_top_of_book(current_time)
+        trader.bulk_cancel(current_time)
+        if trader.cancel_collector:
+            self.exchange.mass_cancel(current_time, trader.trader_id, [q.order_id for q in trader.cancel_collector])
+            top_of_book = self.exchange.report_top_of_book(current_time)
+        return top_of_book
+        
+    def taker_row(self, trader, arrived, current_time, top_of_book):
+        trader.process_signal(current_time, self.q_take[current_time])
+        self.exchange.process_order(trader.quote_collector[-1])
+        return self.exchange.report_top_of_book(current_time)
+        
+    def pennyjumper_row(self, trader, arrived, current_time, top_of_book):
+        trader.process_signal(current_time, top_of_book, self.q_take[current_time])
+        if trader.cancel_collector:
+            self.exchange.mass_cancel(current_time, trader.trader_id, [q.order_id for q in trader.cancel_collector])
+        if trader.quote_collector:
+            self.exchange.process_orders(trader.quote_collector)
+        return self.exchange.report_top_of_book(current_time)
+        
+    def end_step(self, current_time):
+        '''Record depth and write out the tables at their intervals'''
+        if self.depth_interval and not np.remainder(current_time, self.depth_interval):
+            self.exchange.record_depth(current_time)
+        if not np.remainder(current_time, 2000):
+            self.exchange.order_history_to_h5(self.store, self.writer)
+            self.exchange.sip_to_h5(self.store, self.writer)
+            if self.depth_interval:
+                self.exchange.depth_to_h5(self.store, self.writer)
+        
+    def run_mcs(self, prime1, pj=False):
+        '''
+        Each step the rows from make_rows() (and, with pj, the PennyJumper's arrivals) are handled in turn by
+        the HANDLERS entry for the trader's trader_type.
+        '''
+        handlers = HANDLERS
+        top_of_book = self.exchange.report_top_of_book(prime1)
+        for current_time in range(prime1, self.run_steps):
+            rows = self.make_rows(current_time)
+            if pj:
+                rows = self.add_pennyjumper(rows, self.num_acting)
+            for trader, arrived in rows:
+                top_of_book = handlers[trader.trader_type](self, trader, arrived, current_time, top_of_book)
+            self.end_step(current_time)
+                
+    def run_mcsPJ(self, prime1):
+        self.run_mcs(prime1, pj=True)
+
+
+# The row handler for each trader_type: handler(runner, trader, arrived, current_time, top_of_book) returns
+# the top of book. Register other agent types here.
+HANDLERS = {'Provider': Runner.provider_row, 'MarketMaker': Runner.marketmaker_row, 'Taker': Runner.taker_row,
+            'PennyJumper': Runner.pennyjumper_row}
@@ -65,8 +65,11 @@ def profit_to_list(h5in, outlist):
 
 def spread_to_list(h5in, outlist):
     indf = pd.read_hdf(h5in, 'tob')
-    indf = indf.assign(spread = indf.best_ask - indf.best_bid)
-    last_df = indf.groupby('timestamp').last()
+    # an empty side is recorded at price -1: there is no spread while it lasts
+    indf = indf.assign(spread = (indf.best_ask - indf.best_bid).where((indf.best_bid >= 0) & (indf.best_ask >= 0)))
+    last_df = indf.drop_duplicates('timestamp', keep='last').set_index('timestamp')
+    # tob only has a row when the inside changes: carry the inside forward to every timestamp
+    last_df = last_df.reindex(range(last_df.index.min(), last_df.index.max()+1), method='ffill')
     last_df = last_df.loc[50:]
     spread_dict = {'MCRun': j, 'Min': last_df.spread.min(), 'Max': last_df.spread.max(), 'Median': last_df.spread.median(),
                    'Mean': last_df.spread.mean()}
@@ -3,11 +3,28 @@ import time
 import numpy as np
 import pandas as pd
 
+from pyziabm.ids import decode_owners
 from pyziabm.runner2017mpi_r4 import Runner
+from pyziabm.storage import open_store
+
+def read_table(h5in, key):
+    '''
+    Read one table of a run from its h5 file or, with another storage backend, its directory;
+    h5in can also be the run's store itself (Runner(storage='memory') keeps the tables in runner.store)
+    '''
+    if not isinstance(h5in, str):
+        return h5in.read(key)
+    return open_store(h5in, storage).read(key)
+
+def trader_ids(h5in, order_ids):
+    '''Trader ids from string order ids or, for interned runs, integer order ids and the traders table'''
+    if order_ids.dtype == object:
+        return order_ids.str.split('_').str[0]
+    return decode_owners(order_ids, read_table(h5in, 'traders').trader_id)
 
 def participation_to_list(h5in, outlist):
-    trade_df = pd.read_hdf(h5in, 'trades')
-    trade_df = trade_df.assign(trader_id = trade_df.resting_order_id.str.split('_').str[0])
+    trade_df = read_table(h5in, 'trades')
+    trade_df = trade_df.assign(trader_id = trader_ids(h5in, trade_df.resting_order_id))
     lt_df = pd.DataFrame(trade_df.groupby(['trader_id']).quantity.count())
     lt_df.rename(columns={'quantity': 'trade'}, inplace=True)
     if 'p999999' in lt_df.index:
@@ -25,7 +42,7 @@ def participation_to_list(h5in, outlist):
     outlist.append(part_dict)
     
 def position_to_list(h5in, outlist):
-    mmcf_df = pd.read_hdf(h5in, 'mmp')
+    mmcf_df = read_table(h5in, 'mmp')
     market_makers = mmcf_df.mmid.unique()
     for mm in market_makers:
         pos_dict = {}
@@ -36,8 +53,8 @@ def position_to_list(h5in, outlist):
         outlist.append(pos_dict)
         
 def profit_to_list(h5in, outlist):
-    trade_df = pd.read_hdf(h5in, 'trades')
-    trade_df = trade_df.assign(trader_id = trade_df.resting_order_id.str.split('_').str[0])
+    trade_df = read_table(h5in, 'trades')
+    trade_df = trade_df.assign(trader_id = trader_ids(h5in, trade_df.resting_order_id))
     buy_trades = trade_df[trade_df.side=='buy']
     buy_trades = buy_trades.assign(BuyCashFlow = buy_trades.price*buy_trades.quantity)
     buy_trades = buy_trades.assign(BuyVol = buy_trades.groupby('trader_id').quantity.cumsum(),
@@ -60,16 +77,19 @@ def profit_to_list(h5in, outlist):
     outlist.append(temp_df)
         
 def spread_to_list(h5in, outlist):
-    indf = pd.read_hdf(h5in, 'tob')
-    indf = indf.assign(spread = indf.best_ask - indf.best_bid)
-    last_df = indf.groupby('timestamp').last()
+    indf = read_table(h5in, 'tob')
+    # an empty side is recorded at price -1: there is no spread while it lasts
+    indf = indf.assign(spread = (indf.best_ask - indf.best_bid).where((indf.best_bid >= 0) & (indf.best_ask >= 0)))
+    last_df = indf.drop_duplicates('timestamp', keep='last').set_index('timestamp')
+    # tob only has a row when the inside changes: carry the inside forward to every timestamp
+    last_df = last_df.reindex(range(last_df.index.min(), last_df.index.max()+1), method='ffill')
     last_df = last_df.loc[50:]
     spread_dict = {'MCRun': j, 'Min': last_df.spread.min(), 'Max': last_df.spread.max(), 'Median': last_df.spread.median(),
                    'Mean': last_df.spread.mean()}
     outlist.append(spread_dict)
     
 def tradesrets_to_list(h5in, outlist):
-    indf = pd.read_hdf(h5in, 'trades')
+    indf = read_table(h5in, 'trades')
     trades = indf.price.count()
     minprice = indf.price.min()
     maxprice = indf.price.max()
@@ -95,13 +115,13 @@ def tradesrets_to_list(h5in, outlist):
     outlist.append(returns_dict)
     
 def canceltrade_to_list(h5in, outlist1, outlist2):
-    order_df = pd.read_hdf(h5in, 'orders')
-    order_df = order_df.assign(trader_id = order_df.order_id.str.split('_').str[0])
+    order_df = read_table(h5in, 'orders')
+    order_df = order_df.assign(trader_id = trader_ids(h5in, order_df.order_id))
     lpsum_df = order_df.groupby(['trader_id','type']).quantity.sum().unstack(level=-1)
     lpsum_df.rename(columns={'add': 'add_vol', 'cancel': 'cancel_vol'}, inplace=True)
     
-    trade_df = pd.read_hdf(h5in, 'trades')
-    trade_df = trade_df.assign(trader_id = trade_df.resting_order_id.str.split('_').str[0])
+    trade_df = read_table(h5in, 'trades')
+    trade_df = trade_df.assign(trader_id = trader_ids(h5in, trade_df.resting_order_id))
     ltsum_df = pd.DataFrame(trade_df.groupby(['trader_id']).quantity.sum())
     ltsum_df.rename(columns={'quantity': 'trade_vol'}, inplace=True)
     
@@ -128,29 +148,31 @@ def canceltrade_to_list(h5in, outlist1, outlist2):
         outlist2.append(cto_dict)
         
 def lists_to_h5(participation_list, position_list, profit_list, spread_list, canceltrade_list, by_mm_list, returns_list, h5out):
+    store = open_store(h5out, storage)
     participation_df = pd.DataFrame(participation_list)
     participation_df.set_index('MCRun', inplace=True)
-    participation_df.to_hdf(h5out, 'participation', append=True, format='table', complevel=5, complib='blosc')
+    store.append('participation', participation_df)
     
     position_df = pd.DataFrame(position_list)
-    position_df.to_hdf(h5out, 'position', append=True, format='table', complevel=5, complib='blosc')
+    store.append('position', position_df)
     
     profit_df = pd.concat(profit_list)
-    profit_df.to_hdf(h5out, 'profit', append=True, format='table', complevel=5, complib='blosc')
+    store.append('profit', profit_df)
     
     spread_df = pd.DataFrame(spread_list)
     spread_df.set_index('MCRun', inplace=True)
-    spread_df.to_hdf(h5out, 'spread', append=True, format='table', complevel=5, complib='blosc')
+    store.append('spread', spread_df)
     
     returns_df = pd.DataFrame(returns_list)
     returns_df.set_index('MCRun', inplace=True)
-    returns_df.to_hdf(h5out, 'returns', append=True, format='table', complevel=5, complib='blosc')
+    store.append('returns', returns_df)
     
     cancel_trade_df = pd.DataFrame(canceltrade_list)
-    cancel_trade_df.to_hdf(h5out, 'cancel_trade', append=True, format='table', complevel=5, complib='blosc')
+    store.append('cancel_trade', cancel_trade_df)
 
     by_mm_df = pd.DataFrame(by_mm_list)
-    by_mm_df.to_hdf(h5out, 'by_mm', append=True, format='table', complevel=5, complib='blosc')
+    store.append('by_mm', by_mm_df)
+    store.close()
         
         
 participation_collector = []
@@ -183,6 +205,9 @@ mpi=1
 #h5filename='test.h5'  
 alpha_pj = 0.001
 pj = False
+storage = 'h5'
+in_memory = False # keep each run's tables in memory: no run files are written
+online_stats = False # summarise each run as its tables are written instead of reading them back
 trial_no = 1001
 end = 6
 
@@ -194,17 +219,29 @@ for j in range(1, end):
     random.seed(j)
     np.random.seed(j)
     h5_file = 'C:\\Users\\user\\Documents\\Agent-Based Models\\h5 files\\Trial %d\\smallcap_%d.h5' % (trial_no, j)
+    run_storage = 'memory' if in_memory else storage
     if pj:
-        market1 = Runner(alpha_pj=alpha_pj, h5filename=h5_file)
+        market1 = Runner(alpha_pj=alpha_pj, h5filename=h5_file, storage=run_storage, stats=online_stats)
     else:
-        market1 = Runner(c_lambda=c_lambda, mpi=mpi, h5filename=h5_file)
+        market1 = Runner(c_lambda=c_lambda, mpi=mpi, h5filename=h5_file, storage=run_storage, stats=online_stats)
+    run_tables = market1.store if in_memory else market1.h5filename
+#    market1.store.save(storage=storage) # to keep an in-memory run's tables
     
-    participation_to_list(market1.h5filename, participation_collector)
-    position_to_list(market1.h5filename, position_collector)
-    profit_to_list(market1.h5filename, profit_collector)
-    spread_to_list(market1.h5filename, spread_collector)
-    canceltrade_to_list(market1.h5filename, canceltrade_collector, by_mm_collector)
-    tradesrets_to_list(market1.h5filename, returns_collector)
+    if online_stats:
+        summary = market1.summary
+        participation_collector.append(dict(summary['participation'], MCRun=j))
+        position_collector.extend(dict(row, MCRun=j) for row in summary['position'])
+        spread_collector.append(dict(summary['spread'], MCRun=j))
+        canceltrade_collector.append(dict(summary['cancel_trade'], MCRun=j))
+        by_mm_collector.extend(dict(row, MCRun=j) for row in summary['by_mm'])
+        returns_collector.append(dict(summary['returns'], MCRun=j))
+    else:
+        participation_to_list(run_tables, participation_collector)
+        position_to_list(run_tables, position_collector)
+        spread_to_list(run_tables, spread_collector)
+        canceltrade_to_list(run_tables, canceltrade_collector, by_mm_collector)
+        tradesrets_to_list(run_tables, returns_collector)
+    profit_to_list(run_tables, profit_collector)
 #    os.remove(market1.h5filename)
     
     print('Run %d:  %.2f minutes' % (j, (time.time() - start)/60))
@@ -0,0 +1,147 @@
+import heapq
+import sys
+
+import numpy as np
+
+
+class TimingWheel(object):
+    '''
+    TimingWheel holds items until the step they are due.
+
+    The wheel is a ring of slots buckets, one per step for the next slots steps; items due
+    further ahead wait in an overflow dict and move onto the ring as it turns. schedule() and
+    pop() do constant work per item, so a step costs the items due then, not the items held.
+    Items due at the same step come out in the order they were scheduled.
+    Public attributes: step
+    Public methods: schedule(), pop() and len()
+    '''
+
+    def __init__(self, step=0, slots=256):
+        '''step is the last step popped: the first pop() returns items due after step'''
+        self.step = step
+        self._slots = slots
+        self._ring = [[] for _ in range(slots)]
+        self._overflow = {}
+        self._count = 0
+
+    def __len__(self):
+        return self._count
+
+    def schedule(self, due, item):
+        '''Hold item until step due; an item due at or before step is due at the next step'''
+        if due <= self.step:
+            due = self.step + 1
+        if due - self.step <= self._slots:
+            self._ring[due % self._slots].append(item)
+        else:
+            self._overflow.setdefault(due, []).append(item)
+        self._count += 1
+
+    def pop(self, step):
+        '''The items due after the last step popped, up to and including step, in due order'''
+        due = []
+        slots = self._slots
+        for s in range(self.step+1, step+1):
+            slot = s % slots
+            bucket = self._ring[slot]
+            if bucket:
+                due.extend(bucket)
+                bucket.clear()
+            later = self._overflow.pop(s+slots, None)
+            if later is not None:
+                self._ring[slot] = later
+        self.step = max(self.step, step)
+        self._count -= len(due)
+        return due
+
+
+class ArrivalCalendar(object):
+    '''
+    ArrivalCalendar gives the traders arriving at each step: trader i arrives at every multiple of
+    t_delta[i], as np.remainder(step, t_delta) == 0 did.
+
+    The next arrival of each trader is kept in a heap, so a step only touches the traders arriving.
+    Steps are asked for in increasing order; the arrivals of steps which are skipped are dropped.
+    Public attributes: t_delta
+    Public methods: arrivals()
+    '''
+
+    def __init__(self, t_delta, step=0):
+        '''step is the last step asked for: the first arrivals are after step'''
+        self.t_delta = [int(t) for t in t_delta]
+        self._heap = [((step//t + 1)*t, i) for i, t in enumerate(self.t_delta)]
+        heapq.heapify(self._heap)
+
+    def arrivals(self, step):
+        '''Positions of the traders arriving at step, in order'''
+        heap = self._heap
+        t_delta = self.t_delta
+        arriving = []
+        while heap and heap[0][0] <= step:
+            due, i = heap[0]
+            t = t_delta[i]
+            if due == step:
+                arriving.append(i)
+                heapq.heapreplace(heap, (due + t, i))
+            else:
+                # skipped steps: next arrival at or after step
+                heapq.heapreplace(heap, (-(-step//t)*t, i))
+        return arriving
+
+
+def lifetimes(delta, steps=20000, scheduled=False, seed=None):
+    '''
+    Cancel times of a Provider's orders: one order arrives each step and bulk_cancel() runs every
+    step, as in Runner.run_mcs(), either scanning the local_book or with scheduled lifetimes.
+
+    Returns the lifetimes (cancel step - arrival step) of the orders cancelled within steps.
+    '''
+    from pyziabm.trader2017_r3 import Provider # trader2017_r3 imports TimingWheel
+    if seed is not None:
+        np.random.seed(seed)
+    provider = Provider('p0', 1, 1, delta)
+    if scheduled:
+        provider.schedule_cancels(1)
+    top_of_book = {'best_bid': 999990, 'best_ask': 1000010}
+    cancelled = []
+    for step in range(1, steps+1):
+        provider.process_signal(step, top_of_book, 0.5, -100)
+        provider.bulk_cancel(step)
+        for q in provider.cancel_collector:
+            order = provider.local_book[q.order_id]
+            cancelled.append(step - order.timestamp)
+            order.leaves = 0
+            provider.confirm_cancel_local(q)
+    return np.array(cancelled)
+
+def validate_lifetimes(delta=0.025, steps=20000, seed=None):
+    '''
+    Compare the lifetimes under bulk_cancel() scans and scheduled lifetimes with each other and with the
+    geometric distribution P(k) = delta*(1-delta)**k, k = 0, 1, ...
+
+    Returns a dict: orders, mean and quantiles (p50, p90, p99) for each mode and the geometric, and
+    ks, the Kolmogorov-Smirnov distance between the two modes' lifetime distributions.
+    '''
+    scan = lifetimes(delta, steps, False, seed)
+    scheduled = lifetimes(delta, steps, True, None if seed is None else seed+1)
+    k = np.arange(max(scan.max(), scheduled.max())+1)
+    scan_cdf = np.searchsorted(np.sort(scan), k, side='right')/len(scan)
+    scheduled_cdf = np.searchsorted(np.sort(scheduled), k, side='right')/len(scheduled)
+    geometric_quantiles = [np.ceil(np.log(1-q)/np.log(1-delta)-1) for q in (0.5, 0.9, 0.99)]
+    return {'orders': {'scan': len(scan), 'scheduled': len(scheduled)},
+            'mean': {'scan': scan.mean(), 'scheduled': scheduled.mean(), 'geometric': (1-delta)/delta},
+            'quantiles': {'scan': np.percentile(scan, [50, 90, 99]).tolist(),
+                          'scheduled': np.percentile(scheduled, [50, 90, 99]).tolist(),
+                          'geometric': geometric_quantiles},
+            'ks': np.abs(scan_cdf - scheduled_cdf).max()}
+
+
+if __name__ == '__main__':
+
+    # python -m pyziabm.scheduler [delta] [steps]
+    delta = float(sys.argv[1]) if len(sys.argv) > 1 else 0.025
+    steps = int(sys.argv[2]) if len(sys.argv) > 2 else 20000
+    result = validate_lifetimes(delta, steps, seed=1)
+    for mode in ['scan', 'scheduled', 'geometric']:
+        print('{0:>10}: mean {1:.2f}, p50/p90/p99 {2}'.format(mode, result['mean'][mode], result['quantiles'][mode]))
+    print('orders {0}, KS distance {1:.4f}'.format(result['orders'], result['ks']))
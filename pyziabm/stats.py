@@ -0,0 +1,284 @@
+import numpy as np
+import pandas as pd
+
+from pyziabm.ids import OWNER_SHIFT
+
+
+def _column(rows, name):
+    '''One column of rows (a ColumnBuffer or a DataFrame) as an array'''
+    return rows.column(name) if hasattr(rows, 'to_frame') else rows[name].to_numpy()
+
+def _owners(order_ids):
+    '''Owners of an array of order ids: trader ids for string ids, trader numbers for interned ids'''
+    if order_ids.dtype == object:
+        return np.array([order_id.partition('_')[0] for order_id in order_ids.tolist()], dtype=object)
+    return np.asarray(order_ids, dtype=np.int64) >> OWNER_SHIFT
+
+def _add_by(totals, keys, values):
+    '''Add values into the totals dict by key'''
+    for key, value in pd.Series(values).groupby(keys, sort=False).sum().items():
+        totals[key] = totals.get(key, 0) + value
+
+
+class Moments(object):
+    '''
+    Moments keeps the count, mean and central moments (to the fourth) of a stream of values.
+
+    Chunks are summarised with NumPy and merged into the running moments with the pairwise update
+    of Chan et al. and Pebay, so the stream is read once and never held. NaN values are skipped.
+    std(), skew() and kurtosis() are the sample statistics pandas reports.
+    Public attributes: count, mean
+    Public methods: add(), std(), skew(), kurtosis()
+    '''
+
+    def __init__(self):
+        self.count = 0
+        self.mean = 0.0
+        self._m2 = 0.0
+        self._m3 = 0.0
+        self._m4 = 0.0
+
+    def add(self, values):
+        values = np.asarray(values, dtype=float)
+        values = values[~np.isnan(values)]
+        n_b = len(values)
+        if not n_b:
+            return
+        mean_b = values.mean()
+        d = values - mean_b
+        m2_b, m3_b, m4_b = (d*d).sum(), (d**3).sum(), (d**4).sum()
+        n_a, n = self.count, self.count + n_b
+        delta = mean_b - self.mean
+        m2, m3 = self._m2, self._m3
+        self._m4 = (self._m4 + m4_b + delta**4*n_a*n_b*(n_a*n_a - n_a*n_b + n_b*n_b)/n**3
+                    + 6*delta**2*(n_a*n_a*m2_b + n_b*n_b*m2)/n**2 + 4*delta*(n_a*m3_b - n_b*m3)/n)
+        self._m3 = m3 + m3_b + delta**3*n_a*n_b*(n_a - n_b)/n**2 + 3*delta*(n_a*m2_b - n_b*m2)/n
+        self._m2 = m2 + m2_b + delta**2*n_a*n_b/n
+        self.mean += delta*n_b/n
+        self.count = n
+
+    def std(self):
+        return np.sqrt(self._m2/(self.count - 1)) if self.count > 1 else np.nan
+
+    def skew(self):
+        n = self.count
+        if n < 3 or not self._m2:
+            return np.nan
+        return np.sqrt(n*(n - 1))/(n - 2)*(self._m3/n)/(self._m2/n)**1.5
+
+    def kurtosis(self):
+        n = self.count
+        if n < 4 or not self._m2:
+            return np.nan
+        g2 = (self._m4/n)/(self._m2/n)**2 - 3
+        return (n - 1)/((n - 2)*(n - 3))*((n + 1)*g2 + 6)
+
+
+class LagAutocorrelation(object):
+    '''
+    LagAutocorrelation keeps, for lags 1 to max_lag, the sums the correlation of a stream with itself
+    lagged needs, as pandas Series.autocorr() computes it (pairs with a NaN are skipped).
+
+    Only the last max_lag values are held, so memory does not grow with the stream.
+    Public attributes: max_lag
+    Public methods: add(), autocorr()
+    '''
+
+    def __init__(self, max_lag=50):
+        '''_sums holds n, sum x, sum y, sum xx, sum yy and sum xy for each lag (x the later value)'''
+        self.max_lag = max_lag
+        self._tail = np.empty(0)
+        self._sums = np.zeros((6, max_lag))
+
+    def add(self, values):
+        values = np.asarray(values, dtype=float)
+        joined = np.concatenate((self._tail, values))
+        start = len(self._tail)
+        for lag in range(1, self.max_lag + 1):
+            first = max(start, lag)
+            if first >= len(joined):
+                break
+            x = joined[first:]
+            y = joined[first-lag:len(joined)-lag]
+            keep = ~(np.isnan(x) | np.isnan(y))
+            x, y = x[keep], y[keep]
+            self._sums[:, lag-1] += (len(x), x.sum(), y.sum(), (x*x).sum(), (y*y).sum(), (x*y).sum())
+        self._tail = joined[-self.max_lag:]
+
+    def autocorr(self):
+        '''The autocorrelation at lags 1 to max_lag, as an array'''
+        n, sx, sy, sxx, syy, sxy = self._sums
+        with np.errstate(divide='ignore', invalid='ignore'):
+            return (n*sxy - sx*sy)/np.sqrt((n*sxx - sx*sx)*(n*syy - sy*sy))
+
+
+class RunStats(object):
+    '''
+    RunStats computes a run's summary statistics as its tables are written, instead of reading the tables back.
+
+    update() takes each append to the orders, trades, tob and mmp tables (StatsStore passes them on), so
+    the run's rows are seen once, a chunk at a time, and only running totals are kept: per-trader volumes,
+    the trade return moments and lag autocorrelations, the spread held at each step and MM positions.
+    Statistics are folded in per flushed chunk, when a table is appended (every 2000 steps in the Runner),
+    not per trade or change to the inside; the totals at the end of the run are the same.
+    Spreads are multiples of the tick, so instead of a streaming quantile sketch the steps at each spread
+    are counted: memory grows with the number of distinct spreads, not the run length, and the median is exact.
+    summary() returns the dicts the runwrapper's *_to_list() functions build.
+    Public attributes: spread_start, max_lag
+    Public methods: update(), summary()
+    '''
+
+    def __init__(self, spread_start=50, max_lag=50):
+        '''
+        spread_start is the first step in the spread statistics. _steps counts the steps at each spread;
+        _inside is the (timestamp, spread) of the last tob row, held until the next row shows how long it lasted;
+        the spread is None while a side is empty (price -1 in the tob table) and those steps are not counted
+        '''
+        self.spread_start = spread_start
+        self.max_lag = max_lag
+        self._add_vol = {}
+        self._cancel_vol = {}
+        self._trade_vol = {}
+        self._trades = 0
+        self._prices = [np.inf, -np.inf]
+        self._last_price = None
+        self._returns = Moments()
+        self._autocorr = LagAutocorrelation(max_lag)
+        self._abs_autocorr = LagAutocorrelation(max_lag)
+        self._steps = {}
+        self._inside = None
+        self._positions = {}
+
+    def update(self, key, rows):
+        '''Take an append of rows (a ColumnBuffer or a DataFrame) to the key table'''
+        if not len(rows):
+            return
+        if key == 'orders':
+            self._update_orders(rows)
+        elif key == 'trades':
+            self._update_trades(rows)
+        elif key == 'tob':
+            self._update_tob(rows)
+        elif key == 'mmp':
+            self._update_mmp(rows)
+
+    def _update_orders(self, rows):
+        owners = _owners(_column(rows, 'order_id'))
+        types = _column(rows, 'type')
+        quantity = _column(rows, 'quantity')
+        for order_type, totals in (('add', self._add_vol), ('cancel', self._cancel_vol)):
+            mask = types == order_type
+            _add_by(totals, owners[mask], quantity[mask])
+
+    def _update_trades(self, rows):
+        owners = _owners(_column(rows, 'resting_order_id'))
+        quantity = _column(rows, 'quantity')
+        _add_by(self._trade_vol, owners, quantity)
+        prices = _column(rows, 'price')
+        self._trades += len(prices)
+        self._prices = [min(self._prices[0], prices.min()), max(self._prices[1], prices.max())]
+        prices = prices.astype(float)
+        before = np.concatenate(([np.nan if self._last_price is None else self._last_price], prices[:-1]))
+        returns = 100*(prices/before - 1)
+        self._last_price = prices[-1]
+        self._returns.add(returns)
+        self._autocorr.add(returns)
+        self._abs_autocorr.add(np.abs(returns))
+
+    def _hold(self, spread, first, last):
+        '''Count the steps first to last (from spread_start) at spread'''
+        steps = last - max(first, self.spread_start) + 1
+        if steps > 0 and spread is not None:
+            self._steps[spread] = self._steps.get(spread, 0) + steps
+
+    def _update_tob(self, rows):
+        timestamps = _column(rows, 'timestamp')
+        best_bid = _column(rows, 'best_bid')
+        best_ask = _column(rows, 'best_ask')
+        spreads = best_ask - best_bid
+        one_sided = (best_bid < 0) | (best_ask < 0)
+        # the last row of each timestamp
+        last = np.flatnonzero(np.append(timestamps[1:] != timestamps[:-1], True))
+        for timestamp, spread, empty in zip(timestamps[last].tolist(), spreads[last].tolist(), one_sided[last].tolist()):
+            if self._inside is not None and timestamp > self._inside[0]:
+                self._hold(self._inside[1], self._inside[0], timestamp - 1)
+            self._inside = (timestamp, None if empty else spread)
+
+    def _update_mmp(self, rows):
+        mmids = _column(rows, 'mmid')
+        positions = pd.Series(_column(rows, 'position')).groupby(mmids, sort=False).agg(['min', 'max'])
+        for mmid, low, high in positions.itertuples():
+            held = self._positions.get(mmid, (low, high))
+            self._positions[mmid] = (min(held[0], low), max(held[1], high))
+
+    def _spread(self):
+        steps = dict(self._steps)
+        if self._inside is not None and self._inside[1] is not None and self._inside[0] >= self.spread_start:
+            steps[self._inside[1]] = steps.get(self._inside[1], 0) + 1
+        if not steps:
+            return {'Min': np.nan, 'Max': np.nan, 'Median': np.nan, 'Mean': np.nan}
+        spreads = np.array(sorted(steps), dtype=float)
+        counts = np.array([steps[s] for s in sorted(steps)])
+        total = counts.sum()
+        cumulative = np.cumsum(counts)
+        low = spreads[np.searchsorted(cumulative, (total - 1)//2, side='right')]
+        high = spreads[np.searchsorted(cumulative, total//2, side='right')]
+        return {'Min': spreads[0], 'Max': spreads[-1], 'Median': (low + high)/2, 'Mean': (spreads*counts).sum()/total}
+
+    def summary(self, run=None, trader_names=None):
+        '''
+        The run's statistics as the runwrapper builds them: a dict of participation, position (list of dicts),
+        spread, returns, cancel_trade and by_mm (list of dicts) entries, each with MCRun run.
+        trader_names maps the trader numbers of interned ids back to trader ids.
+        '''
+        with np.errstate(divide='ignore', invalid='ignore'):
+            def name(owner):
+                return owner if trader_names is None else trader_names[owner]
+            trade_vol = {name(owner): vol for owner, vol in self._trade_vol.items()}
+            add_vol = {name(owner): vol for owner, vol in self._add_vol.items()}
+            cancel_vol = {name(owner): vol for owner, vol in self._cancel_vol.items()}
+            total_vol = sum(trade_vol.values())
+            participation = {'MCRun': run}
+            for trader, label in (('m0', 'MM_Participation'), ('j0', 'PJ_Participation')):
+                if trader in trade_vol:
+                    participation[label] = 100*trade_vol[trader]/total_vol
+            position = [{'MCRun': run, 'MarketMaker': mmid, 'Min': low, 'Max': high}
+                        for mmid, (low, high) in self._positions.items()]
+            spread = dict(self._spread(), MCRun=run)
+            autocorr = self._autocorr.autocorr()
+            abs_autocorr = self._abs_autocorr.autocorr()
+            returns = {'Trades': self._trades, 'MinPrice': self._prices[0], 'MaxPrice': self._prices[1],
+                       'ClusteringConstant': np.abs(np.nansum(abs_autocorr)/np.nansum(autocorr)),
+                       'MeanRet': self._returns.mean if self._returns.count else np.nan, 'StdRet': self._returns.std(),
+                       'SkewRet': self._returns.skew(), 'KurtosisRet': self._returns.kurtosis(), 'MCRun': run}
+            # traders with trades, as canceltrade_to_list()
+            traded_add = np.nansum([add_vol.get(trader, np.nan) for trader in trade_vol])
+            traded_cancel = np.nansum([cancel_vol.get(trader, np.nan) for trader in trade_vol])
+            cancel_trade = {'total_trade_to_order_vol': 100*total_vol/traded_add,
+                            'total_cancel_to_trade_vol': traded_cancel/total_vol, 'MCRun': run}
+            by_mm = [{'MCRun': run, 'MarketMaker': trader,
+                      'CancelToTrade': cancel_vol.get(trader, np.nan)/trade_vol[trader],
+                      'TradeToOrderPct': 100*trade_vol[trader]/add_vol.get(trader, np.nan)}
+                     for trader in sorted(trade_vol) if trader.startswith('m') or trader.startswith('j')]
+        return {'participation': participation, 'position': position, 'spread': spread, 'returns': returns,
+                'cancel_trade': cancel_trade, 'by_mm': by_mm}
+
+
+class StatsStore(object):
+    '''
+    StatsStore passes each append to a RunStats before the storage backend it wraps, so a run's statistics
+    are kept up to date as its tables are written; everything else goes to the wrapped store.
+    Public attributes: stats, store
+    Public methods: append() and those of the wrapped store
+    '''
+
+    def __init__(self, store, stats):
+        self.store = store
+        self.stats = stats
+
+    def __getattr__(self, name):
+        return getattr(self.store, name)
+
+    def append(self, key, rows, **kwargs):
+        self.stats.update(key, rows)
+        self.store.append(key, rows, **kwargs)
@@ -0,0 +1,321 @@
+import os
+import struct
+
+import numpy as np
+import pandas as pd
+
+
+def append_h5(filename, key, rows, **kwargs):
+    '''Append rows (a ColumnBuffer or a DataFrame) to the key table in an h5 file'''
+    temp_df = rows.to_frame() if hasattr(rows, 'to_frame') else rows
+    temp_df.to_hdf(filename, key, append=True, format='table', complevel=5, complib='blosc', **kwargs)
+
+def _columns(rows):
+    '''(name, array) pairs from a ColumnBuffer or a DataFrame; a named index is kept as a column'''
+    if hasattr(rows, 'to_frame'):
+        return [(name, rows.column(name)) for name in rows.names]
+    if rows.index.name is not None:
+        rows = rows.reset_index()
+    return [(name, rows[name].to_numpy()) for name in rows.columns]
+
+def _arrow_table(rows):
+    import pyarrow as pa
+    columns = _columns(rows)
+    return pa.table([pa.array(array) for _, array in columns], names=[name for name, _ in columns])
+
+def _new_part(table_path, suffix):
+    '''The next part file in a table directory: part-00000<suffix>, part-00001<suffix>, ...'''
+    os.makedirs(table_path, exist_ok=True)
+    parts = [f for f in os.listdir(table_path) if f.startswith('part-') and f.endswith(suffix)]
+    return os.path.join(table_path, 'part-%05d%s' % (len(parts), suffix))
+
+def _parts(table_path, suffix):
+    return [os.path.join(table_path, f) for f in sorted(os.listdir(table_path)) if f.endswith(suffix)]
+
+
+class H5Store(object):
+    '''
+    H5Store appends tables to one h5 file: PyTables table format, blosc compression.
+
+    This is the default storage; each append is a DataFrame to_hdf().
+    Public attributes: path
+    Public methods: append(), read(), read_chunks() and close()
+    '''
+
+    def __init__(self, path):
+        self.path = path
+
+    def append(self, key, rows, **kwargs):
+        '''Append rows (a ColumnBuffer or a DataFrame) to the key table; kwargs go to to_hdf()'''
+        append_h5(self.path, key, rows, **kwargs)
+
+    def read(self, key):
+        '''The key table as a DataFrame'''
+        return pd.read_hdf(self.path, key)
+
+    def read_chunks(self, key, chunksize):
+        '''The key table as DataFrames of up to chunksize rows'''
+        with pd.HDFStore(self.path, 'r') as store:
+            for chunk in store.select(key, chunksize=chunksize):
+                yield chunk
+
+    def close(self):
+        pass
+
+
+class ParquetStore(object):
+    '''
+    ParquetStore writes each table to Parquet files in <path>/<key>/: one file per ParquetStore
+    (so a later store appends a new part), one row group per append.
+
+    The Parquet files are complete once close() is called. Requires pyarrow.
+    Public attributes: path
+    Public methods: append(), read(), read_chunks() and close()
+    '''
+
+    def __init__(self, path):
+        import pyarrow.parquet
+        self._pq = pyarrow.parquet
+        self.path = path
+        self._writers = {}
+        os.makedirs(path, exist_ok=True)
+
+    def append(self, key, rows, **kwargs):
+        '''Append rows (a ColumnBuffer or a DataFrame) to the key table; kwargs are ignored'''
+        if not len(rows):
+            return
+        table = _arrow_table(rows)
+        writer = self._writers.get(key)
+        if writer is None:
+            writer = self._writers[key] = self._pq.ParquetWriter(_new_part(os.path.join(self.path, key), '.parquet'),
+                                                                 table.schema, compression='zstd')
+        writer.write_table(table)
+
+    def read(self, key):
+        '''The key table as a DataFrame'''
+        parts = _parts(os.path.join(self.path, key), '.parquet')
+        return self._pq.ParquetDataset(parts).read().to_pandas()
+
+    def read_chunks(self, key, chunksize):
+        '''The key table as DataFrames of up to chunksize rows'''
+        for part in _parts(os.path.join(self.path, key), '.parquet'):
+            for batch in self._pq.ParquetFile(part).iter_batches(chunksize):
+                yield batch.to_pandas()
+
+    def close(self):
+        '''Finish the Parquet files'''
+        for writer in self._writers.values():
+            writer.close()
+        self._writers.clear()
+
+
+class ArrowStore(object):
+    '''
+    ArrowStore writes each table to Arrow IPC files in <path>/<key>/: one file per ArrowStore
+    (so a later store appends a new part), one record batch per append. Reads memory map the files.
+
+    The files are complete once close() is called. Requires pyarrow.
+    Public attributes: path
+    Public methods: append(), read(), read_chunks() and close()
+    '''
+
+    def __init__(self, path):
+        import pyarrow
+        self._pa = pyarrow
+        self.path = path
+        self._writers = {}
+        os.makedirs(path, exist_ok=True)
+
+    def append(self, key, rows, **kwargs):
+        '''Append rows (a ColumnBuffer or a DataFrame) to the key table; kwargs are ignored'''
+        if not len(rows):
+            return
+        table = _arrow_table(rows)
+        writer = self._writers.get(key)
+        if writer is None:
+            writer = self._writers[key] = self._pa.ipc.new_file(_new_part(os.path.join(self.path, key), '.arrow'),
+                                                                table.schema)
+        writer.write_table(table)
+
+    def read(self, key):
+        '''The key table as a DataFrame'''
+        tables = []
+        for part in _parts(os.path.join(self.path, key), '.arrow'):
+            with self._pa.memory_map(part) as source:
+                tables.append(self._pa.ipc.open_file(source).read_all())
+        return self._pa.concat_tables(tables).to_pandas()
+
+    def read_chunks(self, key, chunksize):
+        '''The key table as DataFrames of up to chunksize rows'''
+        for part in _parts(os.path.join(self.path, key), '.arrow'):
+            with self._pa.memory_map(part) as source:
+                for batch in self._pa.ipc.open_file(source).read_all().to_batches(chunksize):
+                    yield batch.to_pandas()
+
+    def close(self):
+        '''Finish the Arrow files'''
+        for writer in self._writers.values():
+            writer.close()
+        self._writers.clear()
+
+
+class NpyStore(object):
+    '''
+    NpyStore writes each column of a table to <path>/<key>/<column>.npy, so columns can be
+    memory mapped with np.load(..., mmap_mode='r').
+
+    Appends write the raw column data to the end of each file and rewrite the fixed-size .npy
+    header with the new length, so the files are valid after every append and a later
+    NpyStore appends to them.
+    Strings are stored as fixed-width unicode: the width is the larger of min_itemsize (if given),
+    16 and the longest string in the first append; a longer string later raises a ValueError.
+    Public attributes: path
+    Public methods: append(), read(), read_chunks(), column() and close()
+    '''
+    HEADER_SIZE = 128
+
+    def __init__(self, path):
+        self.path = path
+        self._tables = {}
+        os.makedirs(path, exist_ok=True)
+
+    def _header(self, dtype, length):
+        header = "{'descr': %r, 'fortran_order': False, 'shape': (%d,), }" % (np.lib.format.dtype_to_descr(dtype), length)
+        header = header.ljust(self.HEADER_SIZE - 11) + '\n'
+        return b'\x93NUMPY\x01\x00' + struct.pack('<H', len(header)) + header.encode('latin1')
+
+    def _open(self, key, columns, min_itemsize):
+        '''Resume the key table or start it: fix each column's dtype and write empty .npy files'''
+        table_path = os.path.join(self.path, key)
+        if os.path.exists(os.path.join(table_path, 'columns')):
+            arrays = [self.column(key, name) for name, _ in columns]
+            table = self._tables[key] = {'path': table_path, 'dtypes': [a.dtype for a in arrays],
+                                         'length': len(arrays[0])}
+            return table
+        os.makedirs(table_path, exist_ok=True)
+        dtypes = []
+        for name, array in columns:
+            if array.dtype == object:
+                longest = max((len(s) for s in array), default=0)
+                dtypes.append(np.dtype('U%d' % max(min_itemsize.get(name, 0), 16, longest)))
+            else:
+                dtypes.append(array.dtype)
+        with open(os.path.join(table_path, 'columns'), 'w') as f:
+            f.write('\n'.join(name for name, _ in columns))
+        for (name, _), dtype in zip(columns, dtypes):
+            with open(os.path.join(table_path, name + '.npy'), 'wb') as f:
+                f.write(self._header(dtype, 0))
+        table = self._tables[key] = {'path': table_path, 'dtypes': dtypes, 'length': 0}
+        return table
+
+    def append(self, key, rows, min_itemsize=None, **kwargs):
+        '''Append rows (a ColumnBuffer or a DataFrame) to the key table; other kwargs are ignored'''
+        if not len(rows):
+            return
+        columns = _columns(rows)
+        table = self._tables.get(key)
+        if table is None:
+            table = self._open(key, columns, min_itemsize or {})
+        length = table['length'] + len(rows)
+        for (name, array), dtype in zip(columns, table['dtypes']):
+            if dtype.kind == 'U':
+                if max(len(s) for s in array) > dtype.itemsize//4:
+                    raise ValueError('NpyStore: a string in {0}.{1} is longer than {2}'.format(key, name, dtype))
+            with open(os.path.join(table['path'], name + '.npy'), 'r+b') as f:
+                f.write(self._header(dtype, length))
+                f.seek(0, os.SEEK_END)
+                f.write(np.ascontiguousarray(array, dtype=dtype).tobytes())
+        table['length'] = length
+
+    def column(self, key, name):
+        '''One column of the key table, memory mapped'''
+        return np.load(os.path.join(self.path, key, name + '.npy'), mmap_mode='r')
+
+    def _names(self, key):
+        with open(os.path.join(self.path, key, 'columns')) as f:
+            return f.read().split('\n')
+
+    def read(self, key):
+        '''The key table as a DataFrame'''
+        names = self._names(key)
+        return pd.DataFrame({name: self.column(key, name) for name in names}, columns=names)
+
+    def read_chunks(self, key, chunksize):
+        '''The key table as DataFrames of up to chunksize rows, sliced from the memory mapped columns'''
+        names = self._names(key)
+        columns = [self.column(key, name) for name in names]
+        for start in range(0, len(columns[0]), chunksize):
+            yield pd.DataFrame({name: np.asarray(column[start:start+chunksize]) for name, column in zip(names, columns)},
+                               columns=names)
+
+    def close(self):
+        self._tables.clear()
+
+
+class MemoryStore(object):
+    '''
+    MemoryStore keeps each table in memory as the DataFrames appended, with no file at all.
+
+    A run with Runner(storage='memory') hands its tables straight to the analysis functions; read() joins
+    the appends once and keeps the result, so reading a table several times costs one concatenation.
+    save() writes the tables to another backend when they are to be kept.
+    Public attributes: path
+    Public methods: append(), read(), read_chunks(), keys(), save() and close()
+    '''
+
+    def __init__(self, path=None):
+        '''path is only where save() writes by default'''
+        self.path = path
+        self._tables = {}
+
+    def append(self, key, rows, **kwargs):
+        '''Append a copy of rows (a ColumnBuffer or a DataFrame) to the key table; kwargs are ignored'''
+        if not len(rows):
+            return
+        temp_df = rows.to_frame() if hasattr(rows, 'to_frame') else rows
+        self._tables.setdefault(key, []).append(temp_df.copy())
+
+    def read(self, key):
+        '''The key table as a DataFrame (shared with later reads: assign() rather than change it in place)'''
+        frames = self._tables[key]
+        if len(frames) > 1:
+            frames[:] = [pd.concat(frames)]
+        return frames[0]
+
+    def read_chunks(self, key, chunksize):
+        '''The key table as DataFrames of up to chunksize rows'''
+        for frame in self._tables[key]:
+            for start in range(0, len(frame), chunksize):
+                yield frame.iloc[start:start+chunksize]
+
+    def keys(self):
+        return list(self._tables)
+
+    def save(self, path=None, storage='h5'):
+        '''Write every table to a storage backend (at path, or the MemoryStore's path); returns it'''
+        store = open_store(self.path if path is None else path, storage)
+        for key in self._tables:
+            store.append(key, self.read(key))
+        store.close()
+        return store
+
+    def close(self):
+        pass
+
+
+STORES = {'h5': H5Store, 'parquet': ParquetStore, 'arrow': ArrowStore, 'npy': NpyStore, 'memory': MemoryStore}
+
+def open_store(path, storage='h5'):
+    '''
+    Open a storage backend for a run: 'h5' (an h5 file at path), 'parquet', 'arrow' or 'npy'
+    (a directory at path with one file per table or column), or 'memory' (no files)
+    '''
+    try:
+        store = STORES[storage]
+    except KeyError:
+        raise ValueError('storage must be one of {0}'.format(sorted(STORES)))
+    return store(path)
+
+def as_store(target):
+    '''A storage backend from an h5 file name or a storage backend'''
+    return H5Store(target) if isinstance(target, str) else target
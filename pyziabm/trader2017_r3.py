@@ -1,14 +1,19 @@
+import numbers
 import random
 import numpy as np
 
+from pyziabm.ids import make_order_id, sequence_of, sequence_of_str
+from pyziabm.orderbook3 import Order
+from pyziabm.scheduler import TimingWheel
+
 
 class ZITrader(object):
     '''
-    ZITrader generates quotes (dicts) based on mechanical probabilities.
+    ZITrader generates quotes (Orders) based on mechanical probabilities.
     
     A general base class for specific trader types.
-    Public attributes: quote_collector
-    Public methods: none
+    Public attributes: quote_collector, trader_id
+    Public methods: restore_order
     '''
 
     def __init__(self, name, maxq):
@@ -16,21 +21,38 @@ class ZITrader(object):
         Initialize ZITrader with some base class attributes and a method
         
         quote_collector is a public container for carrying quotes to the exchange
+        If name is an integer (interned ids; Python or NumPy), order ids are ints with name in the high bits.
         '''
         self._trader_id = name # trader id
         self._max_quantity = maxq
         self.quote_collector = []
         self._quote_sequence = 0
+        self._order_id_base = make_order_id(int(name), 0) if isinstance(name, numbers.Integral) else None
         
     def __repr__(self):
         return 'Trader({0}, {1})'.format(self._trader_id, self._max_quantity)
+
+    @property
+    def trader_id(self):
+        '''The trader's name (or number, with interned ids)'''
+        return self._trader_id
         
     def _make_add_quote(self, time, quantity, side, price):
-        '''Make one add quote (dict)'''
+        '''Make one add quote (Order)'''
         self._quote_sequence += 1
-        order_id = '%s_%d' % (self._trader_id, self._quote_sequence)
-        return {'order_id': order_id, 'timestamp': time, 'type': 'add', 'quantity': quantity, 
-                'side': side, 'price': price}
+        if self._order_id_base is None:
+            order_id = '%s_%d' % (self._trader_id, self._quote_sequence)
+        else:
+            order_id = self._order_id_base + self._quote_sequence
+        return Order(order_id, time, 'add', quantity, side, price)
+
+    def restore_order(self, order):
+        '''Take back a resting order (Order) from a restored Orderbook; new order ids follow its sequence'''
+        if self._order_id_base is None:
+            sequence = sequence_of_str(order.order_id)
+        else:
+            sequence = sequence_of(order.order_id)
+        self._quote_sequence = max(self._quote_sequence, sequence)
         
 
 class PennyJumper(ZITrader):
@@ -39,7 +61,7 @@ class PennyJumper(ZITrader):
     
     Subclass of ZITrader
     Public attributes: trader_type, quote_collector (from ZITrader), cancel_collector
-    Public methods: confirm_trade_local (from ZITrader)
+    Public methods: confirm_trade_local (from ZITrader), restore_order
     '''
     
     def __init__(self, name, maxq, mpi):
@@ -61,8 +83,15 @@ class PennyJumper(ZITrader):
         return 'Trader({0}, {1}, {2}, {3})'.format(self._trader_id, self._max_quantity, self._mpi, self.trader_type)
     
     def _make_cancel_quote(self, q, time):
-        return {'type': 'cancel', 'timestamp': time, 'order_id': q['order_id'], 'quantity': q['quantity'],
-                'side': q['side'], 'price': q['price']}
+        return Order(q.order_id, time, 'cancel', q.leaves, q.side, q.price)
+
+    def restore_order(self, order):
+        '''Take back a resting quote (Order) from a restored Orderbook'''
+        ZITrader.restore_order(self, order)
+        if order.side == 'buy':
+            self._bid_quote = order
+        else:
+            self._ask_quote = order
 
     def confirm_trade_local(self, confirm):
         '''PJ has at most one bid and one ask outstanding - if it executes, set price None'''
@@ -81,7 +110,7 @@ class PennyJumper(ZITrader):
             # q_taker > 0.5 implies greater probability of a buy order; PJ jumps the bid
             if random.uniform(0,1) < q_taker:
                 if self._bid_quote: # check if not alone at the bid
-                    if self._bid_quote['price'] < qsignal['best_bid'] or self._bid_quote['quantity'] < qsignal['bid_size']:
+                    if self._bid_quote.price < qsignal['best_bid'] or self._bid_quote.leaves < qsignal['bid_size']:
                         self.cancel_collector.append(self._make_cancel_quote(self._bid_quote, time))
                         self._bid_quote = None
                 if not self._bid_quote:
@@ -92,7 +121,7 @@ class PennyJumper(ZITrader):
                     self._bid_quote = q
             else:
                 if self._ask_quote: # check if not alone at the ask
-                    if self._ask_quote['price'] > qsignal['best_ask'] or self._ask_quote['quantity'] < qsignal['ask_size']:
+                    if self._ask_quote.price > qsignal['best_ask'] or self._ask_quote.leaves < qsignal['ask_size']:
                         self.cancel_collector.append(self._make_cancel_quote(self._ask_quote, time))
                         self._ask_quote = None
                 if not self._ask_quote:
@@ -103,11 +132,11 @@ class PennyJumper(ZITrader):
                     self._ask_quote = q
         else: # spread = mpi
             if self._bid_quote: # check if not alone at the bid
-                if self._bid_quote['price'] < qsignal['best_bid'] or self._bid_quote['quantity'] < qsignal['bid_size']:
+                if self._bid_quote.price < qsignal['best_bid'] or self._bid_quote.leaves < qsignal['bid_size']:
                     self.cancel_collector.append(self._make_cancel_quote(self._bid_quote, time))
                     self._bid_quote = None
             if self._ask_quote: # check if not alone at the ask
-                if self._ask_quote['price'] > qsignal['best_ask'] or self._ask_quote['quantity'] < qsignal['ask_size']:
+                if self._ask_quote.price > qsignal['best_ask'] or self._ask_quote.leaves < qsignal['ask_size']:
                     self.cancel_collector.append(self._make_cancel_quote(self._ask_quote, time))
                     self._ask_quote = None
             
@@ -121,9 +150,11 @@ class Taker(ZITrader):
     Public methods: process_signal 
     '''
 
-    def __init__(self, name, maxq):
+    def __init__(self, name, maxq, market=False):
+        '''With market=True, Taker sends market orders instead of limit orders at 2000000 or 0'''
         ZITrader.__init__(self, name, maxq)
         self.trader_type = 'Taker'
+        self._market = market
         
     def __repr__(self):
         return 'Trader({0}, {1}, {2})'.format(self._trader_id, self._max_quantity, self.trader_type)
@@ -138,6 +169,8 @@ class Taker(ZITrader):
             price = 0 # agent sells at min price (or better)
             side = 'sell'
         q = self._make_add_quote(time, self._max_quantity, side, price)
+        if self._market:
+            q.type = 'market'
         self.quote_collector.append(q)
         
         
@@ -147,12 +180,15 @@ class Provider(ZITrader):
     
     Subclass of ZITrader
     Public attributes: trader_type, quote_collector (from ZITrader), cancel_collector, local_book
-    Public methods: confirm_cancel_local, confirm_trade_local, process_signal, bulk_cancel
+    Public methods: confirm_cancel_local, confirm_trade_local, process_signal, bulk_cancel, restore_order,
+    schedule_cancels
     '''
 
     def __init__(self, name, maxq, mpi, delta):
         '''Provider has own mpi and delta; a local_book to track outstanding orders and a 
         cancel_collector to convey cancel messages to the exchange.
+        _expiries is the TimingWheel of order expiries once schedule_cancels() is called;
+        _calendar is a shared TimingWheel told which steps the Provider has cancels due.
         '''
         ZITrader.__init__(self, name, maxq)
         self.trader_type = 'Provider'
@@ -160,27 +196,57 @@ class Provider(ZITrader):
         self._delta = delta
         self.local_book = {}
         self.cancel_collector = []
+        self._expiries = None
+        self._calendar = None
                 
     def __repr__(self):
         return 'Trader({0}, {1}, {2})'.format(self._trader_id, self._max_quantity, self.trader_type)
     
     def _make_cancel_quote(self, q, time):
-        return {'type': 'cancel', 'timestamp': time, 'order_id': q['order_id'], 'quantity': q['quantity'],
-                'side': q['side'], 'price': q['price']}
+        return Order(q.order_id, time, 'cancel', q.leaves, q.side, q.price)
+        
+    def restore_order(self, order):
+        '''Take back a resting order (Order) from a restored Orderbook into the local_book'''
+        ZITrader.restore_order(self, order)
+        self.local_book[order.order_id] = order
         
+    def schedule_cancels(self, time, calendar=None):
+        '''
+        Switch bulk_cancel() from scanning the local_book to scheduled lifetimes, starting at time.
+        
+        Cancelling each order with probability _delta at each bulk_cancel() gives it a geometric lifetime,
+        so each order's lifetime is drawn once (when it is added, or now for outstanding orders) and its
+        cancel is due then; bulk_cancel() only touches the orders due.
+        With a calendar (a TimingWheel shared by several traders) the Provider is also scheduled there
+        at each step it has a cancel due, so a runner only needs to call bulk_cancel() then.
+        '''
+        self._expiries = TimingWheel(time-1)
+        self._calendar = calendar
+        self._schedule(list(self.local_book.values()), time)
+        
+    def _schedule(self, quotes, time):
+        '''Draw a lifetime (bulk_cancel() calls survived) for each quote and schedule its cancel'''
+        for q, lifetime in zip(quotes, np.random.geometric(self._delta, len(quotes)) - 1):
+            self._expiries.schedule(time + lifetime, q)
+            if self._calendar is not None:
+                self._calendar.schedule(time + lifetime, self)
+
     def confirm_cancel_local(self, cancel_dict):
         del self.local_book[cancel_dict['order_id']]
 
     def confirm_trade_local(self, confirm):
-        to_modify = self.local_book.get(confirm['order_id'], "WTF???")
-        if confirm['quantity'] == to_modify['quantity']:
-            self.confirm_cancel_local(to_modify)
-        else:
-            self.local_book[confirm['order_id']]['quantity'] -= confirm['quantity']
+        '''The Orderbook updates leaves on the shared Order; drop the Order once it is filled'''
+        if not self.local_book[confirm['order_id']].leaves:
+            del self.local_book[confirm['order_id']]
             
     def bulk_cancel(self, time):
         '''bulk_cancel cancels _delta percent of outstanding orders'''
         self.cancel_collector.clear()
+        if self._expiries is not None:
+            for q in self._expiries.pop(time):
+                if q.leaves:
+                    self.cancel_collector.append(self._make_cancel_quote(q, time))
+            return
         lob = len(self.local_book)
         if lob > 0:
             order_keys = list(self.local_book.keys())
@@ -199,8 +265,10 @@ class Provider(ZITrader):
             price = self._choose_price_from_exp('ask', qsignal['best_bid'], lambda_t)
             side = 'sell'
         q = self._make_add_quote(time, self._max_quantity, side, price)
-        self.local_book[q['order_id']] = q
-        self.quote_collector.append(q)            
+        self.local_book[q.order_id] = q
+        self.quote_collector.append(q)
+        if self._expiries is not None:
+            self._schedule(self.quote_collector, time)
       
     def _choose_price_from_exp(self, side, inside_price, lambda_t):
         '''Prices chosen from an exponential distribution'''
@@ -246,7 +314,7 @@ class MarketMaker(Provider):
     Subclass of Provider
     Public attributes: trader_type, quote_collector (from ZITrader), cancel_collector (from Provider),
     cash_flow_collector
-    Public methods: confirm_cancel_local (from Provider), confirm_trade_local, process_signal 
+    Public methods: confirm_cancel_local and restore_order (from Provider), confirm_trade_local, process_signal 
     '''
 
     def __init__(self, name, maxq, mpi, delta, num_quotes, quote_range):
@@ -272,11 +340,8 @@ class MarketMaker(Provider):
         else:
             self._cash_flow += confirm['price']*confirm['quantity']
             self._position -= confirm['quantity']
-        to_modify = self.local_book.get(confirm['order_id'], "WTF???")
-        if confirm['quantity'] == to_modify['quantity']:
-            self.confirm_cancel_local(to_modify)
-        else:
-            self.local_book[confirm['order_id']]['quantity'] -= confirm['quantity']
+        if not self.local_book[confirm['order_id']].leaves:
+            del self.local_book[confirm['order_id']]
         self._cumulate_cashflow(confirm['timestamp'])
          
     def _cumulate_cashflow(self, timestamp):
@@ -300,8 +365,10 @@ class MarketMaker(Provider):
             side = 'sell'
         for price in prices:
             q = self._make_add_quote(time, self._max_quantity, side, price)
-            self.local_book[q['order_id']] = q
+            self.local_book[q.order_id] = q
             self.quote_collector.append(q)
+        if self._expiries is not None:
+            self._schedule(self.quote_collector, time)
             
             
 class MarketMaker5(MarketMaker):
@@ -338,5 +405,7 @@ class MarketMaker5(MarketMaker):
             side = 'sell'
         for price in prices:
             q = self._make_add_quote(time, self._max_quantity, side, price)
-            self.local_book[q['order_id']] = q
+            self.local_book[q.order_id] = q
             self.quote_collector.append(q)
+        if self._expiries is not None:
+            self._schedule(self.quote_collector, time)
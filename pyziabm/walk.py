@@ -0,0 +1,135 @@
+import numpy as np
+
+
+def bounded_walk(q, s, noise):
+    '''
+    The walk Runner.make_q_take() steps: from q, each draw u in noise moves it up s if u > q and down s if u < q.
+
+    Returns the len(noise) values after q. The moves are guessed in runs against the value at the start of the
+    run, the walk over the guesses is summed in order (so the values are the same floats as stepping one at a
+    time), and the guesses are checked against the walk: the run is kept up to the first wrong guess and the
+    next run starts there. A guess is only wrong when u falls between the start and the current value, so runs
+    are long while s is small.
+    '''
+    n = len(noise)
+    out = np.empty(n)
+    i = 0
+    run = 64
+    while i < n:
+        u = noise[i:i+run]
+        moves = np.where(u > q, s, np.where(u < q, -s, 0.0))
+        walk = np.add.accumulate(np.concatenate(([q], moves)))
+        before = walk[:-1]
+        wrong = np.flatnonzero(np.where(u > before, s, np.where(u < before, -s, 0.0)) != moves)
+        # the first guess is made against q itself, so it is never wrong
+        kept = wrong[0] if len(wrong) else len(u)
+        if kept == len(u):
+            run = min(2*run, 8192)
+        else:
+            run = max(2*kept, 16)
+        out[i:i+kept] = walk[1:kept+1]
+        q = out[i+kept-1]
+        i += kept
+    return out
+
+
+def q_take_path(steps, s, lambda0, c_lambda, chunk=65536):
+    '''
+    q_take and lambda_t for steps steps, as Runner.make_q_take(): two walks from 0.5 on the draws of
+    np.random.rand(2, steps) (the first sets the scale of lambda_t, the second is q_take), made in chunks
+    so only the walks themselves are held.
+    '''
+    walks = np.empty((2, steps))
+    walks[:, 0] = 0.5
+    for row in range(2):
+        q = 0.5
+        for start in range(1, steps, chunk):
+            stop = min(start + chunk, steps)
+            walks[row, start:stop] = bounded_walk(q, s, np.random.rand(stop - start))
+            q = walks[row, stop-1]
+        np.random.rand(1) # the last draw of each row is not used
+    lambda_t = -lambda0*(1 + (np.abs(walks[1] - 0.5)/np.sqrt(np.mean(np.square(walks[0] - 0.5))))*c_lambda)
+    return walks[1], lambda_t
+
+
+class QTakeStream(object):
+    '''
+    QTakeStream makes q_take and lambda_t a chunk at a time as a run reaches them, so memory does not grow with steps.
+
+    The first walk only sets the scale of lambda_t, so it is made (chunk by chunk) and summed when the stream
+    is created; the second is made from a copy of the RandomState taken then, and the global RandomState is moved
+    past its draws, so the run draws what it would have after Runner.make_q_take(). The scale is summed by chunks,
+    so lambda_t can differ from make_q_take()'s in the last digits. Steps are read in increasing order;
+    on_chunk(start, q_take, lambda_t) is called with each chunk as it is made, e.g. to write it out.
+    Public attributes: steps, q_take, lambda_t
+    Public methods: finish()
+    '''
+
+    def __init__(self, steps, s, lambda0, c_lambda, chunk=65536, on_chunk=None):
+        '''q_take and lambda_t are read by step (q_take[step]); _start is the step of the chunk held'''
+        self.steps = steps
+        self._s = s
+        self._lambda0 = lambda0
+        self._c_lambda = c_lambda
+        self._chunk = chunk
+        self._on_chunk = on_chunk
+        total = 0.0
+        q = 0.5
+        for start in range(1, steps, chunk):
+            walk = bounded_walk(q, s, np.random.rand(min(chunk, steps - start)))
+            total += np.square(walk - 0.5).sum()
+            q = walk[-1]
+        np.random.rand(1)
+        self._scale = np.sqrt(total/steps)
+        self._random = np.random.RandomState()
+        self._random.set_state(np.random.get_state())
+        for start in range(0, steps, chunk):
+            np.random.rand(min(chunk, steps - start))
+        self._q = 0.5
+        self._start = 0
+        self._q_chunk = np.empty(0)
+        self._lambda_chunk = np.empty(0)
+        self._next_chunk(np.array([0.5]))
+        self.q_take = _StreamColumn(self, '_q_chunk')
+        self.lambda_t = _StreamColumn(self, '_lambda_chunk')
+
+    def __len__(self):
+        return self.steps
+
+    def _next_chunk(self, q_take=None):
+        '''Make the chunk after the one held (the first chunk is just step 0)'''
+        start = self._start + len(self._q_chunk)
+        if q_take is None:
+            q_take = bounded_walk(self._q, self._s, self._random.rand(min(self._chunk, self.steps - start)))
+            self._q = q_take[-1]
+        self._start = start
+        self._q_chunk = q_take
+        self._lambda_chunk = -self._lambda0*(1 + (np.abs(q_take - 0.5)/self._scale)*self._c_lambda)
+        if self._on_chunk is not None:
+            self._on_chunk(start, self._q_chunk, self._lambda_chunk)
+
+    def _chunk_of(self, step, name):
+        if not 0 <= step < self.steps:
+            raise IndexError('QTakeStream step out of range')
+        if step < self._start:
+            raise IndexError('QTakeStream steps are read in increasing order')
+        while step >= self._start + len(self._q_chunk):
+            self._next_chunk()
+        return getattr(self, name)[step - self._start]
+
+    def finish(self):
+        '''Make the chunks not read yet, so on_chunk() has seen every step'''
+        while self._start + len(self._q_chunk) < self.steps:
+            self._next_chunk()
+
+
+class _StreamColumn(object):
+    def __init__(self, stream, name):
+        self._stream = stream
+        self._name = name
+
+    def __len__(self):
+        return self._stream.steps
+
+    def __getitem__(self, step):
+        return self._stream._chunk_of(step, self._name)
@@ -0,0 +1,56 @@
+import queue
+import threading
+
+from pyziabm.storage import as_store
+
+
+class H5Writer(object):
+    '''
+    H5Writer appends tables to h5 files (or other storage backends) on a background thread.
+
+    put() queues the rows and returns, so building the DataFrame, compressing and writing happen
+    while the simulation runs. The queue is bounded: put() blocks once the thread is maxsize
+    writes behind. Writes happen in the order they are queued, on one thread, so the simulation
+    must send all writes to a file through the same H5Writer until close().
+    An exception on the thread stops further writes and is raised by the next put() or close().
+    Public methods: put() and close()
+    '''
+
+    def __init__(self, maxsize=4):
+        self._queue = queue.Queue(maxsize)
+        self._error = None
+        self._thread = threading.Thread(target=self._run, name='H5Writer', daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        while True:
+            job = self._queue.get()
+            try:
+                if job is None:
+                    return
+                if self._error is None:
+                    (store, key, rows), kwargs = job
+                    as_store(store).append(key, rows, **kwargs)
+            except Exception as e:
+                self._error = e
+            finally:
+                self._queue.task_done()
+
+    def _raise_error(self):
+        if self._error is not None:
+            raise self._error
+
+    def put(self, store, key, rows, **kwargs):
+        '''
+        Queue rows (a ColumnBuffer or a DataFrame) to append to the key table of store (an h5 file name
+        or a storage backend); the caller must not reuse rows
+        '''
+        self._raise_error()
+        self._queue.put(((store, key, rows), kwargs))
+
+    def close(self):
+        '''Finish the queued writes and stop the thread'''
+        if self._thread.is_alive():
+            self._queue.put(None)
+            self._thread.join()
+        self._raise_error()
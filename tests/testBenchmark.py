@@ -0,0 +1,52 @@
+import itertools
+import os
+import tempfile
+import unittest
+
+import numpy as np
+
+from pyziabm.benchmark import (_bench_cancel, _bench_sweep, _synthetic_book, compare_results, load_results,
+                               orderbook_benchmark, save_results)
+
+
+class TestOrderbookBenchmark(unittest.TestCase):
+    '''
+    The Orderbook benchmarks run on synthetic books which keep their shape
+    '''
+
+    def _shape(self, book):
+        return book.depth(200), book.total_bid_size, book.total_ask_size
+
+    def test_synthetic_book(self):
+        '''
+        Cancels and sweeps are refilled, so the book keeps its shape
+        '''
+        for ladder in [False, True]:
+            ids = itertools.count(1)
+            book, resting = _synthetic_book(10, 3, ladder, ids)
+            shape = self._shape(book)
+            self.assertEqual(len(shape[0]['bid_prices']), 10)
+            self.assertEqual(shape[0]['ask_sizes'][0], 6)
+            self.assertEqual(len(_bench_cancel(book, resting, ids, np.random.RandomState(1), 50, 0)), 50)
+            self.assertEqual(self._shape(book), shape)
+            _bench_sweep(book, resting, ids, np.random.RandomState(1), 3, 10)
+            self.assertEqual(self._shape(book), shape)
+            self.assertEqual(len(book.trade_book), 3*30)
+
+    def test_results(self):
+        '''
+        Results are keyed by index, book shape and case, saved as JSON and compared with a baseline
+        '''
+        results = orderbook_benchmark(ops=40, books=((10, 2),), cases=('add', 'sweep_10', 'sweep_100'))
+        self.assertEqual(sorted(results), ['ladder/10x2/add', 'ladder/10x2/sweep_10', 'list/10x2/add',
+                                           'list/10x2/sweep_10'])
+        self.assertEqual(results['list/10x2/add']['ops'], 40)
+        self.assertEqual(results['list/10x2/sweep_10']['ops'], 20)
+        self.assertLessEqual(results['list/10x2/add']['p50_us'], results['list/10x2/add']['p99_us'])
+        with tempfile.TemporaryDirectory() as tempdir:
+            filename = os.path.join(tempdir, 'baseline.json')
+            save_results(results, filename)
+            self.assertEqual(load_results(filename), results)
+            compared = compare_results({'list/10x2/add': results['list/10x2/add'], 'list/1x1/add': {}}, filename)
+        self.assertEqual(list(compared.index), ['list/10x2/add'])
+        self.assertEqual(compared.speedup.iloc[0], 1.0)
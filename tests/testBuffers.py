@@ -0,0 +1,115 @@
+import numpy as np
+import unittest
+
+from pyziabm.buffers import ColumnBuffer, SpillBuffer
+
+
+class TestColumnBuffer(unittest.TestCase):
+    '''
+    ColumnBuffer stores rows in typed column arrays that grow in blocks
+    '''
+
+    def setUp(self):
+        self.b1 = ColumnBuffer((('order_id', object), ('timestamp', np.int64), ('price', np.int64)), block_size=4)
+
+    def test_append(self):
+        '''
+        append_row() takes values in column order, append() takes a dict; rows read back as dicts
+        '''
+        self.assertFalse(self.b1)
+        self.b1.append_row('t1_1', 2, 50)
+        self.b1.append({'price': 51, 'order_id': 't1_2', 'timestamp': 3})
+        self.assertEqual(len(self.b1), 2)
+        self.assertDictEqual(self.b1[0], {'order_id': 't1_1', 'timestamp': 2, 'price': 50})
+        self.assertDictEqual(self.b1[-1], {'order_id': 't1_2', 'timestamp': 3, 'price': 51})
+        self.assertIs(type(self.b1[0]['price']), int)
+        self.assertEqual(self.b1.names, ('order_id', 'timestamp', 'price'))
+        self.assertEqual(self.b1.dtypes, (np.dtype(object), np.dtype(np.int64), np.dtype(np.int64)))
+        with self.assertRaises(IndexError):
+            self.b1[2]
+
+    def test_blocks(self):
+        '''
+        Rows spill into new blocks; clear() keeps one block large enough for the last fill
+        '''
+        for i in range(10):
+            self.b1.append_row('t1_%d' % i, i, 50+i)
+        self.assertEqual(len(self.b1), 10)
+        self.assertEqual(len(self.b1._blocks), 2)
+        self.assertDictEqual(self.b1[5], {'order_id': 't1_5', 'timestamp': 5, 'price': 55})
+        self.assertEqual([row['timestamp'] for row in self.b1], list(range(10)))
+        np.testing.assert_array_equal(self.b1.column('price'), np.arange(50, 60))
+        self.b1.clear()
+        self.assertFalse(self.b1)
+        self.assertFalse(self.b1._blocks)
+        self.assertEqual(self.b1._capacity, 10)
+        self.b1.append_row('t1_10', 10, 60)
+        self.assertDictEqual(self.b1[0], {'order_id': 't1_10', 'timestamp': 10, 'price': 60})
+
+    def test_to_frame(self):
+        '''
+        to_frame() keeps the column order and dtypes
+        '''
+        for i in range(6):
+            self.b1.append_row('t1_%d' % i, i, 50+i)
+        df = self.b1.to_frame()
+        self.assertEqual(list(df.columns), ['order_id', 'timestamp', 'price'])
+        self.assertEqual(df.order_id.dtype, object)
+        self.assertEqual(df.price.dtype, np.int64)
+        self.assertEqual(df.order_id.tolist(), ['t1_%d' % i for i in range(6)])
+        self.assertEqual(len(ColumnBuffer((('price', np.int64),)).to_frame()), 0)
+
+    def test_detach(self):
+        '''
+        detach() moves the rows to a new ColumnBuffer; this one is empty and keeps appending
+        '''
+        for i in range(6):
+            self.b1.append_row('t1_%d' % i, i, 50+i)
+        rows = self.b1.detach()
+        self.assertEqual(len(rows), 6)
+        self.assertFalse(self.b1)
+        self.assertEqual(self.b1._capacity, 6)
+        self.b1.append_row('t1_6', 6, 56)
+        self.assertDictEqual(rows[5], {'order_id': 't1_5', 'timestamp': 5, 'price': 55})
+        self.assertEqual(rows.column('timestamp').tolist(), list(range(6)))
+        self.assertEqual(self.b1.column('timestamp').tolist(), [6])
+
+
+class TestSpillBuffer(unittest.TestCase):
+    '''
+    SpillBuffer holds at most max_rows rows and spills each full segment
+    '''
+
+    def setUp(self):
+        self.spilled = []
+        self.b1 = SpillBuffer((('order_id', object), ('timestamp', np.int64)), 4, self._spill)
+
+    def _spill(self):
+        self.spilled.extend(self.b1.column('timestamp').tolist())
+        self.b1.clear()
+
+    def test_spill(self):
+        '''
+        Full segments are spilled in order and the segment arrays are reused after clear()
+        '''
+        columns = self.b1._columns
+        for i in range(10):
+            self.b1.append_row('t1_%d' % i, i)
+            self.assertLessEqual(len(self.b1), 4)
+        self.assertEqual(self.spilled, list(range(8)))
+        self.assertEqual(self.b1.spills, 2)
+        self.assertEqual(self.b1.column('timestamp').tolist(), [8, 9])
+        self.assertIs(self.b1._columns, columns)
+        self.assertDictEqual(self.b1[1], {'order_id': 't1_9', 'timestamp': 9})
+
+    def test_detach(self):
+        '''
+        A spill which detaches the rows gets the full segment; appends go to a new segment
+        '''
+        segments = []
+        self.b1._spill = lambda: segments.append(self.b1.detach())
+        for i in range(9):
+            self.b1.append_row('t1_%d' % i, i)
+        self.assertEqual([segment.column('timestamp').tolist() for segment in segments], [[0, 1, 2, 3], [4, 5, 6, 7]])
+        self.assertEqual(self.b1._capacity, 4)
+        self.assertEqual(len(self.b1), 1)
@@ -0,0 +1,29 @@
+import numpy as np
+import pandas as pd
+import unittest
+
+from pyziabm.ids import make_order_id, owner_of, owner_of_str, order_id_to_str, decode_order_ids, decode_owners
+
+
+class TestIds(unittest.TestCase):
+    '''
+    Interned order ids carry the trader number in the high bits and the quote sequence in the low bits.
+    '''
+    
+    def setUp(self):
+        self.names = ['t0', 't1', 'p0', 'm0']
+        
+    def test_make_order_id(self):
+        oid = make_order_id(3, 17)
+        self.assertEqual(owner_of(oid), 3)
+        self.assertEqual(order_id_to_str(oid, self.names), 'm0_17')
+        self.assertEqual(owner_of_str('m0_17'), 'm0')
+        self.assertNotEqual(make_order_id(1, 2), make_order_id(2, 1))
+        
+    def test_decode_order_ids(self):
+        ids = pd.Series([make_order_id(0, 1), make_order_id(2, 5), make_order_id(3, 12)], index=[10, 11, 12])
+        decoded = decode_order_ids(ids, self.names)
+        self.assertEqual(decoded.tolist(), ['t0_1', 'p0_5', 'm0_12'])
+        self.assertEqual(decoded.index.tolist(), [10, 11, 12])
+        owners = decode_owners(np.array(ids), self.names)
+        self.assertEqual(owners.tolist(), ['t0', 'p0', 'm0'])
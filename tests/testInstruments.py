@@ -0,0 +1,68 @@
+import unittest
+
+from pyziabm.instruments import Instruments
+from pyziabm.orderbook3 import Orderbook
+
+
+class TestInstruments(unittest.TestCase):
+    '''
+    Instruments counts messages, sweeps, cancel misses, latency and depth by trader type
+    '''
+
+    def setUp(self):
+        self.ex1 = Orderbook()
+        self.types = {'p1': 'Provider', 'p2': 'Provider', 't1': 'Taker'}
+        self.i1 = Instruments(self.ex1, self.types.get, sample_every=1, depth_every=2)
+
+    def _order(self, order_id, timestamp, order_type, quantity, side, price):
+        return {'order_id': order_id, 'timestamp': timestamp, 'type': order_type, 'quantity': quantity,
+                'side': side, 'price': price}
+
+    def test_counts(self):
+        self.ex1.process_orders([self._order('p1_1', 1, 'add', 1, 'buy', 50), self._order('p1_2', 1, 'add', 1, 'sell', 52),
+                                 self._order('p2_1', 2, 'add', 2, 'sell', 53), self._order('p2_2', 2, 'add', 1, 'buy', 49)])
+        # a sweep of two levels and three fills
+        self.ex1.process_order(self._order('t1_1', 3, 'add', 3, 'buy', 2000000))
+        # p1_2 is filled: the cancel misses
+        self.ex1.process_order(self._order('p1_2', 4, 'cancel', 1, 'sell', 52))
+        self.assertEqual(self.ex1.mass_cancel(5, 'p2', ['p2_2', 'p2_9']), self.ex1.confirm_modify_collector)
+        self.assertEqual(self.i1.messages[('Provider', 'add', 'sell')], 2)
+        self.assertEqual(self.i1.messages[('Provider', 'cancel', 'buy')], 1)
+        self.assertEqual(self.i1.messages[('Taker', 'add', 'buy')], 1)
+        self.assertEqual([self.i1.sweeps[('Taker', count)] for count in ['sweeps', 'fills', 'levels']], [1, 2, 2])
+        self.assertEqual(self.i1.levels_walked[('Taker', 2)], 1)
+        self.assertEqual(self.i1.cancel_misses['Provider'], 2)
+        self.assertEqual(sum(self.i1.latency[('add', 'Provider')]), 4)
+        self.assertEqual(sum(self.i1.latency[('trade', 'Taker')]), 1)
+        self.assertIn(('mass_cancel', 'Provider'), self.i1.latency)
+        self.assertEqual(self.i1.depth.column('message').tolist(), [2, 4, 6])
+        self.assertEqual(self.i1.depth[1], {'message': 4, 'bid_levels': 2, 'ask_levels': 2, 'total_bid_size': 2,
+                                            'total_ask_size': 3})
+        report = self.i1.report()
+        self.assertEqual(sorted(report), ['cancel_misses', 'depth', 'latency', 'levels_walked', 'messages', 'sweeps'])
+        self.assertEqual(report['sweeps'].loc[0].tolist(), ['Taker', 1, 2, 2])
+        latency = report['latency'].set_index(['operation', 'trader_type'])
+        self.assertLessEqual(latency.loc[('add', 'Provider'), 'p50_us'], latency.loc[('add', 'Provider'), 'max_us'])
+
+    def test_market_order(self):
+        '''
+        A market order is not looked up in the book, so it is not a cancel miss
+        '''
+        self.ex1.process_order(self._order('p1_1', 1, 'add', 1, 'sell', 52))
+        self.ex1.process_order(self._order('t1_1', 2, 'market', 1, 'buy', 0))
+        self.assertEqual(self.i1.messages[('Taker', 'market', 'buy')], 1)
+        self.assertFalse(self.i1.cancel_misses)
+
+    def test_disable(self):
+        '''
+        disable() puts back the Orderbook's own methods
+        '''
+        self.i1.disable()
+        self.assertNotIn('_process_order', vars(self.ex1))
+        self.ex1.process_order(self._order('p1_1', 1, 'add', 1, 'buy', 50))
+        self.ex1.mass_cancel(2, 'p1')
+        self.assertFalse(self.i1.messages)
+        self.assertFalse(self.ex1._bid_orders)
+        self.i1.enable()
+        self.ex1.process_order(self._order('p1_2', 3, 'add', 1, 'buy', 50))
+        self.assertEqual(self.i1.messages[('Provider', 'add', 'buy')], 1)
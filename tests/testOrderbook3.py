@@ -1,19 +1,28 @@
-from pyziabm.orderbook3 import Orderbook
+import numpy as np
+import os
+import random
+import tempfile
+
+from pyziabm.ids import make_order_id
+from pyziabm.orderbook3 import Order, Orderbook, PriceLadder
+from pyziabm.storage import open_store
 import unittest
 
 
 class TestOrderbook(unittest.TestCase):
     '''
     Attribute objects in the Orderbook class include:
-        order_history: list
+        order_history: ColumnBuffer
         _bid_book: dictionary
         _bid_book_prices: sorted list
+        _bid_orders: dictionary
         _ask_book: dictionary
         _ask_book_prices: sorted list
+        _ask_orders: dictionary
         confirm_modify_collector: list
         confirm_trade_collector: list
-        sip_collector: list
-        trade_book: list
+        sip_collector: ColumnBuffer
+        trade_book: ColumnBuffer
     Each method impacts one or more of these attributes.
     '''
     
@@ -38,6 +47,15 @@ class TestOrderbook(unittest.TestCase):
                         'price': 53}
         self.q4_sell = {'order_id': 't11_2', 'timestamp': 5, 'type': 'add', 'quantity': 3, 'side': 'sell',
                         'price': 55}
+        
+    def _queue_ids(self, level):
+        '''Walk the linked list at a price level from head to tail'''
+        order_ids = []
+        node = level['head']
+        while node:
+            order_ids.append(node.order_id)
+            node = node.next
+        return order_ids
             
     def test_add_order_to_history(self):
         '''
@@ -62,13 +80,13 @@ class TestOrderbook(unittest.TestCase):
         self.assertTrue(50 in self.ex1._bid_book.keys())
         self.assertEqual(self.ex1._bid_book[50]['num_orders'], 1)
         self.assertEqual(self.ex1._bid_book[50]['size'], 1)
-        self.assertEqual(self.ex1._bid_book[50]['order_ids'][0], self.q1_buy['order_id'])
-        self.assertDictEqual(self.ex1._bid_book[50]['orders'][self.q1_buy['order_id']], self.q1_buy)
+        self.assertEqual(self._queue_ids(self.ex1._bid_book[50])[0], self.q1_buy['order_id'])
+        self.assertDictEqual(self.ex1._bid_orders[self.q1_buy['order_id']].as_dict(), self.q1_buy)
         self.ex1.add_order_to_book(self.q2_buy)
         self.assertEqual(self.ex1._bid_book[50]['num_orders'], 2)
         self.assertEqual(self.ex1._bid_book[50]['size'], 2)
-        self.assertEqual(self.ex1._bid_book[50]['order_ids'][1], self.q2_buy['order_id'])
-        self.assertDictEqual(self.ex1._bid_book[50]['orders'][self.q2_buy['order_id']], self.q2_buy)
+        self.assertEqual(self._queue_ids(self.ex1._bid_book[50])[1], self.q2_buy['order_id'])
+        self.assertDictEqual(self.ex1._bid_orders[self.q2_buy['order_id']].as_dict(), self.q2_buy)
         # 2 sell orders
         self.assertFalse(self.ex1._ask_book_prices)
         self.assertFalse(self.ex1._ask_book)
@@ -77,13 +95,13 @@ class TestOrderbook(unittest.TestCase):
         self.assertTrue(52 in self.ex1._ask_book.keys())
         self.assertEqual(self.ex1._ask_book[52]['num_orders'], 1)
         self.assertEqual(self.ex1._ask_book[52]['size'], 1)
-        self.assertEqual(self.ex1._ask_book[52]['order_ids'][0], self.q1_sell['order_id'])
-        self.assertDictEqual(self.ex1._ask_book[52]['orders'][self.q1_sell['order_id']], self.q1_sell)
+        self.assertEqual(self._queue_ids(self.ex1._ask_book[52])[0], self.q1_sell['order_id'])
+        self.assertDictEqual(self.ex1._ask_orders[self.q1_sell['order_id']].as_dict(), self.q1_sell)
         self.ex1.add_order_to_book(self.q2_sell)
         self.assertEqual(self.ex1._ask_book[52]['num_orders'], 2)
         self.assertEqual(self.ex1._ask_book[52]['size'], 2)
-        self.assertEqual(self.ex1._ask_book[52]['order_ids'][1], self.q2_sell['order_id'])
-        self.assertDictEqual(self.ex1._ask_book[52]['orders'][self.q2_sell['order_id']], self.q2_sell)
+        self.assertEqual(self._queue_ids(self.ex1._ask_book[52])[1], self.q2_sell['order_id'])
+        self.assertDictEqual(self.ex1._ask_orders[self.q2_sell['order_id']].as_dict(), self.q2_sell)
         
     def test_remove_order(self):
         '''
@@ -97,29 +115,29 @@ class TestOrderbook(unittest.TestCase):
         self.assertTrue(50 in self.ex1._bid_book.keys())
         self.assertEqual(self.ex1._bid_book[50]['num_orders'], 2)
         self.assertEqual(self.ex1._bid_book[50]['size'], 2)
-        self.assertEqual(len(self.ex1._bid_book[50]['order_ids']), 2)
+        self.assertEqual(len(self._queue_ids(self.ex1._bid_book[50])), 2)
         # remove first order
         self.ex1._remove_order('buy', 50, 't1_1')
         self.assertEqual(self.ex1._bid_book[50]['num_orders'], 1)
         self.assertEqual(self.ex1._bid_book[50]['size'], 1)
-        self.assertEqual(len(self.ex1._bid_book[50]['order_ids']), 1)
-        self.assertFalse('t1_1' in self.ex1._bid_book[50]['orders'].keys())
+        self.assertEqual(len(self._queue_ids(self.ex1._bid_book[50])), 1)
+        self.assertFalse('t1_1' in self.ex1._bid_orders)
         self.assertTrue(50 in self.ex1._bid_book_prices)
         # remove second order
         self.ex1._remove_order('buy', 50, 't1_2')
         self.assertFalse(self.ex1._bid_book_prices)
         self.assertEqual(self.ex1._bid_book[50]['num_orders'], 0)
         self.assertEqual(self.ex1._bid_book[50]['size'], 0)
-        self.assertEqual(len(self.ex1._bid_book[50]['order_ids']), 0)
-        self.assertFalse('t1_2' in self.ex1._bid_book[50]['orders'].keys())
+        self.assertEqual(len(self._queue_ids(self.ex1._bid_book[50])), 0)
+        self.assertFalse('t1_2' in self.ex1._bid_orders)
         self.assertFalse(50 in self.ex1._bid_book_prices)
         # remove second order again
         self.ex1._remove_order('buy', 50, 't1_2')
         self.assertFalse(self.ex1._bid_book_prices)
         self.assertEqual(self.ex1._bid_book[50]['num_orders'], 0)
         self.assertEqual(self.ex1._bid_book[50]['size'], 0)
-        self.assertEqual(len(self.ex1._bid_book[50]['order_ids']), 0)
-        self.assertFalse('t1_2' in self.ex1._bid_book[50]['orders'].keys())
+        self.assertEqual(len(self._queue_ids(self.ex1._bid_book[50])), 0)
+        self.assertFalse('t1_2' in self.ex1._bid_orders)
         # sell orders
         self.ex1.add_order_to_book(self.q1_sell)
         self.ex1.add_order_to_book(self.q2_sell)
@@ -127,30 +145,95 @@ class TestOrderbook(unittest.TestCase):
         self.assertTrue(52 in self.ex1._ask_book.keys())
         self.assertEqual(self.ex1._ask_book[52]['num_orders'], 2)
         self.assertEqual(self.ex1._ask_book[52]['size'], 2)
-        self.assertEqual(len(self.ex1._ask_book[52]['order_ids']), 2)
+        self.assertEqual(len(self._queue_ids(self.ex1._ask_book[52])), 2)
         # remove first order
         self.ex1._remove_order('sell', 52, 't1_3')
         self.assertEqual(self.ex1._ask_book[52]['num_orders'], 1)
         self.assertEqual(self.ex1._ask_book[52]['size'], 1)
-        self.assertEqual(len(self.ex1._ask_book[52]['order_ids']), 1)
-        self.assertFalse('t1_1' in self.ex1._ask_book[52]['orders'].keys())
+        self.assertEqual(len(self._queue_ids(self.ex1._ask_book[52])), 1)
+        self.assertFalse('t1_1' in self.ex1._ask_orders)
         self.assertTrue(52 in self.ex1._ask_book_prices)
         # remove second order
         self.ex1._remove_order('sell', 52, 't1_4')
         self.assertFalse(self.ex1._ask_book_prices)
         self.assertEqual(self.ex1._ask_book[52]['num_orders'], 0)
         self.assertEqual(self.ex1._ask_book[52]['size'], 0)
-        self.assertEqual(len(self.ex1._ask_book[52]['order_ids']), 0)
-        self.assertFalse('t1_2' in self.ex1._ask_book[52]['orders'].keys())
+        self.assertEqual(len(self._queue_ids(self.ex1._ask_book[52])), 0)
+        self.assertFalse('t1_2' in self.ex1._ask_orders)
         self.assertFalse(52 in self.ex1._ask_book_prices)
         # remove second order again
         self.ex1._remove_order('sell', 52, 't1_4')
         self.assertFalse(self.ex1._ask_book_prices)
         self.assertEqual(self.ex1._ask_book[52]['num_orders'], 0)
         self.assertEqual(self.ex1._ask_book[52]['size'], 0)
-        self.assertEqual(len(self.ex1._ask_book[52]['order_ids']), 0)
-        self.assertFalse('t1_2' in self.ex1._ask_book[52]['orders'].keys())
+        self.assertEqual(len(self._queue_ids(self.ex1._ask_book[52])), 0)
+        self.assertFalse('t1_2' in self.ex1._ask_orders)
         
+    def test_remove_order_linked_list(self):
+        '''
+        _remove_order() unlinks Orders from the middle, head and tail of the queue
+        '''
+        self.q3_buy['price'] = 50
+        self.q4_buy['price'] = 50
+        for q in [self.q1_buy, self.q2_buy, self.q3_buy, self.q4_buy]:
+            self.ex1.add_order_to_book(q)
+        self.assertEqual(self._queue_ids(self.ex1._bid_book[50]), ['t1_1', 't1_2', 't10_1', 't11_1'])
+        self.ex1._remove_order('buy', 50, 't1_2')
+        self.assertEqual(self._queue_ids(self.ex1._bid_book[50]), ['t1_1', 't10_1', 't11_1'])
+        self.ex1._remove_order('buy', 50, 't1_1')
+        self.assertEqual(self._queue_ids(self.ex1._bid_book[50]), ['t10_1', 't11_1'])
+        self.ex1._remove_order('buy', 50, 't11_1')
+        self.assertEqual(self._queue_ids(self.ex1._bid_book[50]), ['t10_1'])
+        self.assertIs(self.ex1._bid_book[50]['head'], self.ex1._bid_book[50]['tail'])
+        self.assertEqual(self.ex1._bid_book[50]['size'], 3)
+        self.assertEqual(list(self.ex1._bid_orders.keys()), ['t10_1'])
+        # emptied level is reused at the tail
+        self.ex1._remove_order('buy', 50, 't10_1')
+        self.assertIsNone(self.ex1._bid_book[50]['head'])
+        self.assertIsNone(self.ex1._bid_book[50]['tail'])
+        self.ex1.add_order_to_book(self.q1_buy)
+        self.assertEqual(self._queue_ids(self.ex1._bid_book[50]), ['t1_1'])
+        self.assertTrue(50 in self.ex1._bid_book_prices)
+        
+    def test_shared_order(self):
+        '''
+        The trader's Order is the record on the book: leaves tracks fills, quantity does not
+        '''
+        self.ex1.add_order_to_book(self.q1_sell)
+        q = Order('t1_5', 6, 'add', 3, 'buy', 50)
+        self.ex1.process_order(q)
+        self.assertIs(self.ex1._bid_orders['t1_5'], q)
+        self.ex1.process_order(Order('t2_1', 7, 'add', 2, 'sell', 50))
+        self.assertEqual(q.quantity, 3)
+        self.assertEqual(q.leaves, 1)
+        self.ex1.process_order(Order('t2_2', 8, 'add', 1, 'sell', 50))
+        self.assertEqual(q.leaves, 0)
+        self.assertFalse(self.ex1._bid_orders)
+        self.assertDictEqual(self.ex1.order_history[0], {'order_id': 't1_5', 'timestamp': 6, 'type': 'add',
+                                                         'quantity': 3, 'side': 'buy', 'price': 50, 'exid': 1})
+
+    def test_match_trade_leaves(self):
+        '''
+        An incoming limit order leaves what it did not fill: 0 when it fills completely and never rests
+        '''
+        self.ex1.add_order_to_book(self.q1_sell)
+        self.ex1.add_order_to_book(self.q3_sell)
+        self.ex1.add_order_to_book(self.q4_sell)
+        q = Order('t2_1', 6, 'add', 3, 'buy', 53)
+        self.ex1.process_order(q)
+        self.assertEqual(q.leaves, 0)
+        self.assertEqual(q.quantity, 3)
+        self.assertNotIn('t2_1', self.ex1._bid_orders)
+        self.assertEqual(self.ex1._ask_book[53]['size'], 1)
+        q = Order('t2_2', 7, 'add', 2, 'buy', 53)
+        self.ex1.process_order(q)
+        self.assertEqual(q.leaves, 1)
+        self.assertIs(self.ex1._bid_orders['t2_2'], q)
+        q = Order('t3_1', 8, 'add', 1, 'sell', 53)
+        self.ex1.process_order(q)
+        self.assertEqual(q.leaves, 0)
+        self.assertFalse(self.ex1._bid_orders)
+
     def test_modify_order(self):
         '''
         _modify_order() primarily impacts _bid_book or _ask_book 
@@ -166,14 +249,14 @@ class TestOrderbook(unittest.TestCase):
         # remove 1
         self.ex1._modify_order('buy', 1, 't1_1', 50)
         self.assertEqual(self.ex1._bid_book[50]['size'], 1)
-        self.assertEqual(self.ex1._bid_book[50]['orders']['t1_1']['quantity'], 1)
+        self.assertEqual(self.ex1._bid_orders['t1_1'].leaves, 1)
         self.assertTrue(self.ex1._bid_book_prices)
         # remove remainder
         self.ex1._modify_order('buy', 1, 't1_1', 50)
         self.assertFalse(self.ex1._bid_book_prices)
         self.assertEqual(self.ex1._bid_book[50]['num_orders'], 0)
         self.assertEqual(self.ex1._bid_book[50]['size'], 0)
-        self.assertFalse('t1_1' in self.ex1._bid_book[50]['orders'].keys())
+        self.assertFalse('t1_1' in self.ex1._bid_orders)
         # Sell order
         q2 = {'order_id': 't1_1', 'timestamp': 5, 'type': 'add', 'quantity': 2, 'side': 'sell',
               'price': 50}
@@ -182,14 +265,14 @@ class TestOrderbook(unittest.TestCase):
         # remove 1
         self.ex1._modify_order('sell', 1, 't1_1', 50)
         self.assertEqual(self.ex1._ask_book[50]['size'], 1)
-        self.assertEqual(self.ex1._ask_book[50]['orders']['t1_1']['quantity'], 1)
+        self.assertEqual(self.ex1._ask_orders['t1_1'].leaves, 1)
         self.assertTrue(self.ex1._ask_book_prices)
         # remove remainder
         self.ex1._modify_order('sell', 1, 't1_1', 50)
         self.assertFalse(self.ex1._ask_book_prices)
         self.assertEqual(self.ex1._ask_book[50]['num_orders'], 0)
         self.assertEqual(self.ex1._ask_book[50]['size'], 0)
-        self.assertFalse('t1_1' in self.ex1._ask_book[50]['orders'].keys())
+        self.assertFalse('t1_1' in self.ex1._ask_orders)
         
     def test_add_trade_to_book(self):
         '''
@@ -215,6 +298,18 @@ class TestOrderbook(unittest.TestCase):
         self.assertTrue(self.ex1.confirm_trade_collector)
         self.assertDictEqual(t2, self.ex1.confirm_trade_collector[0])
         
+    def test_confirm_trade_interned(self):
+        '''
+        With interned ids, the trader is the integer in the high bits of the order_id
+        '''
+        ex2 = Orderbook(interned=True)
+        oid = make_order_id(3, 1)
+        ex2._confirm_trade(5, 'sell', 1, oid, 50)
+        self.assertDictEqual(ex2.confirm_trade_collector[0], dict(timestamp=5, trader=3, order_id=oid, quantity=1,
+                                                                  side='sell', price=50))
+        ex2._confirm_modify(7, 'sell', 1, oid)
+        self.assertEqual(ex2.confirm_modify_collector[0]['trader'], 3)
+        
     def test_confirm_modify(self):
         '''
         confirm_modify() impacts confirm_modify_collector
@@ -312,7 +407,7 @@ class TestOrderbook(unittest.TestCase):
         self.assertEqual(len(self.ex1.order_history), 10)
         self.assertEqual(len(self.ex1._bid_book_prices), 2)
         self.assertEqual(self.ex1._bid_book[48]['size'], 3)
-        self.assertEqual(self.ex1._bid_book[48]['orders']['t5_1']['quantity'], 3)
+        self.assertEqual(self.ex1._bid_orders['t5_1'].leaves, 3)
         self.assertEqual(len(self.ex1.confirm_modify_collector), 1)
         self.assertFalse(self.ex1.traded)
         # add/modify sell order
@@ -329,10 +424,70 @@ class TestOrderbook(unittest.TestCase):
         self.assertEqual(len(self.ex1.order_history), 12)
         self.assertEqual(len(self.ex1._ask_book_prices), 2)
         self.assertEqual(self.ex1._ask_book[54]['size'], 3)
-        self.assertEqual(self.ex1._ask_book[54]['orders']['t5_1']['quantity'], 3)
+        self.assertEqual(self.ex1._ask_orders['t5_1'].leaves, 3)
         self.assertEqual(len(self.ex1.confirm_modify_collector), 1)
         self.assertFalse(self.ex1.traded)
 
+    def test_process_orders(self):
+        '''
+        process_orders() processes a batch in sequence and returns the trade and modify confirmations for the batch
+        '''
+        self.ex1.add_order_to_book(self.q1_buy)
+        self.ex1.add_order_to_book(self.q1_sell)
+        trades, modifies = self.ex1.process_orders([self.q2_buy, self.q3_buy, self.q2_sell, self.q3_sell])
+        self.assertFalse(trades)
+        self.assertFalse(modifies)
+        self.assertFalse(self.ex1.traded)
+        self.assertEqual(len(self.ex1.order_history), 4)
+        # two cancels (one for an unknown order) and a sell which takes out 50 and part of 49
+        c1 = {'order_id': 't1_2', 'timestamp': 6, 'type': 'cancel', 'quantity': 1, 'side': 'buy', 'price': 50}
+        c2 = {'order_id': 't9_9', 'timestamp': 6, 'type': 'cancel', 'quantity': 1, 'side': 'sell', 'price': 52}
+        q1 = {'order_id': 't100_1', 'timestamp': 7, 'type': 'add', 'quantity': 2, 'side': 'sell', 'price': 0}
+        trades, modifies = self.ex1.process_orders([c1, c2, q1])
+        self.assertEqual(trades, self.ex1.confirm_trade_collector)
+        self.assertEqual(modifies, self.ex1.confirm_modify_collector)
+        self.assertEqual([m['order_id'] for m in modifies], ['t1_2'])
+        self.assertEqual([(t['order_id'], t['quantity']) for t in trades], [('t1_1', 1), ('t10_1', 1)])
+        self.assertTrue(self.ex1.traded)
+        self.assertEqual(self.ex1._bid_book[49]['size'], 2)
+        self.assertEqual(len(self.ex1.order_history), 7)
+        cancels = modifies
+        # structured arrays are read field by field
+        batch = np.array([('t2_1', 8, 'add', 1, 'buy', 48), ('t2_2', 8, 'add', 1, 'buy', 47)],
+                         dtype=[('order_id', 'U8'), ('timestamp', 'i8'), ('type', 'U8'), ('quantity', 'i8'),
+                                ('side', 'U4'), ('price', 'i8')])
+        trades, modifies = self.ex1.process_orders(batch)
+        self.assertFalse(trades)
+        self.assertEqual(self.ex1._bid_book_prices[0], 47)
+        self.assertEqual(self.ex1._bid_orders['t2_2'].price, 47)
+        # returned lists belong to the caller
+        self.ex1.process_order(c2)
+        self.assertEqual(len(cancels), 1)
+        self.assertEqual(len(self.ex1.order_history), 10)
+
+    def test_process_orders_kept(self):
+        '''
+        The confirmations process_orders() returns are kept when process_order() runs next
+        '''
+        for order in [self.q1_buy, self.q2_buy, self.q1_sell]:
+            self.ex1.add_order_to_book(order)
+        c1 = {'order_id': 't1_1', 'timestamp': 6, 'type': 'cancel', 'quantity': 1, 'side': 'buy', 'price': 50}
+        q1 = {'order_id': 't100_1', 'timestamp': 7, 'type': 'add', 'quantity': 1, 'side': 'buy', 'price': 52}
+        trades, modifies = self.ex1.process_orders([c1, q1])
+        self.assertEqual([t['order_id'] for t in trades], ['t1_3'])
+        self.assertEqual([m['order_id'] for m in modifies], ['t1_1'])
+        collector = self.ex1.confirm_modify_collector
+        c2 = {'order_id': 't1_2', 'timestamp': 8, 'type': 'cancel', 'quantity': 1, 'side': 'buy', 'price': 50}
+        self.ex1.process_order(c2)
+        self.ex1.process_order({'order_id': 't100_2', 'timestamp': 9, 'type': 'add', 'quantity': 1, 'side': 'buy',
+                                'price': 49})
+        self.assertEqual([t['order_id'] for t in trades], ['t1_3'])
+        self.assertEqual([m['order_id'] for m in modifies], ['t1_1'])
+        self.assertIsNot(modifies, self.ex1.confirm_modify_collector)
+        # process_order() clears and reuses the collectors rather than allocating new ones
+        self.assertIs(collector, self.ex1.confirm_modify_collector)
+
+
     def test_match_trade_sell(self):
         '''
         An incoming order can:
@@ -366,7 +521,7 @@ class TestOrderbook(unittest.TestCase):
         self.assertTrue(50 in self.ex1._bid_book_prices)
         self.assertEqual(self.ex1._bid_book[49]['size'], 3)
         self.assertEqual(self.ex1._bid_book[47]['size'], 3)
-        self.assertEqual(self.ex1._bid_book[50]['orders'][self.ex1._bid_book[50]['order_ids'][0]]['quantity'], 1)
+        self.assertEqual(self.ex1._bid_book[50]['head'].leaves, 1)
         #self.assertEqual(len(self.ex1.sip_collector), 1)
         # market sell order takes out remainder first best bid and all of the next level
         self.assertEqual(len(self.ex1._bid_book_prices), 3)
@@ -433,7 +588,7 @@ class TestOrderbook(unittest.TestCase):
         self.assertTrue(52 in self.ex1._ask_book_prices)
         self.assertEqual(self.ex1._ask_book[53]['size'], 3)
         self.assertEqual(self.ex1._ask_book[55]['size'], 3)
-        self.assertEqual(self.ex1._ask_book[52]['orders'][self.ex1._ask_book[52]['order_ids'][0]]['quantity'], 1)
+        self.assertEqual(self.ex1._ask_book[52]['head'].leaves, 1)
         # market buy order takes out remainder first best ask and all of the next level
         self.assertEqual(len(self.ex1._ask_book_prices), 3)
         q2 = {'order_id': 't100_2', 'timestamp': 11, 'type': 'add', 'quantity': 4, 'side': 'buy',
@@ -476,6 +631,131 @@ class TestOrderbook(unittest.TestCase):
         self.ex1.report_top_of_book(5)
         self.assertDictEqual(self.ex1._sip_collector[0], tob_check)
         
+    def test_bbo(self):
+        '''
+        The inside is kept up to date by adds, cancels, modifies and trades;
+        report_top_of_book() only adds a SIP row when the inside changes
+        '''
+        self.assertIsNone(self.ex1.best_bid)
+        self.ex1.add_order_to_book(self.q1_buy)
+        self.ex1.add_order_to_book(self.q1_sell)
+        self.assertEqual((self.ex1.best_bid, self.ex1.bid_size, self.ex1.best_ask, self.ex1.ask_size), (50, 1, 52, 1))
+        tob1 = self.ex1.report_top_of_book(3)
+        seq = self.ex1.bbo_seq
+        # away from the inside: no change
+        self.ex1.process_order(self.q3_buy)
+        self.ex1.process_order(self.q4_sell)
+        self.assertEqual(self.ex1.bbo_seq, seq)
+        self.assertDictEqual(self.ex1.report_top_of_book(4), dict(tob1, timestamp=4))
+        self.assertEqual(len(self.ex1._sip_collector), 1)
+        # join the bid
+        self.ex1.process_order(self.q2_buy)
+        self.assertEqual(self.ex1.bid_size, 2)
+        tob2 = self.ex1.report_top_of_book(5)
+        self.assertDictEqual(tob2, {'timestamp': 5, 'best_bid': 50, 'best_ask': 52, 'bid_size': 2, 'ask_size': 1})
+        # cancel then re-add: the inside changes and changes back
+        c1 = {'order_id': 't1_2', 'timestamp': 6, 'type': 'cancel', 'quantity': 1, 'side': 'buy', 'price': 50}
+        self.ex1.process_order(c1)
+        self.assertEqual(self.ex1.bid_size, 1)
+        self.ex1.process_order(dict(self.q2_buy, timestamp=6))
+        self.assertDictEqual(self.ex1.report_top_of_book(6), dict(tob2, timestamp=6))
+        self.assertEqual(len(self.ex1._sip_collector), 2)
+        # a sell takes out 50 and trades at 49
+        q1 = {'order_id': 't100_1', 'timestamp': 7, 'type': 'add', 'quantity': 3, 'side': 'sell', 'price': 0}
+        self.ex1.process_order(q1)
+        self.assertEqual((self.ex1.best_bid, self.ex1.bid_size), (49, 2))
+        self.ex1.report_top_of_book(7)
+        self.assertDictEqual(self.ex1._sip_collector[-1], {'timestamp': 7, 'best_bid': 49, 'best_ask': 52,
+                                                           'bid_size': 2, 'ask_size': 1})
+        # the ask side empties
+        self.ex1._remove_order('sell', 52, 't1_3')
+        self.ex1._remove_order('sell', 55, 't11_2')
+        self.assertIsNone(self.ex1.best_ask)
+        self.assertEqual(self.ex1.ask_size, 0)
+
+    def test_report_top_of_book_empty_side(self):
+        '''
+        An empty side is None in the returned top of book and -1 in the SIP history
+        '''
+        self.ex1.add_order_to_book(self.q1_buy)
+        tob = self.ex1.report_top_of_book(2)
+        self.assertDictEqual(tob, {'timestamp': 2, 'best_bid': 50, 'best_ask': None, 'bid_size': 1, 'ask_size': 0})
+        self.assertDictEqual(self.ex1._sip_collector[0], {'timestamp': 2, 'best_bid': 50, 'best_ask': -1,
+                                                          'bid_size': 1, 'ask_size': 0})
+        # a market sell takes out the only bid: both sides are empty
+        self.ex1.process_order({'order_id': 't2_1', 'timestamp': 3, 'type': 'market', 'quantity': 1, 'side': 'sell',
+                                'price': 0})
+        tob = self.ex1.report_top_of_book(3)
+        self.assertEqual((tob['best_bid'], tob['best_ask']), (None, None))
+        self.assertEqual(self.ex1._sip_collector.column('best_bid').tolist(), [50, -1])
+        self.assertEqual(self.ex1._sip_collector.to_frame()['best_ask'].dtype, np.int64)
+        
+    def test_depth(self):
+        '''
+        Side totals follow adds, cancels, modifies and trades; depth() and record_depth() aggregate the best levels
+        '''
+        for q in [self.q1_buy, self.q2_buy, self.q3_buy, self.q4_buy, self.q1_sell, self.q2_sell, self.q3_sell]:
+            self.ex1.add_order_to_book(q)
+        self.assertEqual((self.ex1.total_bid_size, self.ex1.total_ask_size), (8, 5))
+        self.assertDictEqual(self.ex1.depth(2), {'bid_prices': [50, 49], 'bid_sizes': [2, 3], 'bid_cumulative': [2, 5],
+                                                 'ask_prices': [52, 53], 'ask_sizes': [2, 3], 'ask_cumulative': [2, 5]})
+        # a sell takes out 50 and 1 at 49, then a modify and a cancel
+        q1 = {'order_id': 't100_1', 'timestamp': 7, 'type': 'add', 'quantity': 3, 'side': 'sell', 'price': 0}
+        self.ex1.process_order(q1)
+        m1 = {'order_id': 't11_1', 'timestamp': 8, 'type': 'modify', 'quantity': 1, 'side': 'buy', 'price': 47}
+        self.ex1.process_order(m1)
+        c1 = {'order_id': 't1_3', 'timestamp': 9, 'type': 'cancel', 'quantity': 1, 'side': 'sell', 'price': 52}
+        self.ex1.process_order(c1)
+        self.assertEqual((self.ex1.total_bid_size, self.ex1.total_ask_size), (4, 4))
+        self.assertDictEqual(self.ex1.depth(3), {'bid_prices': [49, 47], 'bid_sizes': [2, 2], 'bid_cumulative': [2, 4],
+                                                 'ask_prices': [52, 53], 'ask_sizes': [1, 3], 'ask_cumulative': [1, 4]})
+        self.ex1.record_depth(9)
+        row = self.ex1._depth_collector[0]
+        self.assertEqual(len(row), 23)
+        self.assertEqual([row['timestamp'], row['total_bid_size'], row['total_ask_size']], [9, 4, 4])
+        self.assertEqual([row['bid_price_2'], row['bid_size_2'], row['ask_price_2'], row['ask_size_2']], [47, 2, 53, 3])
+        self.assertEqual([row['bid_price_3'], row['bid_size_3'], row['ask_price_3'], row['ask_size_3']], [0, 0, 0, 0])
+        
+    def test_depth_maintained(self):
+        '''
+        The depth view kept through adds, cancels, modifies, trades, market orders and mass_cancel()
+        matches the levels read from the book
+        '''
+        random.seed(39)
+        ex2 = Orderbook(tick=None if isinstance(self.ex1._bid_book_prices, list) else 1, depth_levels=3)
+        for i in range(1, 400):
+            trader = 't%d' % random.randint(1, 4)
+            side = random.choice(['buy', 'sell'])
+            resting = ex2._bid_orders if side == 'buy' else ex2._ask_orders
+            draw = random.random()
+            if draw < 0.7:
+                # mostly behind the inside, sometimes crossing it
+                price = random.randint(44, 50) if (side == 'buy') == (random.random() < 0.9) else random.randint(51, 57)
+                ex2.process_order({'order_id': '%s_%d' % (trader, i), 'timestamp': i, 'type': 'add',
+                                   'quantity': random.randint(1, 5), 'side': side, 'price': price})
+            elif draw < 0.82 and resting:
+                order = random.choice(list(resting.values()))
+                ex2.process_order({'order_id': order.order_id, 'timestamp': i, 'type': random.choice(['cancel', 'modify']),
+                                   'quantity': 1, 'side': side, 'price': order.price})
+            elif draw < 0.9:
+                ex2.process_order({'order_id': '%s_%d' % (trader, i), 'timestamp': i, 'type': 'market',
+                                   'quantity': random.randint(1, 8), 'side': side, 'price': 0})
+            else:
+                owned = [order_id for order_id in list(ex2._bid_orders) + list(ex2._ask_orders)
+                         if order_id.startswith(trader + '_')]
+                ex2.mass_cancel(i, trader, random.sample(owned, min(len(owned), 3)) if random.random() < 0.7 else None)
+            with self.subTest(i=i):
+                self.assertEqual(ex2._bid_depth, ex2._levels(ex2._bid_book_prices.highest(3), ex2._bid_book))
+                self.assertEqual(ex2._ask_depth, ex2._levels(ex2._ask_book_prices.lowest(3), ex2._ask_book))
+                owners = {}
+                for order_id in sorted(list(ex2._bid_orders) + list(ex2._ask_orders)):
+                    owners.setdefault(order_id.partition('_')[0], []).append(order_id)
+                self.assertEqual({owner: sorted(ids) for owner, ids in ex2._owner_orders.items() if ids}, owners)
+        # deeper than depth_levels: read from the price index
+        deep = ex2.depth(10)
+        self.assertEqual(deep['bid_prices'][:3], ex2.depth(3)['bid_prices'])
+        self.assertEqual(deep['ask_cumulative'][-1], sum(deep['ask_sizes']))
+        
     def test_market_collapse(self):
         '''
         At setup(), there is 8 total bid size and 8 total ask size
@@ -509,4 +789,353 @@ class TestOrderbook(unittest.TestCase):
         q4 = {'order_id': 't100_4', 'timestamp': 10, 'type': 'add', 'quantity': 5, 'side': 'sell',
               'price': 0}
         self.ex1.process_order(q4)
+
+    def test_empty_book(self):
+        '''
+        process_order() adds to the book when the opposite side is empty
+        '''
+        self.ex1.process_order(self.q1_buy)
+        self.assertEqual((self.ex1.best_bid, self.ex1.best_ask), (50, None))
+        self.ex1.process_order(self.q3_sell)
+        self.assertEqual((self.ex1.best_bid, self.ex1.best_ask), (50, 53))
+        self.assertFalse(self.ex1.traded)
+
+    def test_record(self):
+        '''
+        With record=False the book is maintained but orders, trades and confirmations are not recorded
+        '''
+        ex2 = Orderbook(record=False)
+        for order in [self.q1_buy, self.q1_sell, self.q3_buy, self.q3_sell]:
+            ex2.process_order(order)
+        c1 = {'order_id': 't1_1', 'timestamp': 6, 'type': 'cancel', 'quantity': 1, 'side': 'buy', 'price': 50}
+        q1 = {'order_id': 't100_1', 'timestamp': 7, 'type': 'add', 'quantity': 2, 'side': 'buy', 'price': 53}
+        trades, modifies = ex2.process_orders([c1, q1])
+        self.assertTrue(ex2.traded)
+        self.assertFalse(trades)
+        self.assertFalse(modifies)
+        self.assertFalse(ex2.order_history)
+        self.assertFalse(ex2.trade_book)
+        self.assertEqual(ex2._order_index, 6)
+        self.assertEqual((ex2.best_bid, ex2.bid_size, ex2.best_ask, ex2.ask_size), (49, 3, 53, 2))
+
+
+
+    def test_market(self):
+        '''
+        A market order fills whole levels in bulk, then part of the next level; the fills come back as one batch
+        '''
+        for order in [self.q1_buy, self.q2_buy, self.q3_buy, self.q4_buy, self.q1_sell, self.q2_sell, self.q3_sell]:
+            self.ex1.add_order_to_book(order)
+        m1 = {'order_id': 't100_1', 'timestamp': 7, 'type': 'market', 'quantity': 4, 'side': 'sell', 'price': 0}
+        self.ex1.process_order(m1)
+        self.assertTrue(self.ex1.traded)
+        self.assertEqual([(c['order_id'], c['quantity'], c['price']) for c in self.ex1.confirm_trade_collector],
+                         [('t1_1', 1, 50), ('t1_2', 1, 50), ('t10_1', 2, 49)])
+        self.assertEqual(self.ex1.trade_book.column('incoming_order_id').tolist(), ['t100_1']*3)
+        self.assertEqual(self.ex1.order_history[0]['type'], 'market')
+        self.assertNotIn(50, self.ex1._bid_book_prices)
+        self.assertEqual(self._queue_ids(self.ex1._bid_book[49]), ['t10_1'])
+        self.assertEqual(self.ex1._bid_orders['t10_1'].leaves, 1)
+        self.assertIsNone(self.ex1._bid_orders['t10_1'].prev)
+        self.assertNotIn('t1_1', self.ex1._bid_orders)
+        self.assertEqual((self.ex1.best_bid, self.ex1.bid_size, self.ex1.total_bid_size), (49, 1, 4))
+        # a buy takes out both ask levels, exactly
+        m2 = {'order_id': 't100_2', 'timestamp': 8, 'type': 'market', 'quantity': 5, 'side': 'buy', 'price': 0}
+        self.ex1.process_order(m2)
+        self.assertEqual(len(self.ex1.confirm_trade_collector), 3)
+        self.assertFalse(self.ex1._ask_book_prices)
+        self.assertEqual((self.ex1.best_ask, self.ex1.ask_size, self.ex1.total_ask_size), (None, 0, 0))
+        # nothing left to buy: the market order does not rest
+        print('Market Collapse Tests to stdout:\n')
+        m3 = {'order_id': 't100_3', 'timestamp': 9, 'type': 'market', 'quantity': 1, 'side': 'buy', 'price': 0}
+        self.ex1.process_order(m3)
+        self.assertFalse(self.ex1.traded)
+        self.assertNotIn('t100_3', self.ex1._bid_orders)
+        # a sell larger than the bids takes them all
+        m4 = {'order_id': 't100_4', 'timestamp': 10, 'type': 'market', 'quantity': 9, 'side': 'sell', 'price': 0}
+        self.ex1.process_order(m4)
+        self.assertEqual([c['order_id'] for c in self.ex1.confirm_trade_collector], ['t10_1', 't11_1'])
+        self.assertFalse(self.ex1._bid_book_prices)
+        self.assertEqual(self.ex1.total_bid_size, 0)
+
+    def test_mass_cancel(self):
+        '''
+        mass_cancel() removes a trader's orders in one pass, records a cancel row for each and
+        returns the confirmations together
+        '''
+        for order in [self.q1_buy, self.q2_buy, self.q3_buy, self.q1_sell, self.q2_sell, self.q3_sell]:
+            self.ex1.add_order_to_book(order)
+        self.ex1.process_order({'order_id': 't1_5', 'timestamp': 5, 'type': 'add', 'quantity': 2, 'side': 'sell',
+                                'price': 54})
+        confirms = self.ex1.mass_cancel(6, 't1', ['t1_2', 't1_3', 't1_99'])
+        self.assertEqual(confirms, self.ex1.confirm_modify_collector)
+        self.assertEqual(confirms, [{'timestamp': 6, 'trader': 't1', 'order_id': 't1_2', 'quantity': 1, 'side': 'buy'},
+                                    {'timestamp': 6, 'trader': 't1', 'order_id': 't1_3', 'quantity': 1, 'side': 'sell'}])
+        self.assertEqual([row['exid'] for row in self.ex1.order_history], [1, 2, 3])
+        self.assertEqual(self.ex1.order_history[2]['type'], 'cancel')
+        self.assertEqual(self._queue_ids(self.ex1._bid_book[50]), ['t1_1'])
+        self.assertEqual((self.ex1.best_bid, self.ex1.bid_size, self.ex1.best_ask, self.ex1.ask_size), (50, 1, 52, 1))
+        self.assertEqual((self.ex1.total_bid_size, self.ex1.total_ask_size), (4, 6))
+        # cancel all for t1: t1_1, t1_4 and t1_5
+        confirms = self.ex1.mass_cancel(7, 't1')
+        self.assertEqual(sorted(c['order_id'] for c in confirms), ['t1_1', 't1_4', 't1_5'])
+        self.assertNotIn(52, self.ex1._ask_book_prices)
+        self.assertEqual((self.ex1.best_bid, self.ex1.bid_size, self.ex1.best_ask, self.ex1.ask_size), (49, 3, 53, 3))
+        self.assertEqual(sorted(self.ex1._bid_orders), ['t10_1'])
+        self.assertFalse(self.ex1.mass_cancel(8, 't1'))
+
+    def test_mass_cancel_all(self):
+        '''
+        mass_cancel() without order_ids cancels all of the trader's resting orders on both sides, oldest first,
+        from the owner index; other traders' orders, the side totals, depth and the inside follow
+        '''
+        for order in [self.q1_buy, self.q2_buy, self.q3_buy, self.q4_buy, self.q1_sell, self.q2_sell, self.q3_sell]:
+            self.ex1.add_order_to_book(order)
+        # t1_3 fills, so it is no longer t1's to cancel
+        self.ex1.process_order({'order_id': 't2_1', 'timestamp': 7, 'type': 'market', 'quantity': 1, 'side': 'buy',
+                                'price': 0})
+        self.assertEqual(list(self.ex1._owner_orders['t1']), ['t1_1', 't1_2', 't1_4'])
+        confirms = self.ex1.mass_cancel(8, 't1')
+        self.assertEqual(confirms, [{'timestamp': 8, 'trader': 't1', 'order_id': 't1_1', 'quantity': 1, 'side': 'buy'},
+                                    {'timestamp': 8, 'trader': 't1', 'order_id': 't1_2', 'quantity': 1, 'side': 'buy'},
+                                    {'timestamp': 8, 'trader': 't1', 'order_id': 't1_4', 'quantity': 1, 'side': 'sell'}])
+        self.assertEqual(self.ex1.order_history.column('type').tolist()[-3:], ['cancel']*3)
+        self.assertEqual(sorted(self.ex1._bid_orders), ['t10_1', 't11_1'])
+        self.assertEqual(sorted(self.ex1._ask_orders), ['t10_2'])
+        self.assertEqual((self.ex1.total_bid_size, self.ex1.total_ask_size), (6, 3))
+        self.assertEqual((self.ex1.best_bid, self.ex1.bid_size, self.ex1.best_ask, self.ex1.ask_size), (49, 3, 53, 3))
+        self.assertDictEqual(self.ex1.depth(2), {'bid_prices': [49, 47], 'bid_sizes': [3, 3], 'bid_cumulative': [3, 6],
+                                                 'ask_prices': [53], 'ask_sizes': [3], 'ask_cumulative': [3]})
+        self.assertFalse(self.ex1._owner_orders['t1'])
+        self.assertFalse(self.ex1.mass_cancel(9, 't1'))
+        self.assertFalse(self.ex1.mass_cancel(9, 't99'))
+
+    def test_mass_cancel_owner(self):
+        '''
+        mass_cancel() only cancels the trader's own orders; the confirmations it returns are kept
+        when process_order() runs next
+        '''
+        for order in [self.q1_buy, self.q3_buy, self.q1_sell]:
+            self.ex1.add_order_to_book(order)
+        confirms = self.ex1.mass_cancel(6, 't1', ['t10_1', 't1_1'])
+        self.assertEqual(confirms, [{'timestamp': 6, 'trader': 't1', 'order_id': 't1_1', 'quantity': 1, 'side': 'buy'}])
+        self.assertIn('t10_1', self.ex1._bid_orders)
+        self.assertEqual(len(self.ex1.order_history), 1)
+        self.ex1.process_order({'order_id': 't1_3', 'timestamp': 7, 'type': 'cancel', 'quantity': 1, 'side': 'sell',
+                                'price': 52})
+        self.assertEqual([c['order_id'] for c in confirms], ['t1_1'])
+        self.assertEqual([c['order_id'] for c in self.ex1.confirm_modify_collector], ['t1_3'])
+
+    def test_mass_cancel_no_record(self):
+        '''
+        With record=False mass_cancel() still empties the book but confirms nothing, so handlers are not called
+        '''
+        ex2 = Orderbook(record=False)
+        cancels = []
+        orders = [Order('t1_1', 2, 'add', 1, 'buy', 50), Order('t1_2', 3, 'add', 1, 'buy', 50),
+                  Order('t1_3', 4, 'add', 1, 'sell', 52)]
+        # a handler carried in on the Order is not called either
+        for order in orders:
+            order.on_cancel = cancels.append
+            ex2.process_order(order)
+        self.assertFalse(ex2.mass_cancel(6, 't1', ['t1_1', 't1_3']))
+        self.assertFalse(ex2.mass_cancel(7, 't1'))
+        self.assertFalse(cancels)
+        self.assertFalse(ex2._bid_orders)
+        self.assertFalse(ex2._ask_orders)
+        self.assertEqual((ex2.total_bid_size, ex2.total_ask_size), (0, 0))
+        self.assertEqual((ex2.best_bid, ex2.best_ask), (None, None))
+        self.assertEqual(ex2._order_index, 6)
+        self.assertFalse(ex2.order_history)
+        # record is fixed when the Orderbook is made
+        with self.assertRaises(AttributeError):
+            ex2.record = True
+
+    def test_subscribe(self):
+        '''
+        subscribe() delivers fills and cancels to the owner's handlers once the book is updated
+        '''
+        events = []
+        def on_fill(confirm):
+            events.append(('fill', confirm['order_id'], confirm['quantity'],
+                           self.ex1._bid_orders.get(confirm['order_id'], self.ex1._ask_orders.get(confirm['order_id']))))
+        def on_cancel(confirm):
+            events.append(('cancel', confirm['order_id'], confirm['quantity'], None))
+        self.ex1.subscribe('t1', on_fill, on_cancel)
+        self.ex1.subscribe('t10', on_fill)
+        for order in [self.q1_buy, self.q2_buy, self.q3_buy, self.q1_sell, self.q2_sell, self.q3_sell]:
+            self.ex1.process_order(order)
+        # t1_1 fills and leaves the book before its handler runs; t1_2 is left with 1 of 2
+        self.ex1.process_order({'order_id': 't2_1', 'timestamp': 5, 'type': 'add', 'quantity': 1, 'side': 'sell',
+                                'price': 50})
+        self.assertEqual(events, [('fill', 't1_1', 1, None)])
+        self.assertEqual(self.ex1.confirm_trade_collector[0]['order_id'], 't1_1')
+        # market sweep: handlers run after the batch, the partial fill on t10_2 last
+        events.clear()
+        self.ex1.process_order({'order_id': 't2_2', 'timestamp': 6, 'type': 'market', 'quantity': 3, 'side': 'buy',
+                                'price': 0})
+        self.assertEqual([e[:3] for e in events], [('fill', 't1_3', 1), ('fill', 't1_4', 1), ('fill', 't10_2', 1)])
+        self.assertEqual(events[2][3].leaves, 2)
+        # cancel messages and mass_cancel(); t10 has no cancel handler
+        events.clear()
+        self.ex1.process_order({'order_id': 't1_2', 'timestamp': 7, 'type': 'cancel', 'quantity': 1, 'side': 'buy',
+                                'price': 50})
+        self.ex1.mass_cancel(8, 't10')
+        self.assertEqual(events, [('cancel', 't1_2', 1, None)])
+        # subscribe(owner) drops the handlers for later orders
+        self.ex1.subscribe('t1')
+        self.ex1.process_order({'order_id': 't1_5', 'timestamp': 9, 'type': 'add', 'quantity': 1, 'side': 'buy',
+                                'price': 50})
+        self.assertIsNone(self.ex1._bid_orders['t1_5'].on_fill)
+        with self.assertRaises(ValueError):
+            Orderbook(record=False).subscribe('t1', on_fill)
+
+    def test_spill_order_history(self):
+        '''
+        spill_order_history() writes order_history out max_rows rows at a time; order_history_chunks()
+        reads the written and held rows back in sequence
+        '''
+        with tempfile.TemporaryDirectory() as tempdir:
+            store = open_store(os.path.join(tempdir, 'run'), 'npy')
+            self.ex1.process_order(self.q1_buy)
+            self.assertEqual([len(c) for c in self.ex1.order_history_chunks(store)], [1])
+            self.ex1.spill_order_history(store, 3)
+            self.assertFalse(self.ex1.order_history)
+            for order in [self.q2_buy, self.q3_buy, self.q4_buy, self.q1_sell, self.q2_sell, self.q3_sell]:
+                self.ex1.process_order(order)
+                self.assertLessEqual(len(self.ex1.order_history), 3)
+            self.ex1.mass_cancel(6, 't1')
+            self.assertEqual(self.ex1.order_history.spills, 3)
+            self.assertEqual(len(store.read('orders')), 10)
+            chunks = list(self.ex1.order_history_chunks(store, chunksize=4))
+            self.assertEqual([len(c) for c in chunks], [4, 4, 2, 1])
+            history = np.concatenate([c.exid.to_numpy() for c in chunks])
+            self.assertEqual(history.tolist(), list(range(1, 12)))
+            self.assertEqual(chunks[-1].type.tolist(), ['cancel'])
+
+    def test_snapshot(self):
+        '''
+        restore() rebuilds the levels, queues, leaves, order index and inside from snapshot()
+        '''
+        for order in [self.q1_buy, self.q2_buy, self.q3_buy, self.q1_sell, self.q2_sell, self.q3_sell]:
+            self.ex1.process_order(order)
+        q1 = {'order_id': 't100_1', 'timestamp': 7, 'type': 'add', 'quantity': 3, 'side': 'sell', 'price': 49}
+        self.ex1.process_order(q1)
+        snapshot = self.ex1.snapshot()
+        self.assertIsInstance(snapshot, bytes)
+        ex2 = Orderbook(tick=1)
+        orders = ex2.restore(snapshot)
+        self.assertEqual(len(orders), 4)
+        self.assertEqual(self._queue_ids(ex2._ask_book[52]), ['t1_3', 't1_4'])
+        self.assertEqual(self._queue_ids(ex2._bid_book[49]), ['t10_1'])
+        self.assertEqual(ex2._bid_orders['t10_1'].leaves, 2)
+        self.assertEqual(ex2._bid_orders['t10_1'].exid, 3)
+        self.assertEqual(ex2.depth(5), self.ex1.depth(5))
+        self.assertEqual((ex2.best_bid, ex2.bid_size, ex2.best_ask, ex2.ask_size), (49, 2, 52, 2))
+        self.assertEqual((ex2._order_index, ex2.bbo_seq), (7, self.ex1.bbo_seq))
+        self.assertEqual((ex2.total_bid_size, ex2.total_ask_size), (2, 5))
+        self.assertFalse(ex2.order_history)
+        # the restored book trades
+        q2 = {'order_id': 't100_2', 'timestamp': 8, 'type': 'add', 'quantity': 1, 'side': 'buy', 'price': 52}
+        ex2.process_order(q2)
+        self.assertEqual(ex2.confirm_trade_collector[0]['order_id'], 't1_3')
+        self.assertEqual(ex2.order_history[0]['exid'], 8)
+        with self.assertRaises(ValueError):
+            ex2.restore(snapshot)
+        with self.assertRaises(ValueError):
+            Orderbook(interned=True).restore(snapshot)
+        self.assertFalse(Orderbook().restore(Orderbook().snapshot()))
+
+
+class TestOrderbookLadder(TestOrderbook):
+    '''
+    Repeat the Orderbook tests with tick-indexed PriceLadders as the price index
+    '''
+    
+    def setUp(self):
+        TestOrderbook.setUp(self)
+        self.ex1 = Orderbook(tick=1)
+        
+        
+class TestPriceLadder(unittest.TestCase):
+    '''
+    PriceLadder maps prices to slots and tracks the lowest and highest occupied slots.
+    '''
+    
+    def setUp(self):
+        self.l1 = PriceLadder(5, capacity=8)
+        
+    def test_add_remove(self):
+        '''
+        Add prices out of order, check [0], [-1], membership and sorted iteration;
+        remove the lowest and highest prices and check the next prices are found.
+        '''
+        self.assertFalse(self.l1)
+        for price in [100, 110, 90, 105]:
+            self.l1.add(price)
+        self.assertEqual(len(self.l1), 4)
+        self.assertEqual(self.l1[0], 90)
+        self.assertEqual(self.l1[-1], 110)
+        self.assertEqual(self.l1[-2], 105)
+        self.assertEqual(list(self.l1), [90, 100, 105, 110])
+        self.assertTrue(105 in self.l1)
+        self.assertFalse(95 in self.l1)
+        self.assertFalse(103 in self.l1)
+        self.l1.remove(90)
+        self.assertEqual(self.l1[0], 100)
+        self.l1.remove(110)
+        self.assertEqual(self.l1[-1], 105)
+        self.l1.remove(100)
+        self.l1.remove(105)
+        self.assertFalse(self.l1)
+        with self.assertRaises(ValueError):
+            self.l1.remove(105)
+        with self.assertRaises(IndexError):
+            self.l1[0]
+            
+    def test_remove_lowest_highest(self):
+        '''
+        remove_lowest() and remove_highest() free n slots from either end; reversed() walks down
+        '''
+        for price in [100, 110, 90, 105, 120]:
+            self.l1.add(price)
+        self.assertEqual(list(reversed(self.l1)), [120, 110, 105, 100, 90])
+        self.l1.remove_lowest(2)
+        self.assertEqual((self.l1[0], len(self.l1)), (105, 3))
+        self.l1.remove_highest(2)
+        self.assertEqual(list(self.l1), [105])
+        self.l1.remove_highest(1)
+        self.assertFalse(self.l1)
+        self.assertEqual(list(reversed(self.l1)), [])
+        self.l1.add(95)
+        self.assertEqual((self.l1[0], self.l1[-1]), (95, 95))
+
+    def test_lowest_highest(self):
+        '''
+        lowest() and highest() walk up to n occupied slots from either end.
+        '''
+        self.assertEqual(self.l1.highest(3), [])
+        for price in [100, 110, 90, 105]:
+            self.l1.add(price)
+        self.assertEqual(self.l1.lowest(2), [90, 100])
+        self.assertEqual(self.l1.highest(3), [110, 105, 100])
+        self.assertEqual(self.l1.highest(10), [110, 105, 100, 90])
+            
+    def test_recenter(self):
+        '''
+        Prices outside the slots recenter and grow the ladder; occupied prices are kept.
+        '''
+        self.l1.add(100)
+        self.l1.add(105)
+        self.assertEqual(len(self.l1._slots), 8)
+        self.l1.add(200)
+        self.assertGreaterEqual(len(self.l1._slots), 2*21)
+        self.l1.add(-50)
+        self.assertEqual(list(self.l1), [-50, 100, 105, 200])
+        self.assertEqual(self.l1[0], -50)
+        self.assertEqual(self.l1[-1], 200)
         
+    def test_off_tick(self):
+        self.l1.add(100)
+        with self.assertRaises(ValueError):
+            self.l1.add(102)
@@ -0,0 +1,129 @@
+import numpy as np
+import unittest
+
+from pyziabm.ids import make_order_id
+from pyziabm.orderbook3 import Order
+from pyziabm.population import MarketMakerPopulation, ProviderPopulation, TakerPopulation
+
+
+class TestPopulation(unittest.TestCase):
+    '''
+    Populations hold traders as arrays and quote for all the arriving traders of a step
+    '''
+
+    def setUp(self):
+        self.tob = {'best_bid': 995, 'best_ask': 1005, 'bid_size': 1, 'ask_size': 2}
+        self.t1 = TakerPopulation(['t0', 't1', 't2'], [1, 5, 1], [2, 3, 4])
+        self.p1 = ProviderPopulation(['p0', 'p1'], [1, 1], [1, 2], 5, 0.5, 10)
+        self.m1 = MarketMakerPopulation(['m0'], [1], [1], 5, 0.5, 12, 60, 10)
+
+    def test_taker(self):
+        '''
+        Takers arrive every t_delta steps and quote with their own sizes and sequences
+        '''
+        np.random.seed(1)
+        self.assertEqual(self.t1.prepare(6, 0.5).tolist(), [0, 1])
+        q = self.t1.quote(1, 6)
+        self.assertEqual((q.order_id, q.timestamp, q.type, q.quantity), ('t1_1', 6, 'add', 5))
+        self.assertEqual(q.price, 2000000 if q.side == 'buy' else 0)
+        self.assertEqual(self.t1.quote(0, 6).order_id, 't0_1')
+        self.t1.prepare(8, 1.0)
+        self.assertEqual((self.t1.quote(0, 8).order_id, self.t1.quote(2, 8).side), ('t0_2', 'buy'))
+        self.assertEqual(self.t1.sequence.tolist(), [2, 1, 1])
+        self.assertEqual(self.t1.trader_type, 'Taker')
+
+    def test_provider_price(self):
+        '''
+        Provider quotes are priced as Provider5.process_signal(): off the opposite side, on the mpi grid
+        '''
+        np.random.seed(2)
+        self.assertEqual(self.p1.prepare(2, 1.0, -100).tolist(), [0, 1])
+        plug = self.p1._quotes[0][3]
+        q = self.p1.quote(0, 2, self.tob)
+        self.assertEqual((q.order_id, q.side, q.price), ('p0_1', 'buy', 5*np.floor((1005-1-plug)/5)))
+        self.assertIs(self.p1.local_book['p0_1'], q)
+        self.p1.prepare(3, 0.0, -100)
+        plug = self.p1._quotes[0][3]
+        q = self.p1.quote(0, 3, self.tob)
+        self.assertEqual((q.side, q.price), ('sell', 5*np.ceil((995+1+plug)/5)))
+        self.assertIsNone(self.p1.quote(1, 3, self.tob))
+
+    def test_provider_cancels(self):
+        '''
+        Lifetimes count from start; an order due at its own step is cancelled at its row; filled orders are skipped
+        '''
+        np.random.seed(3)
+        quotes = {}
+        for step in range(10, 200):
+            self.p1.prepare(step, 0.5, -100)
+            for i in (0, 1):
+                q = self.p1.quote(i, step, self.tob)
+                if q is not None:
+                    quotes[q.order_id] = q
+                for order_id in self.p1.cancels(i):
+                    self.assertGreaterEqual(step, quotes[order_id].timestamp)
+                    quotes[order_id].leaves = 0
+                    self.p1.confirm_cancel_local({'order_id': order_id})
+        self.assertEqual(len(self.p1.local_book), len(self.p1._expiries))
+        self.assertLess(len(self.p1.local_book), 10)
+        # priming: orders before start are due from start
+        p2 = ProviderPopulation(['p0'], [1], [1], 5, 0.5, 10)
+        p2.prepare(1, 0.5, -100)
+        q = p2.quote(0, 1, self.tob)
+        self.assertEqual(p2.cancels(0), [])
+        q.leaves = 0
+        for step in range(10, 200):
+            p2._pop_due(step, np.empty(0, dtype=np.int64))
+            self.assertEqual(p2.cancels(0), [])
+        self.assertFalse(p2._expiries)
+
+    def test_restore_order(self):
+        p2 = ProviderPopulation([3, 4], [1, 1], [1, 1], 5, 0.5, 10)
+        p2.restore_order(Order(make_order_id(4, 7), 1, 'add', 1, 'buy', 995))
+        self.assertEqual(p2.sequence.tolist(), [0, 7])
+        p2.prepare(10, 0.5, -100)
+        self.assertEqual(p2.quote(1, 10, self.tob).order_id, make_order_id(4, 8))
+        self.assertEqual(len(p2.local_book), 2)
+
+    def test_restore_order_cancels(self):
+        '''
+        Warm start: every restored order is cancelled in time, also those with lifetime 0 (due at start)
+        '''
+        np.random.seed(6)
+        p2 = ProviderPopulation(['p0', 'p1'], [1, 1], [1000, 1000], 5, 0.5, 10)
+        restored = {}
+        for k in range(200):
+            q = Order('p%d_%d' % (k % 2, k+1), 1, 'add', 1, 'buy', 995)
+            restored[q.order_id] = q
+            p2.restore_order(q)
+        cancelled = set()
+        for step in range(10, 200):
+            p2.prepare(step, 0.5, -100)
+            for i in (0, 1):
+                for order_id in p2.cancels(i):
+                    cancelled.add(order_id)
+                    restored[order_id].leaves = 0
+                    p2.confirm_cancel_local({'order_id': order_id})
+        self.assertEqual(cancelled, set(restored))
+        self.assertFalse(p2.local_book)
+        self.assertFalse(p2._expiries)
+
+    def test_marketmaker(self):
+        '''
+        MarketMaker quotes are on the MarketMaker5 grid; fills update position and cash flow
+        '''
+        np.random.seed(4)
+        self.m1.prepare(10, 1.0)
+        quotes = self.m1.quote(0, 10, self.tob)
+        self.assertEqual([q.order_id for q in quotes], ['m0_%d' % i for i in range(1, 13)])
+        self.assertTrue(all(q.side == 'buy' and 930 <= q.price <= 990 and not q.price % 5 for q in quotes))
+        self.m1.prepare(11, 0.0)
+        quotes = self.m1.quote(0, 11, self.tob)
+        self.assertTrue(all(q.side == 'sell' and 1005 <= q.price <= 1065 for q in quotes))
+        quotes[0].leaves = 0
+        self.m1.confirm_trade_local({'timestamp': 12, 'trader': 'm0', 'order_id': quotes[0].order_id, 'quantity': 1,
+                                     'side': 'sell', 'price': quotes[0].price})
+        self.assertEqual((self.m1.position[0], self.m1.cash_flow[0]), (-1, quotes[0].price))
+        self.assertNotIn(quotes[0].order_id, self.m1.local_book)
+        self.assertEqual(self.m1.cash_flow_collector[0], {'mmid': 'm0', 'timestamp': 12, 'cash_flow': quotes[0].price,
+                                                          'position': -1})
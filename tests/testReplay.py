@@ -0,0 +1,79 @@
+import os
+import tempfile
+import unittest
+
+from pyziabm.orderbook3 import Orderbook
+from pyziabm.replay import Replay, SEED_EXID
+from pyziabm.storage import open_store
+
+
+class TestReplay(unittest.TestCase):
+    '''
+    Replay rebuilds an Orderbook from a recorded orders table
+    '''
+
+    def setUp(self):
+        '''
+        setUp records a short run: two seed quotes, then adds, a cancel and two trades
+        '''
+        self.tempdir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tempdir.name, 'run.h5')
+        self.ex1 = Orderbook()
+        for order_id, side, price in [('p999999_a', 'sell', 55), ('p999999_b', 'buy', 45)]:
+            seed = {'order_id': order_id, 'timestamp': 0, 'type': 'add', 'quantity': 1, 'side': side,
+                    'price': price, 'exid': SEED_EXID}
+            self.ex1.add_order_to_book(seed)
+            self.ex1.order_history.append(seed)
+        orders = [('t1_1', 1, 'add', 2, 'buy', 50), ('t2_1', 1, 'add', 1, 'sell', 52),
+                  ('t1_2', 2, 'add', 1, 'buy', 49), ('t1_1', 3, 'cancel', 2, 'buy', 50),
+                  ('t3_1', 4, 'add', 2, 'sell', 49), ('t4_1', 5, 'add', 3, 'buy', 55),
+                  ('t2_2', 6, 'add', 1, 'sell', 54)]
+        for order_id, timestamp, order_type, quantity, side, price in orders:
+            self.ex1.process_order({'order_id': order_id, 'timestamp': timestamp, 'type': order_type,
+                                    'quantity': quantity, 'side': side, 'price': price})
+        self.trades = self.ex1.trade_book.to_frame()
+        self.ex1.order_history_to_h5(self.path)
+
+    def tearDown(self):
+        self.tempdir.cleanup()
+
+    def _state(self, book):
+        return (book.best_bid, book.bid_size, book.best_ask, book.ask_size, book.total_bid_size,
+                book.total_ask_size, book.depth(5), sorted(book._bid_orders), sorted(book._ask_orders))
+
+    def test_run(self):
+        '''
+        Replaying the whole table rebuilds the book and, with record=True, the trade_book
+        '''
+        replay = Replay(self.path, chunksize=3, record=True)
+        book = replay.run()
+        self.assertEqual(self._state(book), self._state(self.ex1))
+        self.assertEqual(book.trade_book.to_frame().values.tolist(), self.trades.values.tolist())
+        self.assertEqual(replay.messages, 9)
+        self.assertEqual((replay.timestamp, replay.exid), (6, 7))
+        self.assertIs(replay.run(), book)
+
+    def test_stop(self):
+        '''
+        run() stops at a timestamp, an exid or a predicate and continues from there
+        '''
+        replay = Replay(self.path, chunksize=4)
+        book = replay.run(until_timestamp=2)
+        self.assertFalse(book.record)
+        self.assertEqual(replay.messages, 5)
+        self.assertEqual((book.best_bid, book.bid_size, book.best_ask), (50, 2, 52))
+        replay.run(until_exid=4)
+        self.assertEqual(replay.exid, 4)
+        self.assertEqual(book.best_bid, 49)
+        replay.run(stop=lambda order, book: book.traded)
+        self.assertEqual((replay.timestamp, replay.exid), (4, 5))
+        replay.run()
+        self.assertEqual(self._state(book), self._state(self.ex1))
+
+    def test_storage(self):
+        '''
+        Replay reads the orders table from any storage backend
+        '''
+        store = open_store(os.path.join(self.tempdir.name, 'npy'), 'npy')
+        store.append('orders', open_store(self.path).read('orders'))
+        self.assertEqual(self._state(Replay(store, chunksize=2).run()), self._state(self.ex1))
@@ -0,0 +1,177 @@
+import numpy as np
+import os
+import random
+import tempfile
+import unittest
+from unittest import mock
+
+from pyziabm import runner2017mpi_r3, runner2017mpi_r4
+from pyziabm.trader2017_r3 import ZITrader
+
+
+class Arbitrageur(ZITrader):
+    '''An agent type the runners do not know: it only acts through a registered HANDLERS entry'''
+
+    def __init__(self, name, maxq):
+        ZITrader.__init__(self, name, maxq)
+        self.trader_type = 'Arbitrageur'
+
+
+class TestRunner(unittest.TestCase):
+    '''
+    Runner (r4) rows are handled by the HANDLERS entry for the trader's trader_type
+    '''
+
+    def setUp(self):
+        np.random.seed(7)
+        random.seed(7)
+        self.r1 = runner2017mpi_r4.Runner(run_steps=100, storage='memory', alpha_pj=0.05)
+        self.calls = []
+
+    def _recorder(self, trader_type):
+        '''A handler which records its row and hands on a top of book naming itself'''
+        def handler(runner, trader, arrived, current_time, top_of_book):
+            self.assertIs(runner, self.r1)
+            self.calls.append((trader_type, trader.trader_id, arrived, current_time, top_of_book))
+            return 'after %s' % trader.trader_id
+        return handler
+
+    def _run_step(self, rows, pj=False):
+        '''run_mcs() over one more step made of rows'''
+        current_time = self.r1.run_steps
+        self.r1.run_steps += 1
+        handlers = {trader_type: self._recorder(trader_type) for trader_type in runner2017mpi_r4.HANDLERS}
+        handlers['Arbitrageur'] = self._recorder('Arbitrageur')
+        self.r1.num_acting = len(rows)
+        with mock.patch.dict(runner2017mpi_r4.HANDLERS, handlers), \
+                mock.patch.object(self.r1, 'make_rows', return_value=rows):
+            self.r1.run_mcs(current_time, pj)
+        return current_time
+
+    def test_handlers(self):
+        a1 = Arbitrageur('a0', 1)
+        rows = [[self.r1.provider_array[0], True], [a1, True], [self.r1.taker_array[0], True],
+                [self.r1.marketmaker_array[0], False]]
+        top_of_book = self.r1.exchange.report_top_of_book(self.r1.run_steps)
+        current_time = self._run_step(rows)
+        self.assertEqual(self.calls, [('Provider', 'p0', True, current_time, top_of_book),
+                                      ('Arbitrageur', 'a0', True, current_time, 'after p0'),
+                                      ('Taker', 't0', True, current_time, 'after a0'),
+                                      ('MarketMaker', 'm0', False, current_time, 'after t0')])
+        self.assertNotIn('Arbitrageur', runner2017mpi_r4.HANDLERS)
+        # once it is unregistered its rows are an error, not skipped
+        self.r1.run_steps += 1
+        with mock.patch.object(self.r1, 'make_rows', return_value=[[a1, True]]), self.assertRaises(KeyError):
+            self.r1.run_mcs(self.r1.run_steps - 1)
+
+    def test_pennyjumper_rows(self):
+        '''With pj the PennyJumper's rows go to its handler, after the rows it was drawn behind'''
+        self.r1.alpha_pj = 1
+        a1 = Arbitrageur('a0', 1)
+        self._run_step([[a1, True], [self.r1.taker_array[0], True]], pj=True)
+        self.assertEqual([call[:2] for call in self.calls], [('Arbitrageur', 'a0'), ('PennyJumper', 'j0'),
+                                                             ('Taker', 't0'), ('PennyJumper', 'j0')])
+
+    def test_add_pennyjumper(self):
+        '''The PennyJumper row follows each row whose draw is below alpha_pj'''
+        self.r1.alpha_pj = 0.3
+        rows = [('row', i) for i in range(200)]
+        state = np.random.get_state()
+        drawn = np.random.rand(len(rows)) < self.r1.alpha_pj
+        np.random.set_state(state)
+        expected = []
+        for row, jump in zip(rows, drawn):
+            expected.append(row)
+            if jump:
+                expected.append((self.r1.pennyjumper, True))
+        self.assertTrue(0 < drawn.sum() < len(rows))
+        self.assertEqual(self.r1.add_pennyjumper(list(rows)), expected)
+        self.r1.alpha_pj = 0
+        self.assertEqual(self.r1.add_pennyjumper(list(rows)), rows)
+
+    def test_add_pennyjumper_acting(self):
+        '''The PennyJumper is drawn once per trader acting in the step, however few of them have rows'''
+        self.r1.alpha_pj = 0.3
+        rows = [('row', i) for i in range(200)]
+        state = np.random.get_state()
+        full = self.r1.add_pennyjumper(list(rows))
+        np.random.set_state(state)
+        few = self.r1.add_pennyjumper(list(rows[:20]), len(rows))
+        self.assertEqual(len(few) - 20, len(full) - len(rows))
+        self.assertEqual([row for row in few if row[0] == 'row'], rows[:20])
+        # the arrivals still come when no trader has a row
+        np.random.set_state(state)
+        self.assertEqual(len(self.r1.add_pennyjumper([], len(rows))), len(full) - len(rows))
+
+    def _pennyjumper_arrivals(self, **kwargs):
+        '''The number of PennyJumper rows handled in a seeded run'''
+        np.random.seed(5)
+        random.seed(5)
+        arrivals = []
+        pennyjumper_row = runner2017mpi_r4.Runner.pennyjumper_row
+        def counted(runner, trader, arrived, current_time, top_of_book):
+            arrivals.append(current_time)
+            return pennyjumper_row(runner, trader, arrived, current_time, top_of_book)
+        with mock.patch.dict(runner2017mpi_r4.HANDLERS, {'PennyJumper': counted}), \
+                mock.patch.object(runner2017mpi_r4.Runner, 'pennyjumper_row', counted):
+            runner2017mpi_r4.Runner(run_steps=1500, storage='memory', pj=True, alpha_pj=0.05, **kwargs)
+        return len(arrivals)
+
+    def test_pennyjumper_rate(self):
+        '''Scheduled cancels and populations give fewer rows but the PennyJumper arrives as often'''
+        every_row = self._pennyjumper_arrivals()
+        self.assertGreater(every_row, 1000)
+        for mode in ['scheduled_cancels', 'population']:
+            with self.subTest(mode=mode):
+                self.assertLess(abs(self._pennyjumper_arrivals(**{mode: True}) - every_row), 0.1*every_row)
+
+    def test_run_mcsPJ(self):
+        with mock.patch.object(self.r1, 'run_mcs') as run_mcs:
+            self.r1.run_mcsPJ(20)
+        run_mcs.assert_called_once_with(20, pj=True)
+
+
+class TestRunnerR3(unittest.TestCase):
+    '''
+    Runner (r3): run_mcsPJ() is run_mcs(pj=True) and the PennyJumper rows are added to make_both()'s array
+    '''
+
+    def setUp(self):
+        self.tempdir = tempfile.TemporaryDirectory()
+        self.h5filename = os.path.join(self.tempdir.name, 'test.h5')
+
+    def tearDown(self):
+        self.tempdir.cleanup()
+
+    def _runner(self):
+        '''A seeded Runner after the setup steps; the run is short enough that nothing is written out'''
+        np.random.seed(11)
+        random.seed(11)
+        m1 = runner2017mpi_r3.Runner(run_steps=400, alpha_pj=0.05, h5filename=self.h5filename)
+        m1.seed_orderbook()
+        m1.make_setup(20)
+        return m1
+
+    def test_run_mcsPJ(self):
+        m1 = self._runner()
+        m1.run_mcs(20, pj=True)
+        m2 = self._runner()
+        m2.run_mcsPJ(20)
+        self.assertTrue(any(row['order_id'].startswith('j0_') for row in m1.exchange.order_history))
+        self.assertEqual(list(m1.exchange.order_history), list(m2.exchange.order_history))
+        self.assertEqual(list(m1.exchange.trade_book), list(m2.exchange.trade_book))
+        self.assertFalse(os.path.exists(self.h5filename))
+
+    def test_add_pennyjumper(self):
+        m1 = self._runner()
+        m1.alpha_pj = 0.3
+        rows = m1.make_both(20)
+        state = np.random.get_state()
+        drawn = np.flatnonzero(np.random.rand(len(rows)) < m1.alpha_pj)
+        np.random.set_state(state)
+        out = m1.add_pennyjumper(rows)
+        self.assertEqual(len(out), len(rows) + len(drawn))
+        # each drawn row k is followed by the PennyJumper, shifted by the rows inserted before it
+        self.assertEqual([k for k, row in enumerate(out) if row[0] is m1.pennyjumper],
+                         [k + n + 1 for n, k in enumerate(drawn.tolist())])
+        self.assertEqual([row[0] for row in out if row[0] is not m1.pennyjumper], [row[0] for row in rows])
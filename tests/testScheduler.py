@@ -0,0 +1,73 @@
+import numpy as np
+import unittest
+
+from pyziabm.scheduler import ArrivalCalendar, TimingWheel, validate_lifetimes
+
+
+class TestTimingWheel(unittest.TestCase):
+    '''
+    TimingWheel returns items at the step they are due, in the order they were scheduled
+    '''
+
+    def setUp(self):
+        self.w1 = TimingWheel(step=10, slots=4)
+
+    def test_schedule_pop(self):
+        self.w1.schedule(12, 'a')
+        self.w1.schedule(11, 'b')
+        self.w1.schedule(12, 'c')
+        # at or before the last step popped: due at the next step
+        self.w1.schedule(9, 'd')
+        self.assertEqual(len(self.w1), 4)
+        self.assertEqual(self.w1.pop(11), ['b', 'd'])
+        self.assertEqual(self.w1.pop(11), [])
+        self.assertEqual(self.w1.pop(12), ['a', 'c'])
+        self.assertFalse(self.w1)
+        self.assertEqual(self.w1.step, 12)
+
+    def test_overflow(self):
+        '''
+        Items beyond the ring wait in the overflow and come out in order, also when pop() skips steps
+        '''
+        self.w1.schedule(30, 'far')
+        self.w1.schedule(15, 'near')
+        self.w1.schedule(30, 'far2')
+        self.assertEqual(self.w1.pop(20), ['near'])
+        self.w1.schedule(30, 'ring')
+        self.assertEqual(self.w1.pop(29), [])
+        self.assertEqual(self.w1.pop(30), ['far', 'far2', 'ring'])
+        self.w1.schedule(100, 'later')
+        self.assertEqual(self.w1.pop(200), ['later'])
+        self.assertFalse(self.w1)
+
+
+class TestArrivalCalendar(unittest.TestCase):
+    '''
+    ArrivalCalendar gives the traders arriving at each step, as the np.remainder() masks did
+    '''
+
+    def test_arrivals(self):
+        t_delta = np.array([3., 1., 6., 4.])
+        c1 = ArrivalCalendar(t_delta, step=19)
+        for step in range(20, 200):
+            self.assertEqual(c1.arrivals(step), np.flatnonzero(np.remainder(step, t_delta) == 0).tolist())
+
+    def test_skipped_steps(self):
+        c1 = ArrivalCalendar([3, 5])
+        self.assertEqual(c1.arrivals(2), [])
+        self.assertEqual(c1.arrivals(10), [1])
+        self.assertEqual(c1.arrivals(12), [0])
+        self.assertEqual(c1.arrivals(15), [0, 1])
+
+
+class TestValidateLifetimes(unittest.TestCase):
+    '''
+    Scheduled lifetimes have the distribution of bulk_cancel() scans
+    '''
+
+    def test_validate_lifetimes(self):
+        result = validate_lifetimes(0.05, 5000, seed=1)
+        self.assertLess(result['ks'], 0.05)
+        for mode in ['scan', 'scheduled']:
+            self.assertAlmostEqual(result['mean'][mode], result['mean']['geometric'], delta=1.5)
+            self.assertGreater(result['orders'][mode], 4900)
@@ -0,0 +1,103 @@
+import numpy as np
+import pandas as pd
+import unittest
+
+from pyziabm.buffers import ColumnBuffer
+from pyziabm.stats import LagAutocorrelation, Moments, RunStats, StatsStore
+from pyziabm.storage import MemoryStore
+
+
+class TestStreams(unittest.TestCase):
+    '''
+    Moments and LagAutocorrelation fed in chunks give what pandas gives for the whole series
+    '''
+
+    def setUp(self):
+        np.random.seed(5)
+        self.values = pd.Series(np.random.standard_t(4, 3000))
+        self.values[0] = np.nan
+
+    def test_moments(self):
+        m1 = Moments()
+        for chunk in np.array_split(self.values.to_numpy(), [1, 700, 701, 2500]):
+            m1.add(chunk)
+        self.assertEqual(m1.count, 2999)
+        self.assertAlmostEqual(m1.mean, self.values.mean(), places=12)
+        self.assertAlmostEqual(m1.std(), self.values.std(), places=12)
+        self.assertAlmostEqual(m1.skew(), self.values.skew(), places=10)
+        self.assertAlmostEqual(m1.kurtosis(), self.values.kurtosis(), places=10)
+        self.assertTrue(np.isnan(Moments().std()))
+
+    def test_autocorr(self):
+        a1 = LagAutocorrelation(10)
+        for chunk in np.array_split(self.values.to_numpy(), [3, 4, 900, 1800]):
+            a1.add(chunk)
+        expected = [self.values.autocorr(lag=lag) for lag in range(1, 11)]
+        self.assertTrue(np.allclose(a1.autocorr(), expected, rtol=1e-9, atol=1e-12))
+        self.assertEqual(len(a1._tail), 10)
+
+
+class TestRunStats(unittest.TestCase):
+    '''
+    RunStats summarises the tables as they are appended, as the runwrapper does from the whole tables
+    '''
+
+    def setUp(self):
+        self.s1 = RunStats(spread_start=5, max_lag=2)
+
+    def test_spread(self):
+        '''
+        The spread counts for every step from its tob row to the step before the next row, up to the last row
+        '''
+        tob = pd.DataFrame({'timestamp': [0, 3, 3, 8, 9, 12], 'best_bid': [990, 990, 995, 995, 990, 995],
+                            'best_ask': [1000, 1005, 1005, 1010, 1000, 1000]})
+        self.s1.update('tob', tob.iloc[:2])
+        self.s1.update('tob', tob.iloc[2:])
+        spread = tob.assign(spread=tob.best_ask - tob.best_bid).groupby('timestamp').last()
+        spread = spread.reindex(range(0, 13)).ffill().loc[5:].spread
+        self.assertEqual(self.s1.summary(run=3)['spread'], {'Min': spread.min(), 'Max': spread.max(),
+                                                              'Median': spread.median(), 'Mean': spread.mean(),
+                                                              'MCRun': 3})
+
+    def test_spread_one_sided(self):
+        '''
+        While a side is empty (price -1 in the tob table) there is no spread: those steps are not counted
+        '''
+        tob = pd.DataFrame({'timestamp': [0, 6, 8, 9, 11], 'best_bid': [990, -1, 995, 995, 995],
+                            'best_ask': [1000, 1005, 1005, -1, 1000]})
+        self.s1.update('tob', tob)
+        # as the runwrapper's spread_to_list() reads it
+        spread = tob.assign(spread=(tob.best_ask - tob.best_bid).where((tob.best_bid >= 0) & (tob.best_ask >= 0)))
+        spread = spread.set_index('timestamp').reindex(range(0, 12), method='ffill').loc[5:].spread
+        self.assertEqual(spread.count(), 3)
+        self.assertEqual(self.s1.summary(run=3)['spread'], {'Min': spread.min(), 'Max': spread.max(),
+                                                            'Median': spread.median(), 'Mean': spread.mean(),
+                                                            'MCRun': 3})
+        self.assertEqual(spread.min(), 5)
+
+    def test_volumes(self):
+        orders = ColumnBuffer((('order_id', object), ('type', object), ('quantity', np.int64)))
+        for row in [('m0_1', 'add', 2), ('p1_1', 'add', 1), ('m0_1', 'cancel', 1), ('t1_1', 'add', 3), ('m0_2', 'add', 2)]:
+            orders.append_row(*row)
+        self.s1.update('orders', orders)
+        trades = pd.DataFrame({'resting_order_id': ['m0_1', 'p1_1', 'm0_2'], 'quantity': [1, 1, 2],
+                               'price': [1000, 1010, 1005]})
+        self.s1.update('trades', trades)
+        self.s1.update('mmp', pd.DataFrame({'mmid': ['m0', 'm0'], 'position': [-1, 1]}))
+        summary = self.s1.summary(run=1)
+        self.assertEqual(summary['participation'], {'MCRun': 1, 'MM_Participation': 75.0})
+        self.assertEqual(summary['position'], [{'MCRun': 1, 'MarketMaker': 'm0', 'Min': -1, 'Max': 1}])
+        self.assertEqual(summary['cancel_trade']['total_trade_to_order_vol'], 80.0)
+        self.assertEqual(summary['by_mm'], [{'MCRun': 1, 'MarketMaker': 'm0', 'CancelToTrade': 1/3, 'TradeToOrderPct': 75.0}])
+        returns = 100*trades.price.pct_change()
+        self.assertEqual((summary['returns']['Trades'], summary['returns']['MinPrice']), (3, 1000))
+        self.assertAlmostEqual(summary['returns']['MeanRet'], returns.mean())
+
+    def test_stats_store(self):
+        '''
+        StatsStore hands each append to the RunStats and the store it wraps
+        '''
+        store = StatsStore(MemoryStore(), self.s1)
+        store.append('mmp', pd.DataFrame({'mmid': ['m0'], 'position': [2]}))
+        self.assertEqual(len(store.read('mmp')), 1)
+        self.assertEqual(self.s1.summary()['position'][0]['Max'], 2)
@@ -0,0 +1,113 @@
+import numpy as np
+import os
+import pandas as pd
+import tempfile
+import unittest
+
+from pyziabm.buffers import ColumnBuffer
+from pyziabm.storage import H5Store, MemoryStore, NpyStore, as_store, open_store
+
+try:
+    import pyarrow
+except ImportError:
+    pyarrow = None
+
+
+class TestStorage(unittest.TestCase):
+    '''
+    Each storage backend appends ColumnBuffers and DataFrames to tables and reads them back
+    '''
+
+    def setUp(self):
+        self.tempdir = tempfile.TemporaryDirectory()
+        self.b1 = ColumnBuffer((('order_id', object), ('timestamp', np.int64), ('side', object)), block_size=4)
+
+    def tearDown(self):
+        self.tempdir.cleanup()
+
+    def _round_trip(self, storage):
+        store = open_store(os.path.join(self.tempdir.name, 'run'), storage)
+        for i in range(6):
+            self.b1.append_row('t1_%d' % i, i, 'buy' if i % 2 else 'sell')
+            if i % 3 == 2:
+                store.append('orders', self.b1.detach(), min_itemsize={'order_id': 12})
+        store.append('orders', self.b1)
+        store.append('qtl', pd.DataFrame({'qt_take': [0.5, 0.75]}))
+        store.close()
+        orders = store.read('orders')
+        self.assertEqual(list(orders.columns), ['order_id', 'timestamp', 'side'])
+        self.assertEqual(orders.order_id.tolist(), ['t1_%d' % i for i in range(6)])
+        self.assertEqual(orders.timestamp.tolist(), list(range(6)))
+        self.assertEqual(orders.side.tolist()[:2], ['sell', 'buy'])
+        self.assertEqual(store.read('qtl').qt_take.tolist(), [0.5, 0.75])
+        chunks = list(store.read_chunks('orders', 4))
+        self.assertTrue(all(0 < len(chunk) <= 4 for chunk in chunks))
+        self.assertEqual(sum((chunk.order_id.tolist() for chunk in chunks), []), ['t1_%d' % i for i in range(6)])
+        return store
+
+    def test_h5(self):
+        store = self._round_trip('h5')
+        self.assertIsInstance(store, H5Store)
+        self.assertIsInstance(as_store(store.path), H5Store)
+        self.assertIs(as_store(store), store)
+
+    @unittest.skipIf(pyarrow is None, 'pyarrow is not installed')
+    def test_parquet(self):
+        self._round_trip('parquet')
+
+    @unittest.skipIf(pyarrow is None, 'pyarrow is not installed')
+    def test_arrow(self):
+        self._round_trip('arrow')
+
+    def test_npy(self):
+        '''
+        npy files are valid (and memory mappable) after every append; strings are fixed width
+        '''
+        store = self._round_trip('npy')
+        timestamps = np.load(os.path.join(store.path, 'orders', 'timestamp.npy'), mmap_mode='r')
+        self.assertIsInstance(timestamps, np.memmap)
+        self.assertEqual(timestamps.tolist(), list(range(6)))
+        self.assertEqual(store.column('orders', 'order_id').dtype, np.dtype('<U16'))
+        self.b1.append_row('t1_%s' % ('9'*20), 7, 'buy')
+        with self.assertRaises(ValueError):
+            store.append('orders', self.b1)
+
+    def test_npy_index(self):
+        '''
+        A named index is stored as a column
+        '''
+        store = NpyStore(os.path.join(self.tempdir.name, 'sum'))
+        store.append('spread', pd.DataFrame({'MCRun': [1, 2], 'Mean': [5.0, 6.0]}).set_index('MCRun'))
+        self.assertEqual(store.read('spread').MCRun.tolist(), [1, 2])
+
+    def test_memory(self):
+        '''
+        The memory store copies what is appended, writes no files and saves to another backend
+        '''
+        store = self._round_trip('memory')
+        self.assertIsInstance(store, MemoryStore)
+        self.assertFalse(os.path.exists(store.path))
+        self.b1.clear()
+        self.b1.append_row('t9_1', 9, 'buy')
+        self.assertEqual(store.read('orders').order_id.tolist()[-1], 't1_5')
+        self.assertEqual(sorted(store.keys()), ['orders', 'qtl'])
+        with self.assertRaises(KeyError):
+            store.read('trades')
+        saved = store.save(os.path.join(self.tempdir.name, 'saved.h5'))
+        self.assertEqual(saved.read('orders').order_id.tolist(), ['t1_%d' % i for i in range(6)])
+
+    def test_open_store(self):
+        with self.assertRaises(ValueError):
+            open_store('run', 'csv')
+
+    def test_reopen(self):
+        '''
+        A new store on the same path appends to the existing tables
+        '''
+        for storage in ['h5', 'npy'] + (['parquet', 'arrow'] if pyarrow else []):
+            path = os.path.join(self.tempdir.name, storage)
+            for i in range(2):
+                store = open_store(path, storage)
+                store.append('spread', pd.DataFrame({'MCRun': [i], 'Mean': [5.0 + i]}))
+                store.close()
+            self.assertEqual(open_store(path, storage).read('spread').Mean.tolist(), [5.0, 6.0])
@@ -2,7 +2,14 @@ import random
 import numpy as np
 import unittest
 
-from pyziabm.trader2017_r3 import Provider, Provider5, Taker, MarketMaker, MarketMaker5, PennyJumper, InformedTrader
+from pyziabm.ids import make_order_id
+from pyziabm.orderbook3 import Order
+from pyziabm.scheduler import TimingWheel
+from pyziabm.trader2017_r3 import Provider, Provider5, Taker, MarketMaker, MarketMaker5, PennyJumper
+try:
+    from pyziabm.trader2017_r3 import InformedTrader
+except ImportError: # the README notes InformedTrader is not implemented in trader2017_r3
+    InformedTrader = None
 
 
 class TestTrader(unittest.TestCase):
@@ -21,31 +28,32 @@ class TestTrader(unittest.TestCase):
         self.p1 = Provider('p1', 1, 1, 0.05)
         self.p5 = Provider5('p5', 1, 5, 0.05)
         self.t1 = Taker('t1', 1)
-        self.i1 = InformedTrader('i1', 1, 'buy')
-        self.i2 = InformedTrader('i2', 2, 'sell')
+        if InformedTrader is not None:
+            self.i1 = InformedTrader('i1', 1, 'buy')
+            self.i2 = InformedTrader('i2', 2, 'sell')
         self.m1 = MarketMaker('m1', 1, 1, 0.05, 12, 60)
         self.m5 = MarketMaker5('m5', 1, 5, 0.05, 12, 60)
         self.j1 = PennyJumper('j1', 1, 5)
-        self.q1 = {'order_id': 'p1_1', 'timestamp': 1, 'type': 'add', 'quantity': 1, 'side': 'buy',
-                   'price': 125}
-        self.q2 = {'order_id': 'p1_2', 'timestamp': 2, 'type': 'add', 'quantity': 5, 'side': 'buy',
-                   'price': 125}
-        self.q3 = {'order_id': 'p1_3', 'timestamp': 3, 'type': 'add', 'quantity': 1, 'side': 'buy',
-                   'price': 124}
-        self.q4 = {'order_id': 'p1_4', 'timestamp': 4, 'type': 'add', 'quantity': 1, 'side': 'buy',
-                   'price': 123}
-        self.q5 = {'order_id': 'p1_5', 'timestamp': 5, 'type': 'add', 'quantity': 1, 'side': 'buy',
-                   'price': 122}
-        self.q6 = {'order_id': 'p1_6', 'timestamp': 6, 'type': 'add', 'quantity': 1, 'side': 'sell',
-                   'price': 126}
-        self.q7 = {'order_id': 'p1_7', 'timestamp': 7, 'type': 'add', 'quantity': 5, 'side': 'sell',
-                   'price': 127}
-        self.q8 = {'order_id': 'p1_8', 'timestamp': 8, 'type': 'add', 'quantity': 1, 'side': 'sell',
-                   'price': 128}
-        self.q9 = {'order_id': 'p1_9', 'timestamp': 9, 'type': 'add', 'quantity': 1, 'side': 'sell',
-                   'price': 129}
-        self.q10 = {'order_id': 'p1_10', 'timestamp': 10, 'type': 'add', 'quantity': 1, 'side': 'sell',
-                   'price': 130}
+        self.q1 = Order.from_dict({'order_id': 'p1_1', 'timestamp': 1, 'type': 'add', 'quantity': 1, 'side': 'buy',
+                   'price': 125})
+        self.q2 = Order.from_dict({'order_id': 'p1_2', 'timestamp': 2, 'type': 'add', 'quantity': 5, 'side': 'buy',
+                   'price': 125})
+        self.q3 = Order.from_dict({'order_id': 'p1_3', 'timestamp': 3, 'type': 'add', 'quantity': 1, 'side': 'buy',
+                   'price': 124})
+        self.q4 = Order.from_dict({'order_id': 'p1_4', 'timestamp': 4, 'type': 'add', 'quantity': 1, 'side': 'buy',
+                   'price': 123})
+        self.q5 = Order.from_dict({'order_id': 'p1_5', 'timestamp': 5, 'type': 'add', 'quantity': 1, 'side': 'buy',
+                   'price': 122})
+        self.q6 = Order.from_dict({'order_id': 'p1_6', 'timestamp': 6, 'type': 'add', 'quantity': 1, 'side': 'sell',
+                   'price': 126})
+        self.q7 = Order.from_dict({'order_id': 'p1_7', 'timestamp': 7, 'type': 'add', 'quantity': 5, 'side': 'sell',
+                   'price': 127})
+        self.q8 = Order.from_dict({'order_id': 'p1_8', 'timestamp': 8, 'type': 'add', 'quantity': 1, 'side': 'sell',
+                   'price': 128})
+        self.q9 = Order.from_dict({'order_id': 'p1_9', 'timestamp': 9, 'type': 'add', 'quantity': 1, 'side': 'sell',
+                   'price': 129})
+        self.q10 = Order.from_dict({'order_id': 'p1_10', 'timestamp': 10, 'type': 'add', 'quantity': 1, 'side': 'sell',
+                   'price': 130})
         
 # ZITrader tests
     
@@ -57,7 +65,23 @@ class TestTrader(unittest.TestCase):
         q = self.p1._make_add_quote(time, quantity, side, price)
         expected = {'order_id': 'p1_1', 'timestamp': 1, 'type': 'add', 'quantity': 1, 'side': 'sell', 
                     'price': 125}
-        self.assertDictEqual(q, expected)
+        self.assertDictEqual(q.as_dict(), expected)
+        self.assertEqual(q.leaves, 1)
+        
+    def test_make_add_quote_interned(self):
+        '''
+        Integer trader ids make integer order ids with the trader id in the high bits
+        '''
+        t2 = Taker(7, 1)
+        q1 = t2._make_add_quote(1, 1, 'sell', 125)
+        q2 = t2._make_add_quote(2, 1, 'sell', 125)
+        self.assertEqual(q1['order_id'], make_order_id(7, 1))
+        self.assertEqual(q2['order_id'], make_order_id(7, 2))
+        # NumPy integer names (e.g. from an array of trader numbers) are interned too
+        t3 = Taker(np.int64(8), 1)
+        q3 = t3._make_add_quote(3, 1, 'sell', 125)
+        self.assertEqual(q3['order_id'], make_order_id(8, 1))
+        self.assertIs(type(q3['order_id']), int)
         
 # Taker tests
 
@@ -84,14 +108,20 @@ class TestTrader(unittest.TestCase):
         self.assertEqual(len(self.t1.quote_collector), 1)
         self.assertEqual(self.t1.quote_collector[0]['side'], 'sell')
         self.assertEqual(self.t1.quote_collector[0]['price'], 0)
+        self.assertEqual(self.t1.quote_collector[0]['type'], 'add')
+        t2 = Taker('t2', 1, market=True)
+        t2.process_signal(time, q_taker)
+        self.assertEqual(t2.quote_collector[0]['type'], 'market')
         
 # InformedTrader tests
 
+    @unittest.skipIf(InformedTrader is None, 'trader2017_r3 has no InformedTrader')
     def test_repr_InformedTrader(self):
         #print('Provider: {0}, Taker: {1}'.format(self.p1, self.t1))
         self.assertEqual('Taker: Trader(i1, 1, InformedTrader)', 'Taker: {0}'.format(self.i1))
         self.assertEqual('Taker: Trader(i2, 2, InformedTrader)', 'Taker: {0}'.format(self.i2))
         
+    @unittest.skipIf(InformedTrader is None, 'trader2017_r3 has no InformedTrader')
     def test_process_signal_InformedTrader(self):
         '''
         Generates a quote object (dict) and appends to quote_collector
@@ -121,7 +151,11 @@ class TestTrader(unittest.TestCase):
         q = self.p1._make_cancel_quote(self.q1, 2)
         expected = {'order_id': 'p1_1', 'timestamp': 2, 'type': 'cancel', 'quantity': 1, 'side': 'buy', 
                     'price': 125}
-        self.assertDictEqual(q, expected)
+        self.assertDictEqual(q.as_dict(), expected)
+        # cancel quantity is the quantity still resting
+        self.q2.leaves = 3
+        q = self.p1._make_cancel_quote(self.q2, 3)
+        self.assertEqual(q.quantity, 3)
         
     def test_confirm_cancel_local_Provider(self):
         self.p1.local_book[self.q1['order_id']] = self.q1
@@ -133,27 +167,43 @@ class TestTrader(unittest.TestCase):
         expected = {self.q2['order_id']: self.q2}
         self.assertDictEqual(self.p1.local_book, expected)
 
+    def test_restore_order_Provider(self):
+        '''
+        restore_order() puts the Order in the local_book; new order ids follow its sequence
+        '''
+        self.p1.restore_order(self.q3)
+        self.p1.restore_order(self.q1)
+        self.assertIs(self.p1.local_book['p1_3'], self.q3)
+        self.assertEqual(self.p1._make_add_quote(6, 1, 'buy', 125).order_id, 'p1_4')
+        seed = Order('p1_a', 0, 'add', 1, 'sell', 126)
+        self.p1.restore_order(seed)
+        self.assertEqual(len(self.p1.local_book), 3)
+        self.assertEqual(self.p1._make_add_quote(7, 1, 'buy', 125).order_id, 'p1_5')
+
     def test_confirm_trade_local_Provider(self):
         '''
         Test Provider for full and partial trade
         '''
-        # Provider
+        # Provider; the Orderbook updates leaves on the shared Order before confirming
         self.p1.local_book[self.q1['order_id']] = self.q1
         self.p1.local_book[self.q2['order_id']] = self.q2
         # trade full quantity of q1
         trade1 = {'timestamp': 2, 'trader': 'p1', 'order_id': 'p1_1', 'quantity': 1, 'side': 'buy', 'price': 2000000}
         self.assertEqual(len(self.p1.local_book), 2)
+        self.q1.leaves = 0
         self.p1.confirm_trade_local(trade1)
         self.assertEqual(len(self.p1.local_book), 1)
         expected = {self.q2['order_id']: self.q2}
         self.assertDictEqual(self.p1.local_book, expected)
         # trade partial quantity of q2
         trade2 = {'timestamp': 3, 'trader': 'p1', 'order_id': 'p1_2', 'quantity': 2, 'side': 'buy', 'price': 2000000}
+        self.q2.leaves = 3
         self.p1.confirm_trade_local(trade2)
         self.assertEqual(len(self.p1.local_book), 1)
-        expected = {'order_id': 'p1_2', 'timestamp': 2, 'type': 'add', 'quantity': 3, 'side': 'buy', 
+        expected = {'order_id': 'p1_2', 'timestamp': 2, 'type': 'add', 'quantity': 5, 'side': 'buy', 
                     'price': 125}
-        self.assertDictEqual(self.p1.local_book.get(trade2['order_id']), expected) 
+        self.assertDictEqual(self.p1.local_book.get(trade2['order_id']).as_dict(), expected)
+        self.assertEqual(self.p1.local_book.get(trade2['order_id']).leaves, 3) 
         
     def test_choose_price_from_exp(self):
         # mpi == 1
@@ -225,6 +275,48 @@ class TestTrader(unittest.TestCase):
         self.p1.bulk_cancel(12)
         self.assertFalse(self.p1.cancel_collector)
         
+    def test_schedule_cancels_Provider(self):
+        '''
+        With scheduled lifetimes, bulk_cancel() cancels the orders due and skips filled orders
+        '''
+        for q in [self.q1, self.q2, self.q3]:
+            self.p1.local_book[q.order_id] = q
+        np.random.seed(8)
+        self.p1.schedule_cancels(11)
+        self.assertEqual(len(self.p1._expiries), 3)
+        expiries = {}
+        for step in range(11, 1000):
+            self.p1.bulk_cancel(step)
+            for c in self.p1.cancel_collector:
+                expiries[c.order_id] = step
+                self.assertEqual(c.type, 'cancel')
+                self.p1.local_book[c.order_id].leaves = 0
+                self.p1.confirm_cancel_local(c)
+            if len(expiries) == 3:
+                break
+        self.assertFalse(self.p1.local_book)
+        self.assertFalse(self.p1._expiries)
+        # new orders get a lifetime when they are added; a filled order is not cancelled
+        self.p1.process_signal(step+1, {'best_bid': 120, 'best_ask': 130}, 0.5, -100)
+        q = self.p1.quote_collector[0]
+        self.assertEqual(len(self.p1._expiries), 1)
+        q.leaves = 0
+        for later in range(step+1, step+2000):
+            self.p1.bulk_cancel(later)
+            self.assertFalse(self.p1.cancel_collector)
+        self.assertFalse(self.p1._expiries)
+        # MarketMaker quotes are scheduled together; a shared calendar is told the steps they are due
+        calendar = TimingWheel(0)
+        self.m1.schedule_cancels(1, calendar)
+        self.m1.process_signal(1, {'best_bid': 120, 'best_ask': 130, 'bid_size': 2, 'ask_size': 2}, 0.5)
+        self.assertEqual(len(self.m1._expiries), 12)
+        self.assertEqual(len(calendar), 12)
+        for step in range(1, 5000):
+            due = calendar.pop(step)
+            self.m1.bulk_cancel(step)
+            self.assertEqual(bool(due), bool(self.m1.cancel_collector))
+        self.assertFalse(calendar)
+        
     # MarketMaker tests
            
     def test_repr_MM(self):
@@ -241,6 +333,7 @@ class TestTrader(unittest.TestCase):
         # trade full quantity of q1
         trade1 = {'timestamp': 2, 'trader': 'p1', 'order_id': 'p1_1', 'quantity': 1, 'side': 'buy', 'price': 2000000}
         self.assertEqual(len(self.m1.local_book), 2)
+        self.q1.leaves = 0
         self.m1.confirm_trade_local(trade1)
         self.assertEqual(len(self.m1.local_book), 1)
         self.assertEqual(self.m1._position, 1)
@@ -248,12 +341,14 @@ class TestTrader(unittest.TestCase):
         self.assertDictEqual(self.m1.local_book, expected)
         # trade partial quantity of q2
         trade2 = {'timestamp': 3, 'trader': 'p1', 'order_id': 'p1_2', 'quantity': 2, 'side': 'buy', 'price': 2000000}
+        self.q2.leaves = 3
         self.m1.confirm_trade_local(trade2)
         self.assertEqual(len(self.m1.local_book), 1)
         self.assertEqual(self.m1._position, 3)
-        expected = {'order_id': 'p1_2', 'timestamp': 2, 'type': 'add', 'quantity': 3, 'side': 'buy', 
+        expected = {'order_id': 'p1_2', 'timestamp': 2, 'type': 'add', 'quantity': 5, 'side': 'buy', 
                     'price': 125}
-        self.assertDictEqual(self.m1.local_book.get(trade2['order_id']), expected) 
+        self.assertDictEqual(self.m1.local_book.get(trade2['order_id']).as_dict(), expected)
+        self.assertEqual(self.m1.local_book.get(trade2['order_id']).leaves, 3) 
         
         # MarketMaker sells
         self.setUp()
@@ -262,6 +357,7 @@ class TestTrader(unittest.TestCase):
         # trade full quantity of q6
         trade1 = {'timestamp': 6, 'trader': 'p1', 'order_id': 'p1_6', 'quantity': 1, 'side': 'sell', 'price': 0}
         self.assertEqual(len(self.m1.local_book), 2)
+        self.q6.leaves = 0
         self.m1.confirm_trade_local(trade1)
         self.assertEqual(len(self.m1.local_book), 1)
         self.assertEqual(self.m1._position, -1)
@@ -269,12 +365,14 @@ class TestTrader(unittest.TestCase):
         self.assertDictEqual(self.m1.local_book, expected)
         # trade partial quantity of q7
         trade2 = {'timestamp': 7, 'trader': 'p1', 'order_id': 'p1_7', 'quantity': 2, 'side': 'sell', 'price': 0}
+        self.q7.leaves = 3
         self.m1.confirm_trade_local(trade2)
         self.assertEqual(len(self.m1.local_book), 1)
         self.assertEqual(self.m1._position, -3)
-        expected = {'order_id': 'p1_7', 'timestamp': 7, 'type': 'add', 'quantity': 3, 'side': 'sell', 
+        expected = {'order_id': 'p1_7', 'timestamp': 7, 'type': 'add', 'quantity': 5, 'side': 'sell', 
                     'price': 127}
-        self.assertDictEqual(self.m1.local_book.get(trade2['order_id']), expected) 
+        self.assertDictEqual(self.m1.local_book.get(trade2['order_id']).as_dict(), expected)
+        self.assertEqual(self.m1.local_book.get(trade2['order_id']).leaves, 3) 
         
     def test_cumulate_cashflow_MM(self):
         self.assertFalse(self.m1.cash_flow_collector)
@@ -398,10 +496,10 @@ class TestTrader(unittest.TestCase):
         
     def test_confirm_trade_local_PJ(self):
         # PennyJumper book
-        self.j1._bid_quote = {'order_id': 'j1_1', 'timestamp': 1, 'type': 'add', 'quantity': 1, 'side': 'buy',
-                             'price': 125}
-        self.j1._ask_quote = {'order_id': 'j1_6', 'timestamp': 6, 'type': 'add', 'quantity': 1, 'side': 'sell',
-                              'price': 126}
+        self.j1._bid_quote = Order.from_dict({'order_id': 'j1_1', 'timestamp': 1, 'type': 'add', 'quantity': 1, 'side': 'buy',
+                             'price': 125})
+        self.j1._ask_quote = Order.from_dict({'order_id': 'j1_6', 'timestamp': 6, 'type': 'add', 'quantity': 1, 'side': 'sell',
+                              'price': 126})
         # trade at the bid
         trade1 = {'timestamp': 2, 'trader': 'j1', 'order_id': 'j1_1', 'quantity': 1, 'side': 'buy', 'price': 0}
         self.assertTrue(self.j1._bid_quote)
@@ -413,6 +511,13 @@ class TestTrader(unittest.TestCase):
         self.j1.confirm_trade_local(trade2)
         self.assertFalse(self.j1._ask_quote)
         
+    def test_restore_order_PJ(self):
+        j2 = PennyJumper(3, 1, 5)
+        j2.restore_order(Order(make_order_id(3, 7), 1, 'add', 1, 'sell', 126))
+        self.assertEqual(j2._ask_quote.price, 126)
+        self.assertIsNone(j2._bid_quote)
+        self.assertEqual(j2._make_add_quote(2, 1, 'buy', 125).order_id, make_order_id(3, 8))
+        
     def test_process_signal_PJ(self):
         # spread > mpi
         tob = {'bid_size': 5, 'best_bid': 999990, 'best_ask': 1000005, 'ask_size': 5}
@@ -423,84 +528,84 @@ class TestTrader(unittest.TestCase):
         # jump the bid by 1, then jump the ask by 1
         random.seed(1)
         self.j1.process_signal(5, tob, 0.5)
-        self.assertDictEqual(self.j1._bid_quote, {'order_id': 'j1_1', 'timestamp': 5, 'type': 'add', 'quantity': 1, 'side': 'buy',
+        self.assertDictEqual(self.j1._bid_quote.as_dict(), {'order_id': 'j1_1', 'timestamp': 5, 'type': 'add', 'quantity': 1, 'side': 'buy',
                                                  'price': 999995})
         tob = {'bid_size': 1, 'best_bid': 999995, 'best_ask': 1000005, 'ask_size': 5}
         self.j1.process_signal(6, tob, 0.5)
-        self.assertDictEqual(self.j1._ask_quote, {'order_id': 'j1_2', 'timestamp': 6, 'type': 'add', 'quantity': 1, 'side': 'sell',
+        self.assertDictEqual(self.j1._ask_quote.as_dict(), {'order_id': 'j1_2', 'timestamp': 6, 'type': 'add', 'quantity': 1, 'side': 'sell',
                                                  'price': 1000000})
         # PJ alone at tob
         tob = {'bid_size': 1, 'best_bid': 999995, 'best_ask': 1000000, 'ask_size': 1}
         # nothing happens
         self.j1.process_signal(7, tob, 0.5)
-        self.assertDictEqual(self.j1._bid_quote, {'order_id': 'j1_1', 'timestamp': 5, 'type': 'add', 'quantity': 1, 'side': 'buy',
+        self.assertDictEqual(self.j1._bid_quote.as_dict(), {'order_id': 'j1_1', 'timestamp': 5, 'type': 'add', 'quantity': 1, 'side': 'buy',
                                                  'price': 999995})
-        self.assertDictEqual(self.j1._ask_quote, {'order_id': 'j1_2', 'timestamp': 6, 'type': 'add', 'quantity': 1, 'side': 'sell',
+        self.assertDictEqual(self.j1._ask_quote.as_dict(), {'order_id': 'j1_2', 'timestamp': 6, 'type': 'add', 'quantity': 1, 'side': 'sell',
                                                  'price': 1000000})
         # PJ bid and ask behind the book
         tob = {'bid_size': 1, 'best_bid': 999990, 'best_ask': 1000005, 'ask_size': 1}
-        self.j1._bid_quote = {'order_id': 'j1_1', 'timestamp': 5, 'type': 'add', 'quantity': 1, 'side': 'buy',
-                             'price': 999985}
-        self.j1._ask_quote = {'order_id': 'j1_2', 'timestamp': 6, 'type': 'add', 'quantity': 1, 'side': 'sell',
-                             'price': 1000010}
+        self.j1._bid_quote = Order.from_dict({'order_id': 'j1_1', 'timestamp': 5, 'type': 'add', 'quantity': 1, 'side': 'buy',
+                             'price': 999985})
+        self.j1._ask_quote = Order.from_dict({'order_id': 'j1_2', 'timestamp': 6, 'type': 'add', 'quantity': 1, 'side': 'sell',
+                             'price': 1000010})
         # random.seed = 1 generates random.uniform(0,1) = 0.13 then .85
         # jump the bid by 1, then jump the ask by 1; cancel old quotes
         random.seed(1)
         self.j1.process_signal(10, tob, 0.5)
-        self.assertDictEqual(self.j1._bid_quote, {'order_id': 'j1_3', 'timestamp': 10, 'type': 'add', 'quantity': 1, 'side': 'buy',
+        self.assertDictEqual(self.j1._bid_quote.as_dict(), {'order_id': 'j1_3', 'timestamp': 10, 'type': 'add', 'quantity': 1, 'side': 'buy',
                                                  'price': 999995})
-        self.assertDictEqual(self.j1.cancel_collector[0], {'order_id': 'j1_1', 'timestamp': 10, 'type': 'cancel', 'quantity': 1, 'side': 'buy',
+        self.assertDictEqual(self.j1.cancel_collector[0].as_dict(), {'order_id': 'j1_1', 'timestamp': 10, 'type': 'cancel', 'quantity': 1, 'side': 'buy',
                                                             'price': 999985})
-        self.assertDictEqual(self.j1.quote_collector[0], self.j1._bid_quote)
+        self.assertIs(self.j1.quote_collector[0], self.j1._bid_quote)
         self.j1.process_signal(11, tob, 0.5)
-        self.assertDictEqual(self.j1._ask_quote, {'order_id': 'j1_4', 'timestamp': 11, 'type': 'add', 'quantity': 1, 'side': 'sell',
+        self.assertDictEqual(self.j1._ask_quote.as_dict(), {'order_id': 'j1_4', 'timestamp': 11, 'type': 'add', 'quantity': 1, 'side': 'sell',
                                                  'price': 1000000})
-        self.assertDictEqual(self.j1.cancel_collector[0], {'order_id': 'j1_2', 'timestamp': 11, 'type': 'cancel', 'quantity': 1, 'side': 'sell',
+        self.assertDictEqual(self.j1.cancel_collector[0].as_dict(), {'order_id': 'j1_2', 'timestamp': 11, 'type': 'cancel', 'quantity': 1, 'side': 'sell',
                                                            'price': 1000010})
-        self.assertDictEqual(self.j1.quote_collector[0],self.j1._ask_quote)
+        self.assertIs(self.j1.quote_collector[0], self.j1._ask_quote)
         # PJ not alone at the inside
         tob = {'bid_size': 5, 'best_bid': 999990, 'best_ask': 1000010, 'ask_size': 5}
-        self.j1._bid_quote = {'order_id': 'j1_1', 'timestamp': 5, 'type': 'add', 'quantity': 1, 'side': 'buy',
-                             'price': 999990}
-        self.j1._ask_quote = {'order_id': 'j1_2', 'timestamp': 6, 'type': 'add', 'quantity': 1, 'side': 'sell',
-                             'price': 1000010}
+        self.j1._bid_quote = Order.from_dict({'order_id': 'j1_1', 'timestamp': 5, 'type': 'add', 'quantity': 1, 'side': 'buy',
+                             'price': 999990})
+        self.j1._ask_quote = Order.from_dict({'order_id': 'j1_2', 'timestamp': 6, 'type': 'add', 'quantity': 1, 'side': 'sell',
+                             'price': 1000010})
         # random.seed = 1 generates random.uniform(0,1) = 0.13 then .85
         # jump the bid by 1, then jump the ask by 1; cancel old quotes
         random.seed(1)
         self.j1.process_signal(12, tob, 0.5)
-        self.assertDictEqual(self.j1._bid_quote, {'order_id': 'j1_5', 'timestamp': 12, 'type': 'add', 'quantity': 1, 'side': 'buy',
+        self.assertDictEqual(self.j1._bid_quote.as_dict(), {'order_id': 'j1_5', 'timestamp': 12, 'type': 'add', 'quantity': 1, 'side': 'buy',
                                                  'price': 999995})
-        self.assertDictEqual(self.j1.cancel_collector[0], {'order_id': 'j1_1', 'timestamp': 12, 'type': 'cancel', 'quantity': 1, 'side': 'buy',
+        self.assertDictEqual(self.j1.cancel_collector[0].as_dict(), {'order_id': 'j1_1', 'timestamp': 12, 'type': 'cancel', 'quantity': 1, 'side': 'buy',
                                                            'price': 999990})
-        self.assertDictEqual(self.j1.quote_collector[0], self.j1._bid_quote)
+        self.assertIs(self.j1.quote_collector[0], self.j1._bid_quote)
         self.j1.process_signal(13, tob, 0.5)
-        self.assertDictEqual(self.j1._ask_quote, {'order_id': 'j1_6', 'timestamp': 13, 'type': 'add', 'quantity': 1, 'side': 'sell',
+        self.assertDictEqual(self.j1._ask_quote.as_dict(), {'order_id': 'j1_6', 'timestamp': 13, 'type': 'add', 'quantity': 1, 'side': 'sell',
                                                  'price': 1000005})
-        self.assertDictEqual(self.j1.cancel_collector[0], {'order_id': 'j1_2', 'timestamp': 13, 'type': 'cancel', 'quantity': 1, 'side': 'sell',
+        self.assertDictEqual(self.j1.cancel_collector[0].as_dict(), {'order_id': 'j1_2', 'timestamp': 13, 'type': 'cancel', 'quantity': 1, 'side': 'sell',
                                                            'price': 1000010})
-        self.assertDictEqual(self.j1.quote_collector[0],self.j1._ask_quote)
+        self.assertIs(self.j1.quote_collector[0], self.j1._ask_quote)
         # spread at mpi, PJ alone at nbbo
         tob = {'bid_size': 1, 'best_bid': 999995, 'best_ask': 1000000, 'ask_size': 1}
-        self.j1._bid_quote = {'order_id': 'j1_1', 'timestamp': 5, 'type': 'add', 'quantity': 1, 'side': 'buy',
-                             'price': 999995}
-        self.j1._ask_quote = {'order_id': 'j1_2', 'timestamp': 6, 'type': 'add', 'quantity': 1, 'side': 'sell',
-                             'price': 1000000}
+        self.j1._bid_quote = Order.from_dict({'order_id': 'j1_1', 'timestamp': 5, 'type': 'add', 'quantity': 1, 'side': 'buy',
+                             'price': 999995})
+        self.j1._ask_quote = Order.from_dict({'order_id': 'j1_2', 'timestamp': 6, 'type': 'add', 'quantity': 1, 'side': 'sell',
+                             'price': 1000000})
         random.seed(1)
         self.j1.process_signal(14, tob, 0.5)
-        self.assertDictEqual(self.j1._bid_quote, {'order_id': 'j1_1', 'timestamp': 5, 'type': 'add', 'quantity': 1, 'side': 'buy',
+        self.assertDictEqual(self.j1._bid_quote.as_dict(), {'order_id': 'j1_1', 'timestamp': 5, 'type': 'add', 'quantity': 1, 'side': 'buy',
                                                  'price': 999995})
         self.assertFalse(self.j1.cancel_collector)
         self.assertFalse(self.j1.quote_collector)
         self.j1.process_signal(15, tob, 0.5)
-        self.assertDictEqual(self.j1._ask_quote, {'order_id': 'j1_2', 'timestamp': 6, 'type': 'add', 'quantity': 1, 'side': 'sell',
+        self.assertDictEqual(self.j1._ask_quote.as_dict(), {'order_id': 'j1_2', 'timestamp': 6, 'type': 'add', 'quantity': 1, 'side': 'sell',
                                                  'price': 1000000})
         self.assertFalse(self.j1.cancel_collector)
         self.assertFalse(self.j1.quote_collector)
         # PJ bid and ask behind the book
-        self.j1._bid_quote = {'order_id': 'j1_1', 'timestamp': 5, 'type': 'add', 'quantity': 1, 'side': 'buy',
-                             'price': 999990}
-        self.j1._ask_quote = {'order_id': 'j1_2', 'timestamp': 6, 'type': 'add', 'quantity': 1, 'side': 'sell',
-                             'price': 1000010}
+        self.j1._bid_quote = Order.from_dict({'order_id': 'j1_1', 'timestamp': 5, 'type': 'add', 'quantity': 1, 'side': 'buy',
+                             'price': 999990})
+        self.j1._ask_quote = Order.from_dict({'order_id': 'j1_2', 'timestamp': 6, 'type': 'add', 'quantity': 1, 'side': 'sell',
+                             'price': 1000010})
         # random.seed = 1 generates random.uniform(0,1) = 0.13 then .85
         # cancel bid and ask
         random.seed(1)
@@ -509,9 +614,9 @@ class TestTrader(unittest.TestCase):
         self.j1.process_signal(16, tob, 0.5)
         self.assertFalse(self.j1._bid_quote)
         self.assertFalse(self.j1._ask_quote)
-        self.assertDictEqual(self.j1.cancel_collector[0], {'order_id': 'j1_1', 'timestamp': 16, 'type': 'cancel', 'quantity': 1, 'side': 'buy',
+        self.assertDictEqual(self.j1.cancel_collector[0].as_dict(), {'order_id': 'j1_1', 'timestamp': 16, 'type': 'cancel', 'quantity': 1, 'side': 'buy',
                                                            'price': 999990})
-        self.assertDictEqual(self.j1.cancel_collector[1], {'order_id': 'j1_2', 'timestamp': 16, 'type': 'cancel', 'quantity': 1, 'side': 'sell',
+        self.assertDictEqual(self.j1.cancel_collector[1].as_dict(), {'order_id': 'j1_2', 'timestamp': 16, 'type': 'cancel', 'quantity': 1, 'side': 'sell',
                                                            'price': 1000010})
         self.assertFalse(self.j1.quote_collector)
         
@@ -0,0 +1,73 @@
+import numpy as np
+import unittest
+
+from pyziabm.walk import QTakeStream, bounded_walk, q_take_path
+
+
+def stepped(steps, s, lambda0, c_lambda):
+    '''Runner.make_q_take() one step at a time'''
+    noise = np.random.rand(2, steps)
+    qt_take = np.empty_like(noise)
+    qt_take[:,0] = 0.5
+    for i in range(1, steps):
+        qt_take[:,i] = qt_take[:,i-1] + (noise[:,i-1]>qt_take[:,i-1])*s - (noise[:,i-1]<qt_take[:,i-1])*s
+    lambda_t = -lambda0*(1 + (np.abs(qt_take[1] - 0.5)/np.sqrt(np.mean(np.square(qt_take[0] - 0.5))))*c_lambda)
+    return qt_take[1], lambda_t
+
+
+class TestWalk(unittest.TestCase):
+    '''
+    The chunked walk gives the same floats as stepping one draw at a time
+    '''
+
+    def test_bounded_walk(self):
+        np.random.seed(1)
+        for s in [0.0001, 0.001, 0.05]:
+            noise = np.random.rand(5000)
+            expected = []
+            q = 0.3
+            for u in noise:
+                q = q + (u > q)*s - (u < q)*s
+                expected.append(q)
+            self.assertEqual(bounded_walk(0.3, s, noise).tolist(), expected)
+        # a draw equal to q does not move it
+        self.assertEqual(bounded_walk(0.5, 0.1, np.array([0.5, 0.9, 0.0])).tolist(), [0.5, 0.6, 0.5])
+
+    def test_q_take_path(self):
+        np.random.seed(2)
+        expected = stepped(3001, 0.001, 100, 1.0)
+        after = np.random.rand()
+        np.random.seed(2)
+        q_take, lambda_t = q_take_path(3001, 0.001, 100, 1.0, chunk=700)
+        self.assertTrue(np.array_equal(q_take, expected[0]))
+        self.assertTrue(np.array_equal(lambda_t, expected[1]))
+        self.assertEqual(np.random.rand(), after)
+
+    def test_stream(self):
+        '''
+        The stream reads as the path, in chunks, and leaves the global RandomState where make_q_take() does
+        '''
+        np.random.seed(3)
+        q_take, lambda_t = q_take_path(3001, 0.001, 100, 1.0)
+        after = np.random.rand()
+        np.random.seed(3)
+        chunks = []
+        stream = QTakeStream(3001, 0.001, 100, 1.0, chunk=500, on_chunk=lambda start, q, l: chunks.append((start, len(q))))
+        self.assertEqual(np.random.rand(), after)
+        self.assertEqual(stream.q_take[0], 0.5)
+        self.assertEqual([stream.q_take[step] for step in range(20, 3001, 7)], q_take[20::7].tolist())
+        self.assertTrue(np.allclose([stream.lambda_t[step] for step in range(2990, 3001)], lambda_t[2990:]))
+        self.assertEqual(chunks, [(0, 1)] + [(start, 500) for start in range(1, 3001, 500)])
+        with self.assertRaises(IndexError):
+            stream.q_take[100]
+        with self.assertRaises(IndexError):
+            stream.lambda_t[3001]
+
+    def test_finish(self):
+        np.random.seed(4)
+        chunks = []
+        stream = QTakeStream(1001, 0.001, 100, 1.0, chunk=300, on_chunk=lambda start, q, l: chunks.append(start))
+        stream.q_take[450]
+        stream.finish()
+        self.assertEqual(chunks, [0, 1, 301, 601, 901])
+        self.assertEqual(len(stream), 1001)
@@ -0,0 +1,53 @@
+import numpy as np
+import os
+import pandas as pd
+import tempfile
+import unittest
+
+from pyziabm.buffers import ColumnBuffer
+from pyziabm.storage import append_h5
+from pyziabm.writer import H5Writer
+
+
+class TestH5Writer(unittest.TestCase):
+    '''
+    H5Writer appends ColumnBuffers and DataFrames to h5 tables on a background thread
+    '''
+
+    def setUp(self):
+        self.tempdir = tempfile.TemporaryDirectory()
+        self.h5file = os.path.join(self.tempdir.name, 'test.h5')
+        self.b1 = ColumnBuffer((('order_id', object), ('price', np.int64)), block_size=4)
+
+    def tearDown(self):
+        self.tempdir.cleanup()
+
+    def test_put_close(self):
+        '''
+        Writes land in the order queued; close() waits for them
+        '''
+        w1 = H5Writer(maxsize=1)
+        for i in range(3):
+            self.b1.append_row('t1_%d' % i, 50+i)
+            w1.put(self.h5file, 'orders', self.b1.detach(), min_itemsize={'order_id': 12})
+        w1.put(self.h5file, 'qtl', pd.DataFrame({'qt_take': [0.5, 0.6]}))
+        w1.close()
+        orders = pd.read_hdf(self.h5file, 'orders')
+        self.assertEqual(orders.order_id.tolist(), ['t1_0', 't1_1', 't1_2'])
+        self.assertEqual(orders.price.tolist(), [50, 51, 52])
+        self.assertEqual(pd.read_hdf(self.h5file, 'qtl').qt_take.tolist(), [0.5, 0.6])
+
+    def test_error(self):
+        '''
+        An error on the writer thread is raised by close()
+        '''
+        w1 = H5Writer()
+        w1.put(self.h5file, 'orders', 'not a table')
+        with self.assertRaises(AttributeError):
+            w1.close()
+
+    def test_append_h5(self):
+        self.b1.append_row('t1_1', 50)
+        append_h5(self.h5file, 'orders', self.b1)
+        append_h5(self.h5file, 'orders', self.b1)
+        self.assertEqual(len(pd.read_hdf(self.h5file, 'orders')), 2)